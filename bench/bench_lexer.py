@@ -0,0 +1,102 @@
+'''Throughput of ThingsDBLexer and keystroke latency of the prompt lexer.
+
+Tokenizes the .ti files in bench/data to measure the lexer throughput and
+simulates typing at random positions in a buffer of (by default) 2000 lines,
+measuring the time to lex the document and fetch the visible lines, for the
+incremental lexer and for prompt toolkit's PygmentsLexer as a baseline.
+
+    python bench/bench_lexer.py [--lines 2000] [--keystrokes 300]
+'''
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_toolkit.document import Document  # noqa: E402
+from prompt_toolkit.lexers import PygmentsLexer  # noqa: E402
+from thingsprompt.highlight import IncrementalLexer  # noqa: E402
+from thingsprompt.lexer import ThingsDBLexer  # noqa: E402
+
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+VISIBLE = 40  # number of lines on screen
+
+
+def sample_buffer(lines: int) -> str:
+    with open(os.path.join(DATA, 'procedures.ti'), 'r') as f:
+        sample = f.read().splitlines()
+    return '\n'.join(sample[i % len(sample)] for i in range(lines))
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def keystrokes(lexer, text: str, n: int, seed: int = 0) -> dict:
+    rnd = random.Random(seed)
+    lexer.lex_document(Document(text))  # initial paint is not a keystroke
+    timings = []
+    for _ in range(n):
+        pos = rnd.randint(0, len(text))
+        text = text[:pos] + rnd.choice('abc (){}.;=') + text[pos:]
+        doc = Document(text, pos + 1)
+        row = doc.cursor_position_row
+        top = max(0, row - VISIBLE // 2)
+
+        start = time.perf_counter()
+        get_line = lexer.lex_document(doc)
+        for lineno in range(top, min(top + VISIBLE, doc.line_count)):
+            get_line(lineno)
+        timings.append((time.perf_counter() - start) * 1000.0)
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def throughput(repeat: int = 20) -> dict:
+    text = ''
+    for fn in sorted(glob.glob(os.path.join(DATA, '*.ti'))):
+        with open(fn, 'r') as f:
+            text += f.read()
+    text *= repeat
+    lexer = ThingsDBLexer()
+
+    start = time.perf_counter()
+    tokens = sum(1 for _ in lexer.get_tokens_unprocessed(text))
+    duration = time.perf_counter() - start
+    return {
+        'benchmark': 'lexer_throughput',
+        'bytes': len(text),
+        'tokens': tokens,
+        'seconds': round(duration, 4),
+        'mb_per_s': round(len(text) / (1 << 20) / duration, 3),
+        'tokens_per_s': round(tokens / duration),
+    }
+
+
+def run(lines: int = 2000, n: int = 300) -> list:
+    text = sample_buffer(lines)
+    return [throughput(), {
+        'benchmark': 'lexer_keystroke',
+        'lines': lines,
+        'keystrokes': n,
+        'incremental': keystrokes(IncrementalLexer(), text, n),
+        'pygments': keystrokes(PygmentsLexer(ThingsDBLexer), text, n),
+    }]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=2000)
+    parser.add_argument('--keystrokes', type=int, default=300)
+    args = parser.parse_args()
+    print(json.dumps(run(args.lines, args.keystrokes), indent=4))
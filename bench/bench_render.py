@@ -0,0 +1,65 @@
+'''Rendering of large nested query results.
+
+Renders a generated result (a list of things with nested lists, dicts and
+bytes) with each of the output modes of the prompt.
+
+    python bench/bench_render.py [--things 50000]
+'''
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from thingsprompt.render import Renderer  # noqa: E402
+
+
+MODES = {
+    'pretty': {},
+    'compact': {'compact': True},
+    'unsorted': {'sort_keys': False},
+    'stream': {'stream': True},
+}
+
+
+def sample_result(things: int) -> list:
+    return [{
+        '#': i,
+        'name': f'thing {i}',
+        'age': i % 100,
+        'score': i / 7,
+        'active': i % 2 == 0,
+        'tags': ['a', 'b', str(i)],
+        'address': {'street': f'street {i}', 'zip': None},
+        'avatar': bytes(16),
+    } for i in range(things)]
+
+
+def run(things: int = 50000) -> list:
+    res = sample_result(things)
+    results = []
+    for mode, kwargs in MODES.items():
+        out = io.StringIO()
+        renderer = Renderer(**kwargs)
+        start = time.perf_counter()
+        asyncio.run(renderer.write(res, file=out))
+        duration = time.perf_counter() - start
+        size = out.tell()
+        results.append({
+            'benchmark': f'render_{mode}',
+            'things': things,
+            'bytes': size,
+            'seconds': round(duration, 4),
+            'mb_per_s': round(size / (1 << 20) / duration, 3),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--things', type=int, default=50000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.things), indent=4))
@@ -0,0 +1,60 @@
+'''Start-up time of the client.
+
+Measures the wall time of `things-prompt --version` (parsing arguments and
+importing the modules) and of `things-prompt diff` with two small export
+files (a sub-command which imports asyncio and its own modules but does not
+need a node), each in a new process.
+
+    python bench/bench_startup.py [--repeat 10]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import msgpack
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _measure(name: str, argv: list, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, '-m', 'thingsprompt', *argv],
+            cwd=ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return {
+        'benchmark': name,
+        'repeat': repeat,
+        'median_ms': round(statistics.median(timings) * 1000, 1),
+        'min_ms': round(min(timings) * 1000, 1),
+    }
+
+
+def run(repeat: int = 10) -> list:
+    with tempfile.TemporaryDirectory() as tmp:
+        left = os.path.join(tmp, 'left.mp')
+        right = os.path.join(tmp, 'right.mp')
+        with open(left, 'wb') as f:
+            f.write(msgpack.packb({'name': 'left', 'items': [1, 2, 3]}))
+        with open(right, 'wb') as f:
+            f.write(msgpack.packb({'name': 'right', 'items': [1, 2, 3]}))
+        return [
+            _measure('startup_version', ['--version'], repeat),
+            _measure('startup_diff', ['diff', left, right], repeat),
+        ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(run(args.repeat), indent=4))
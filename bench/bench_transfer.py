@@ -0,0 +1,120 @@
+'''Export and import throughput and peak memory.
+
+Starts the stand-in server (bench/standin.py) and runs the export and import
+sub-commands of the client as separate processes, so the peak memory (max
+RSS) of each run can be measured. A run only counts when it did the work:
+the export file must have the size of the dump and the import must report
+to be done, otherwise the benchmark fails.
+
+    python bench/bench_transfer.py [--dump-size 104857600]
+'''
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_listening(port: int, timeout: float = 10.0):
+    end = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.2).close()
+            return
+        except OSError:
+            if time.monotonic() > end:
+                raise
+            time.sleep(0.05)
+
+
+def run_client(*args) -> tuple:
+    """Returns the measurements and the output of the client."""
+    with tempfile.TemporaryFile() as out:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'thingsprompt', *args],
+            cwd=ROOT,
+            stdout=out)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        duration = time.perf_counter() - start
+        out.seek(0)
+        output = out.read().decode(errors='replace').strip()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise RuntimeError(
+            f'client exited with {proc.returncode}: {output}')
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        'seconds': round(duration, 4),
+        'max_rss_mb': round(rusage.ru_maxrss / 1024, 1),
+    }, output
+
+
+def check_export(fn: str, dump_size: int, output: str):
+    # the stand-in returns a bin 32 header followed by the payload
+    expected = dump_size + 5
+    try:
+        size = os.path.getsize(fn)
+    except OSError:
+        raise RuntimeError(f'export wrote no file: {output}')
+    if size != expected:
+        raise RuntimeError(
+            f'export wrote {size} bytes, expected {expected}: {output}')
+
+
+def check_import(output: str):
+    if not output.startswith('imported '):
+        raise RuntimeError(f'import failed: {output}')
+
+
+def run(dump_size: int = 100 << 20) -> list:
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, os.path.join(BENCH, 'standin.py'),
+        '--port', str(port),
+        '--dump-size', str(dump_size)])
+    results = []
+    try:
+        wait_listening(port)
+        conn = ['--node', '127.0.0.1', '--port', str(port), '--token', 'x']
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = os.path.join(tmp, 'dump.mp')
+            for name, args in (
+                    ('export', [*conn, '-s', '//stuff', 'export', fn]),
+                    ('import', [*conn, '-s', '//clone', 'import', fn])):
+                res, output = run_client(*args)
+                if name == 'export':
+                    check_export(fn, dump_size, output)
+                else:
+                    check_import(output)
+                res.update({
+                    'benchmark': name,
+                    'bytes': dump_size,
+                    'mb_per_s': round(
+                        dump_size / (1 << 20) / res['seconds'], 3),
+                })
+                results.append(res)
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dump-size', type=int, default=100 << 20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.dump_size), indent=4))
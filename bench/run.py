@@ -0,0 +1,59 @@
+'''Run all benchmarks and write the results as JSON.
+
+    python bench/run.py [--quick] [--output results.json]
+
+Use `--quick` for a smaller (and less accurate) run.
+'''
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench_lexer  # noqa: E402
+import bench_render  # noqa: E402
+import bench_startup  # noqa: E402
+import bench_transfer  # noqa: E402
+from thingsprompt.thingsprompt import __version__  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quick', action='store_true')
+    parser.add_argument('--output', help='write to file instead of stdout')
+    args = parser.parse_args()
+
+    if args.quick:
+        results = [
+            *bench_lexer.run(lines=2000, n=50),
+            *bench_render.run(things=5000),
+            *bench_transfer.run(dump_size=10 << 20),
+            *bench_startup.run(repeat=3),
+        ]
+    else:
+        results = [
+            *bench_lexer.run(),
+            *bench_render.run(),
+            *bench_transfer.run(),
+            *bench_startup.run(),
+        ]
+
+    out = json.dumps({
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'results': results,
+    }, indent=4)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+    else:
+        print(out)
+
+
+if __name__ == '__main__':
+    main()
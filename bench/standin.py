@@ -0,0 +1,131 @@
+'''Local stand-in for a ThingsDB node, used by the benchmarks.
+
+Speaks enough of the ThingsDB client protocol to authenticate and to answer
+the queries used by export and import; an export returns a MessagePack
+payload of `--dump-size` bytes. This is not a ThingsDB implementation, the
+goal is to measure the client side only. Any other query fails, so keep the
+stand-in in step with the queries sent by export and import.
+
+    python bench/standin.py [--port 9299] [--dump-size 104857600]
+'''
+import argparse
+import asyncio
+import struct
+import msgpack
+
+
+HEADER = struct.Struct('<IHBB')
+
+REQ_PING = 0x20
+REQ_AUTH = 0x21
+REQ_QUERY = 0x22
+REQ_RUN = 0x25
+RES_PING = 0x10
+RES_OK = 0x11
+RES_DATA = 0x12
+RES_ERROR = 0x13
+
+EX_LOOKUP_ERROR = -54
+EX_VALUE_ERROR = -58
+
+VERSION = 'v1.0.0-standin'
+
+
+class StandIn:
+
+    def __init__(self, dump_size: int):
+        # a bin 32 header followed by the payload; looks like a dump
+        self.dump = b'\xc6' + struct.pack('>I', dump_size) + \
+            bytes(dump_size)
+        self.collections = {'stuff'}
+
+    def query(self, scope: str, code: str, kwargs: dict):
+        if 'export(' in code:
+            if kwargs.get('dump', True):
+                return RES_DATA, self.dump
+            return RES_DATA, 'new_type("T");'
+        if 'import(' in code:
+            data = kwargs.get('data')
+            if data != self.dump:
+                return RES_ERROR, {
+                    'error_code': EX_VALUE_ERROR,
+                    'error_msg': 'import data does not match the export'}
+            return RES_DATA, None
+        if 'node_info' in code and scope.startswith('@n'):
+            return RES_DATA, {'version': VERSION}
+        if 'has_collection' in code:
+            return RES_DATA, kwargs.get('name') in self.collections
+        if 'new_collection' in code:
+            self.collections.add(kwargs.get('name'))
+            return RES_DATA, kwargs.get('name')
+        if 'collections_info' in code:
+            return RES_DATA, [
+                {'name': name, 'collection_id': i}
+                for i, name in enumerate(sorted(self.collections))]
+        if code.strip().rstrip(';') in ('nil', ''):
+            return RES_DATA, None
+        return RES_ERROR, {
+            'error_code': EX_LOOKUP_ERROR,
+            'error_msg': f'not supported by the stand-in server: {code!r}'}
+
+    def handle(self, tp: int, data):
+        if tp == REQ_PING:
+            return RES_PING, None
+        if tp == REQ_AUTH:
+            return RES_OK, None
+        if tp == REQ_QUERY:
+            kwargs = data[2] if len(data) > 2 else {}
+            return self.query(data[0], data[1], kwargs)
+        if tp == REQ_RUN:
+            return RES_DATA, None
+        return RES_ERROR, {
+            'error_code': EX_LOOKUP_ERROR,
+            'error_msg': f'unsupported package type: {tp}'}
+
+
+class Protocol(asyncio.Protocol):
+
+    def __init__(self, standin: StandIn):
+        self.standin = standin
+        self.buf = bytearray()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data: bytes):
+        self.buf.extend(data)
+        while len(self.buf) >= HEADER.size:
+            length, pid, tp, _ = HEADER.unpack_from(self.buf)
+            total = HEADER.size + length
+            if len(self.buf) < total:
+                return
+            body = msgpack.unpackb(self.buf[HEADER.size:total], raw=False) \
+                if length else None
+            del self.buf[:total]
+            self.send(pid, *self.standin.handle(tp, body))
+
+    def send(self, pid: int, tp: int, data):
+        body = b'' if data is None else msgpack.packb(data, use_bin_type=True)
+        self.transport.write(HEADER.pack(len(body), pid, tp, tp ^ 0xff))
+        self.transport.write(body)
+
+
+async def serve(port: int, dump_size: int):
+    standin = StandIn(dump_size)
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(
+        lambda: Protocol(standin), '127.0.0.1', port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=9299)
+    parser.add_argument('--dump-size', type=int, default=100 << 20)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.port, args.dump_size))
+    except KeyboardInterrupt:
+        pass
@@ -56,5 +56,8 @@ setup(
         'prompt-toolkit',
         'pygments',
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     keywords='database connector prompt thingsdb',
 )
@@ -0,0 +1,66 @@
+import pytest
+from thingsprompt.cache import ResultCache, is_read_only, normalize
+
+
+@pytest.mark.parametrize('query', [
+    '.len();',
+    '.people.filter(|p| p.age > 18).map(|p| p.name);',
+    'collection_info();',
+    '@n node_info();',
+    'x == 2;',
+    '.a >= 1 && .b <= 2 && .c != 3;',
+    'type_info("Person");',
+    '[1, 2, 3].len();',
+])
+def test_read_only(query):
+    assert is_read_only(query)
+
+
+@pytest.mark.parametrize('query', [
+    '.x = 1;',
+    '.list.push(1);',
+    '.list.add(1);',
+    'new_type("Person");',
+    'set_type("Person", {});',
+    'del_collection("stuff");',
+    'now();',
+    'rand();',
+    'my_procedure();',
+    '.person.greet();',
+    'run("p", 1);',
+    '"push";',  # errs on the safe side
+    'x = 1;',
+])
+def test_not_read_only(query):
+    assert not is_read_only(query)
+
+
+def test_normalize():
+    assert normalize('  .len( ) ;; ') == '.len()'
+    assert normalize('return  1;') == 'return 1'
+    assert normalize('"a  b" ;') == '"a  b"'
+
+
+def test_cache():
+    cache = ResultCache(enabled=True, max_size=10)
+    assert cache.get('@:stuff', '.len();') is None
+    cache.put('@:stuff', '.len();', '42')
+    assert cache.get('@:stuff', ' .len( ) ') == '42'
+    assert cache.get('@:other', '.len();') is None
+
+    cache.put('@:stuff', '.a;', 'x' * 9)
+    assert cache.get('@:stuff', '.len();') is None  # evicted
+    assert cache.evictions == 1
+    cache.put('@:stuff', '.b;', 'x' * 11)  # too large
+    assert cache.get('@:stuff', '.b;') is None
+
+    cache.invalidate()
+    assert cache.get('@:stuff', '.a;') is None
+    assert cache.size == 0
+
+
+def test_ttl():
+    cache = ResultCache(enabled=True, ttl=-1)
+    cache.put('@:stuff', '.len();', '42')
+    assert cache.get('@:stuff', '.len();') is None
+    assert cache.size == 0
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import os
+from thingsprompt.daemon import Daemon, DaemonClient, _pool_key
+from thingsprompt.reconnect import ConnectionLost
+from thingsprompt.transfer import _import
+
+
+ARGS = argparse.Namespace(
+    node='localhost', port=9200, ssl=False, timeout=None, keepalive=0,
+    scope='@thingsdb')
+AUTH = ['admin', 'pass']
+
+
+class Pool:
+    """Instead of connections to ThingsDB; the first import fails with a lost
+    connection."""
+
+    def __init__(self):
+        self.queries = []
+
+    async def query(self, msg: dict):
+        self.queries.append(msg['code'].strip())
+        if msg['code'].startswith('import'):
+            if len(self.queries) == 1:
+                raise ConnectionLost('connection lost')
+            return None
+        return True  # the collection is empty
+
+    def status(self):
+        return {}
+
+    async def close(self):
+        pass
+
+
+async def _start(fn: str):
+    daemon = Daemon(fn=fn, idle_timeout=0)
+    task = asyncio.ensure_future(daemon.run())
+    while not os.path.exists(fn):
+        assert not task.done()
+        await asyncio.sleep(0.01)
+    return daemon, task
+
+
+def test_start_status_stop(tmp_path):
+    fn = str(tmp_path / 'daemon.sock')
+
+    async def main():
+        daemon, task = await _start(fn)
+
+        # a second daemon with the same socket does not start
+        assert await Daemon(fn=fn, idle_timeout=0).run() is False
+
+        client = DaemonClient(argparse.Namespace(scope=None), [], fn=fn)
+        await client.connect(start=False)
+        status = await client.status()
+        assert status['pid'] == os.getpid()
+        assert status['clients'] == 1
+        assert status['pools'] == []
+        await client.stop()
+        client.close()
+        await client.wait_closed()
+        return await task
+
+    assert asyncio.run(main()) is True
+    assert not os.path.exists(fn)
+
+
+def test_import_is_retried_when_the_collection_is_empty(tmp_path):
+    fn = str(tmp_path / 'daemon.sock')
+    pool = Pool()
+
+    async def main():
+        daemon, task = await _start(fn)
+        daemon.pools[_pool_key({
+            'node': ARGS.node,
+            'port': ARGS.port,
+            'ssl': ARGS.ssl,
+            'auth': AUTH})] = pool
+        client = DaemonClient(ARGS, AUTH, fn=fn)
+        await client.connect()
+        try:
+            await _import(client, b'\x80', 'stuff', False)
+        finally:
+            await client.stop()
+            client.close()
+            await client.wait_closed()
+        await task
+
+    asyncio.run(main())
+    assert len(pool.queries) == 3
+    assert pool.queries[0].startswith('import')
+    assert pool.queries[2].startswith('import')
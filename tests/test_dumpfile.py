@@ -0,0 +1,83 @@
+import os
+import msgpack
+import pytest
+from thingsprompt.dumpfile import DumpReader, DumpWriter
+from thingsprompt.manifest import BlockHasher, read_manifest, verify, \
+    write_manifest
+
+
+DATA = msgpack.packb({
+    'things': [{'#': i, 'name': f'thing {i}'} for i in range(20000)],
+    'blob': os.urandom(1 << 16),
+})
+
+
+def _write(fn, compression=None, hasher=None):
+    with DumpWriter(fn, compression=compression, hasher=hasher) as writer:
+        for pos in range(0, len(DATA), 10000):
+            writer.write(DATA[pos:pos + 10000])
+    assert writer.size == len(DATA)
+    assert writer.file_size == os.path.getsize(fn)
+    assert not os.path.exists(f'{fn}.partial')
+    return writer
+
+
+def _read(fn, compression=None):
+    with DumpReader(fn, chunk_size=4096) as dump:
+        assert dump.compression == compression
+        if dump.compression:
+            dump.decompress()
+        assert dump.compression is None
+        assert dump.is_msgpack()
+        return bytes(dump.view)
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'zstd'])
+def test_round_trip(tmp_path, compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    fn = str(tmp_path / 'stuff.mp')
+    writer = _write(fn, compression)
+    if compression:
+        assert writer.file_size < writer.size
+    assert _read(fn, compression) == DATA
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_manifest(tmp_path, compression):
+    fn = str(tmp_path / 'stuff.mp')
+    hasher = BlockHasher(block_size=1 << 12)
+    _write(fn, compression, hasher)
+    write_manifest(fn, hasher, collection='stuff')
+    manifest = read_manifest(fn)
+    assert manifest['collection'] == 'stuff'
+
+    # the manifest is for the file as written, so before decompressing
+    with DumpReader(fn) as dump:
+        verify(fn, dump.view, manifest)
+
+    with open(fn, 'r+b') as f:
+        f.seek(5000)
+        c = f.read(1)
+        f.seek(5000)
+        f.write(bytes([c[0] ^ 1]))
+    with DumpReader(fn) as dump:
+        with pytest.raises(ValueError, match='block 1 '):
+            verify(fn, dump.view, manifest)
+
+
+def test_failed_write(tmp_path):
+    fn = str(tmp_path / 'stuff.mp.gz')
+    with pytest.raises(RuntimeError):
+        with DumpWriter(fn, compression='gzip') as writer:
+            writer.write(DATA)
+            raise RuntimeError('export failed')
+    assert os.listdir(tmp_path) == []
+
+
+def test_empty(tmp_path):
+    fn = str(tmp_path / 'stuff.mp')
+    open(fn, 'wb').close()
+    with pytest.raises(ValueError, match='is empty'):
+        with DumpReader(fn):
+            pass
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import os
+import pytest
+from thingsprompt.extract import PAGE_QUERY, export_things
+
+
+class FakeClient:
+    """Answers the queries of export_things(); things with an Id which is a
+    multiple of 3 are of type `P`, the others are in another collection."""
+
+    def __init__(self, info: dict):
+        self.info = info
+        self.pages = []
+
+    async def query(self, code, scope=None, retry=False, **kwargs):
+        if code.startswith('collection_info'):
+            assert scope == '@thingsdb' and kwargs['name'] == 'stuff'
+            return self.info
+        if code.startswith('types_info'):
+            return [{'name': 'P', 'fields': [['name', 'str'], ['n', 'int']]}]
+        assert code == PAGE_QUERY and scope == '//stuff' and retry
+        lo, hi = kwargs['lo'], kwargs['hi']
+        self.pages.append((lo, hi))
+        await asyncio.sleep(0)
+        return [
+            ['P', {'#': i, 'name': f'p{i}', 'n': i}]
+            for i in range(lo, hi) if i % 3 == 0]
+
+
+def _export(client, fn, fmt):
+    return asyncio.run(export_things(
+        client, fn, 'stuff', fmt, page_size=4, in_flight=3))
+
+
+def test_ndjson(tmp_path):
+    client = FakeClient({'name': 'stuff', 'next_free_id': 25})
+    fn = os.path.join(tmp_path, 'stuff.ndjson')
+    writer = _export(client, fn, 'ndjson')
+    with open(fn) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line['thing']['#'] for line in lines] == list(range(0, 25, 3))
+    assert lines[1] == {'type': 'P', 'thing': {'#': 3, 'name': 'p3', 'n': 3}}
+    assert writer.count == 9
+    # all Ids up to next_free_id, in pages of page_size
+    assert sorted(client.pages) == [
+        (lo, min(lo + 4, 25)) for lo in range(0, 25, 4)]
+
+
+def test_columns(tmp_path):
+    client = FakeClient({'name': 'stuff', 'next_free_id': 10})
+    directory = os.path.join(tmp_path, 'stuff')
+    _export(client, directory, 'columns')
+    with open(os.path.join(directory, 'P.ndjson')) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [
+        {'#': [0, 3], 'name': ['p0', 'p3'], 'n': [0, 3]},
+        {'#': [6], 'name': ['p6'], 'n': [6]},
+        {'#': [9], 'name': ['p9'], 'n': [9]},
+    ]
+
+
+def test_no_next_free_id(tmp_path):
+    client = FakeClient({'name': 'stuff'})
+    with pytest.raises(ValueError):
+        _export(client, os.path.join(tmp_path, 'x.ndjson'), 'ndjson')
@@ -0,0 +1,30 @@
+import pytest
+from thingsprompt.fanout import parse_node, read_nodes_file
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('host', ('host', 9200)),
+    (' host ', ('host', 9200)),
+    ('host:9201', ('host', 9201)),
+    ('10.0.0.1:9202', ('10.0.0.1', 9202)),
+    ('[::1]:9203', ('::1', 9203)),
+    ('[::1]', ('::1', 9200)),
+    ('::1', ('::1', 9200)),
+    ('wss://host', ('wss://host', 9200)),
+    ('ws://host', ('ws://host', 9200)),
+    ('wss://host:9270', ('wss://host:9270', 9200)),
+])
+def test_parse_node(spec, expected):
+    assert parse_node(spec, 9200) == expected
+
+
+def test_parse_node_invalid_port():
+    with pytest.raises(ValueError):
+        parse_node('host:abc', 9200)
+
+
+def test_read_nodes_file(tmp_path):
+    fn = tmp_path / 'nodes'
+    fn.write_text('# nodes\nnode1\nnode2:9300  # second\n\nwss://node3\n')
+    assert read_nodes_file(str(fn), 9200) == [
+        ('node1', 9200), ('node2', 9300), ('wss://node3', 9200)]
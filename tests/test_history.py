@@ -0,0 +1,92 @@
+from thingsprompt.history import HistoryStore
+
+
+def _store(tmp_path, **kwargs):
+    return HistoryStore(
+        str(tmp_path / 'history.jsonl'), scope=lambda: '@thingsdb', **kwargs)
+
+
+def test_scope_the_query_ran_in(tmp_path):
+    store = _store(tmp_path)
+    store.store_string('@:stuff .x;')
+    store.finish(0.1, '@:stuff')
+    store.store_string('@ //stuff')
+    store.finish(0.0, '//stuff')
+    store.store_string('\\history')
+    store.finish(0.0)
+
+    assert [e.query for e in store.search(scope='@collection:stuff')] == [
+        '@ //stuff', '@:stuff .x;']
+    assert [e.scope for e in store.search(scope='@thingsdb')] == [
+        '@thingsdb']
+
+    # the scope is stored in the file
+    store = _store(tmp_path)
+    list(store.load_history_strings())
+    assert [e.scope for e in store.index.entries] == [
+        '@:stuff', '//stuff', '@thingsdb']
+
+
+def _add(store, n, scope='@:stuff'):
+    for i in range(n):
+        store.store_string(f'.query_{i};')
+        store.finish(0.001, scope)
+
+
+def test_search(tmp_path):
+    store = _store(tmp_path)
+    _add(store, 50)
+    store.store_string('.other_query;')
+    store.finish(0.001, '//other')
+
+    found = store.search('query_1')
+    assert [e.query for e in found] == [
+        f'.query_{i};' for i in (19, 18, 17, 16, 15, 14, 13, 12, 11, 10, 1)]
+    assert len(store.search('query', limit=5)) == 5
+    assert store.search('query_49', scope='@:other') == []
+    assert [e.query for e in store.search('', scope='@:other')] == [
+        '.other_query;']
+    # a text shorter than a trigram
+    assert len(store.search('9', scope='//stuff')) == 5
+    assert [e.query for e in store.search('.query_4', prefix=True)][:2] == [
+        '.query_49;', '.query_48;']
+    assert store.search('query_4', prefix=True) == []
+
+
+def test_compaction(tmp_path):
+    store = _store(tmp_path, max_entries=10)
+    _add(store, 25)
+    fn = tmp_path / 'history.jsonl'
+    assert len(fn.read_text().splitlines()) == 25
+
+    # only the last entries are read, and the file which has grown to more
+    # than twice their size is compacted
+    store = _store(tmp_path, max_entries=10)
+    queries = list(store.load_history_strings())
+    assert queries == [f'.query_{i};' for i in range(24, 14, -1)]
+    assert len(fn.read_text().splitlines()) == 10
+
+    # not compacted when it is not twice the size
+    _add(store, 5)
+    store = _store(tmp_path, max_entries=10)
+    assert len(list(store.load_history_strings())) == 10
+    assert len(fn.read_text().splitlines()) == 15
+
+
+def test_incomplete_line(tmp_path):
+    store = _store(tmp_path)
+    _add(store, 3)
+    with open(tmp_path / 'history.jsonl', 'a') as f:
+        f.write('{"ts":1,"query":')
+    store = _store(tmp_path)
+    assert len(list(store.load_history_strings())) == 3
+
+
+def test_legacy_history(tmp_path):
+    legacy = tmp_path / 'history'
+    legacy.write_text(
+        '\n# 2020-01-01 12:00:00.000000\n+.a;\n'
+        '\n# 2020-01-02 12:00:00.000000\n+.b = 1;\n+.c;\n')
+    store = _store(tmp_path, legacy_fn=str(legacy))
+    assert list(store.load_history_strings()) == ['.b = 1;\n.c;', '.a;']
+    assert store.index.entries[0].scope is None
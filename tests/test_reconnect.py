@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+from thingsprompt.reconnect import ReconnectClient
+
+
+class Client(ReconnectClient):
+
+    def __init__(self, connected=True, **kwargs):
+        super().__init__(keepalive=0, **kwargs)
+        self.connected = connected
+        self.attempts = 0
+
+    def is_connected(self):
+        return self.connected
+
+    async def not_sent(self):
+        self.attempts += 1
+        raise ConnectionError('not sent')
+
+
+def test_not_sent_is_retried_a_limited_number_of_times():
+    client = Client(retries=2)
+    with pytest.raises(ConnectionError):
+        asyncio.run(client._request(client.not_sent, None, False))
+    assert client.attempts == 3
+    assert client.pending == 0
+
+
+def test_wait_for_a_down_node_is_bounded():
+    client = Client(connected=False)
+    client._pool = ['localhost']
+    client._reconnect = True
+    client.reconnect = lambda: None
+    with pytest.raises(ConnectionError):
+        asyncio.run(asyncio.wait_for(
+            client.query('1;', wait=0.2), timeout=5))
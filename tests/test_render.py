@@ -0,0 +1,78 @@
+import asyncio
+import io
+import json
+import pytest
+from thingsprompt.render import Renderer
+
+
+RES = {'name': 'stuff', 'data': b'\x00\x01', 'items': list(range(3000))}
+
+
+def _write(renderer, res=RES, collect=False):
+    f = io.StringIO()
+    out = asyncio.run(renderer.write(res, file=f, collect=collect))
+    return f.getvalue(), out
+
+
+@pytest.mark.parametrize('stream', [False, True])
+@pytest.mark.parametrize('compact', [False, True])
+def test_no_truncation(stream, compact):
+    renderer = Renderer(compact=compact, stream=stream)
+    text, out = _write(renderer, collect=True)
+    assert text == out + '\n'
+    assert json.loads(out) == {**RES, 'data': 'AAE='}
+    # stream mode writes the same output
+    assert text == _write(Renderer(compact=compact, stream=not stream))[0]
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_truncation(stream):
+    renderer = Renderer(compact=True, stream=stream, max_size=100)
+    text, out = _write(renderer, collect=True)
+    assert text == out + '\n'
+    full = Renderer(compact=True).render(RES)
+    head, _, note = out.partition('\n')
+    assert head == full[:100]
+    assert note.startswith('... output truncated at 100')
+    assert '--max-output 0' in note
+    if not stream:
+        # the total size is only known without streaming
+        assert f'of {len(full)} characters' in note
+
+
+def test_small_output_is_not_truncated():
+    renderer = Renderer(compact=True, stream=True, max_size=100)
+    assert _write(renderer, [1, 2, 3])[0] == '[1,2,3]\n'
+
+
+def test_stream_yields_to_the_loop(monkeypatch):
+    monkeypatch.setattr(Renderer, 'STREAM_YIELD', 10)
+    renderer = Renderer(stream=True)
+    ticks = 0
+
+    async def main():
+        nonlocal ticks
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.ensure_future(tick())
+        await asyncio.sleep(0)
+        ticks = 0
+        await renderer.write(RES, file=io.StringIO())
+        task.cancel()
+
+    asyncio.run(main())
+    assert ticks >= 100
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_write_text(monkeypatch, stream):
+    monkeypatch.setattr(Renderer, 'TEXT_CHUNK', 7)
+    text = 'x' * 100
+    f = io.StringIO()
+    asyncio.run(Renderer(stream=stream).write_text(text, file=f))
+    assert f.getvalue() == text + '\n'
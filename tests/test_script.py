@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from thingsprompt.script import do_run, split_statements
+
+
+def _split(code):
+    return list(split_statements(code))
+
+
+def test_statements():
+    assert _split('.a = 1;\n.b = 2;\n\n.c') == [
+        (1, '.a = 1;'), (2, '.b = 2;'), (4, '.c')]
+
+
+def test_empty():
+    assert _split('') == []
+    assert _split('  \n// only a comment\n/* and\nanother */\n') == []
+
+
+@pytest.mark.parametrize('code', [
+    "'a;b';",
+    '"a;b";',
+    '`a;{b};c`;',
+    "'it''s; fine';",
+    '"a /* b */ // c";',
+])
+def test_strings(code):
+    assert _split(code + '\n.x;') == [(1, code), (2, '.x;')]
+
+
+def test_multiline_string():
+    assert _split("'a\n;b';\n.x;") == [(1, "'a\n;b';"), (3, '.x;')]
+
+
+def test_comments():
+    code = (
+        '// a; comment\n'
+        '.a = 1;  // another; comment\n'
+        '/* a; /* nested; */ comment\n'
+        '*/\n'
+        '.b = 2;\n')
+    assert _split(code) == [(2, '.a = 1;'), (5, '.b = 2;')]
+
+
+def test_nested_blocks():
+    code = (
+        'if (true) {\n'
+        '    .a = 1;\n'
+        '    .b = [1, 2].map(|x| {x; x * 2;});\n'
+        '};\n'
+        'new_procedure("p", |x| {\n'
+        '    x + 1;\n'
+        '});\n')
+    stmts = _split(code)
+    assert [line for line, _ in stmts] == [1, 5]
+    assert stmts[0][1].endswith('};')
+    assert stmts[1][1].startswith('new_procedure')
+
+
+def test_regex_and_division():
+    assert _split('.r = /a;b/i;\n.x = 4 / 2; .y;') == [
+        (1, '.r = /a;b/i;'), (2, '.x = 4 / 2;'), (2, '.y;')]
+
+
+def test_scope():
+    assert _split('@:stuff .a;\n@n node_info();') == [
+        (1, '@:stuff .a;'), (2, '@n node_info();')]
+
+
+class Client:
+
+    def __init__(self):
+        self.data = {}
+        self.order = []
+
+    async def query(self, query, scope=None, timeout=None):
+        self.order.append(query)
+        name, _, value = query.rstrip(';').partition('=')
+        await asyncio.sleep(0.01 if value else 0)
+        if value:
+            self.data[name.strip()] = int(value)
+            return None
+        return self.data[name.strip()]
+
+
+def test_run_in_order(capsys):
+    client = Client()
+    failed = asyncio.run(do_run(client, '.a = 1;\n.a;\n.a = 2;\n.a;', 1, None))
+    assert failed == 0
+    assert capsys.readouterr().out.splitlines() == [
+        '{"line":1,"result":null}',
+        '{"line":2,"result":1}',
+        '{"line":3,"result":null}',
+        '{"line":4,"result":2}',
+    ]
@@ -0,0 +1,41 @@
+import asyncio
+import os
+from thingsprompt import transfer
+
+
+def _bulk_import_jobs(monkeypatch, directory, patterns='all'):
+    found = []
+
+    async def run_jobs(new_client, client, jobs, func, concurrency, start):
+        found.extend(jobs)
+        return 0
+
+    monkeypatch.setattr(transfer, '_run_jobs', run_jobs)
+    asyncio.run(transfer.do_bulk_import(
+        None, None, str(directory), patterns, False, 1))
+    return [(name, os.path.basename(fn)) for name, fn in found]
+
+
+def test_bulk_import_prefers_msgpack(tmp_path, monkeypatch, capsys):
+    for fn in (
+            'stuff.ti', 'stuff.mp.zst', 'stuff.mp', 'stuff.mp.gz',
+            'other.ti.gz', 'other.ti', 'more.mp.zst', 'more.mp.gz',
+            'notes.txt', 'stuff.mp.manifest.json'):
+        (tmp_path / fn).write_bytes(b'')
+
+    assert _bulk_import_jobs(monkeypatch, tmp_path) == [
+        ('more', 'more.mp.gz'),
+        ('other', 'other.ti'),
+        ('stuff', 'stuff.mp'),
+    ]
+    out = capsys.readouterr().out
+    for fn in ('stuff.ti', 'stuff.mp.gz', 'stuff.mp.zst', 'other.ti.gz',
+               'more.mp.zst'):
+        assert f'ignoring {fn},' in out
+
+
+def test_bulk_import_patterns(tmp_path, monkeypatch):
+    for fn in ('stuff.mp', 'stuff2.mp', 'other.mp'):
+        (tmp_path / fn).write_bytes(b'')
+    assert _bulk_import_jobs(monkeypatch, tmp_path, 'stuff*') == [
+        ('stuff', 'stuff.mp'), ('stuff2', 'stuff2.mp')]
@@ -0,0 +1,102 @@
+import random
+import msgpack
+import pytest
+from thingsprompt.diff import diff
+from thingsprompt.treediff import tree_diff
+
+
+def _changes(old, new) -> list:
+    return list(tree_diff(
+        msgpack.packb(old, use_bin_type=True),
+        msgpack.packb(new, use_bin_type=True)))
+
+
+def _random_value(rnd, depth=0):
+    choice = rnd.randrange(8 if depth < 2 else 4)
+    if choice == 0:
+        return rnd.randrange(-100, 100)
+    if choice == 1:
+        return rnd.choice(['a', 'b', 'abc', ''])
+    if choice == 2:
+        return rnd.choice([1.5, True, False, None])
+    if choice == 3:
+        return rnd.randrange(1000)
+    if choice < 6:
+        return [
+            _random_value(rnd, depth + 1) for _ in range(rnd.randrange(12))]
+    return {
+        f'k{rnd.randrange(50)}': _random_value(rnd, depth + 1)
+        for _ in range(rnd.randrange(12))}
+
+
+def _mutate(rnd, value):
+    if isinstance(value, list) and value and rnd.random() < 0.8:
+        value = list(value)
+        idx = rnd.randrange(len(value))
+        value[idx] = _mutate(rnd, value[idx])
+        return value
+    if isinstance(value, dict) and value and rnd.random() < 0.8:
+        value = dict(value)
+        key = rnd.choice(list(value))
+        value[key] = _mutate(rnd, value[key])
+        return value
+    return _random_value(rnd)
+
+
+def test_equal():
+    value = {'items': list(range(5000)), 'name': 'stuff'}
+    assert _changes(value, value) == []
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_swapped_items(seed):
+    rnd = random.Random(seed)
+    old = [f'item-{i}' for i in range(5000)]
+    new = list(old)
+    idx = rnd.randrange(len(old) - 1)
+    new[idx], new[idx + 1] = new[idx + 1], new[idx]
+    assert _changes(old, new) == [
+        ((idx,), 'changed', old[idx], new[idx]),
+        ((idx + 1,), 'changed', old[idx + 1], new[idx + 1])]
+
+
+def test_permuted_items():
+    rnd = random.Random(1)
+    old = list(range(5000))
+    for _ in range(20):
+        new = list(old)
+        start = rnd.randrange(len(old) - 100)
+        part = new[start:start + 100]
+        rnd.shuffle(part)
+        new[start:start + 100] = part
+        assert _changes(old, new) == list(diff(old, new))
+
+
+def test_large_map():
+    old = {f'key{i}': i for i in range(5000)}
+    new = dict(old)
+    new['key1'], new['key2'] = old['key2'], old['key1']
+    del new['key3']
+    new['extra'] = True
+    assert sorted(_changes(old, new), key=repr) == \
+        sorted(diff(old, new), key=repr)
+
+
+def test_type_change():
+    old = {'items': [1] * 5000}
+    new = {'items': [1] * 4999 + [True]}
+    assert _changes(old, new) == [(('items', 4999), 'changed', 1, True)]
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_same_as_diff(seed):
+    # differential test against diff() on the decoded values
+    rnd = random.Random(seed)
+    old = {f't{i}': _random_value(rnd) for i in range(200)}
+    old['list'] = [_random_value(rnd) for _ in range(2000)]
+    new = old
+    for _ in range(rnd.randrange(1, 5)):
+        new = _mutate(rnd, new)
+    key = repr
+    assert sorted(_changes(old, new), key=key) == \
+        sorted(diff(old, new), key=key)
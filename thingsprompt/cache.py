@@ -0,0 +1,147 @@
+'''Client side cache for the rendered output of read-only queries.'''
+import collections
+import re
+import time
+from .lexer import FUNCTIONS, KEYWORDS, METHODS
+
+
+IDENTIFIER = re.compile(r'[A-Za-z_][0-9A-Za-z_]*')
+CALL = re.compile(r'(\.)?\s*([A-Za-z_][0-9A-Za-z_]*)\s*\(')
+
+# an assignment, but not ==, !=, <=, >= or =>
+ASSIGN = re.compile(r'(?<![=!<>])=(?![=>])')
+
+# functions and methods which (might) change data, have side effects or
+# return a different result each time they are called
+UNCACHEABLE = frozenset((
+    'add', 'again_at', 'again_in', 'assign', 'backup', 'call', 'cancel',
+    'change_id', 'choice', 'clear', 'del', 'emit', 'extend',
+    'extend_unique', 'fill', 'future', 'grant', 'import', 'export', 'now',
+    'pop', 'push', 'rand', 'randint', 'randstr', 'remove', 'ren', 'restore',
+    'restrict', 'revoke', 'run', 'set', 'shift', 'shutdown', 'splice',
+    'task', 'timeit', 'to_thing', 'to_type', 'unshift', 'wse',
+))
+UNCACHEABLE_PREFIX = (
+    'del_', 'deploy_', 'mod_', 'new_', 'refresh_', 'rename_', 'reset_',
+    'restart_', 'set_',
+)
+
+_FUNCTIONS = frozenset(FUNCTIONS) | KEYWORDS
+_METHODS = frozenset(METHODS)
+
+
+def _is_word(c: str) -> bool:
+    return c.isalnum() or c == '_'
+
+
+def normalize(query: str) -> str:
+    """Remove white-space outside strings (except between two names) and
+    trailing semicolons."""
+    out = []
+    quote = None
+    space = False
+    for c in query.strip():
+        if quote:
+            out.append(c)
+            if c == quote:
+                quote = None
+        elif c.isspace():
+            space = True
+        else:
+            if space and out and _is_word(out[-1]) and _is_word(c):
+                out.append(' ')
+            space = False
+            if c in '"\'`':
+                quote = c
+            out.append(c)
+    return ''.join(out).rstrip(';')
+
+
+def is_read_only(query: str) -> bool:
+    """Return True if the query looks like it does not change anything.
+
+    This errs on the safe side; a name like `add` anywhere in the query, even
+    in a string, makes the query not read-only. Only built-in functions and
+    methods may be called, as a procedure, a method of a type or a closure
+    might change data.
+    """
+    if ASSIGN.search(query):
+        return False
+    for dot, name in CALL.findall(query):
+        if name not in (_METHODS if dot else _FUNCTIONS):
+            return False
+    return not any(
+        name in UNCACHEABLE or name.startswith(UNCACHEABLE_PREFIX)
+        for name in IDENTIFIER.findall(query))
+
+
+class ResultCache:
+    """LRU cache with the rendered output of read-only queries.
+
+    Entries are keyed on (scope, normalized query) and expire after `ttl`
+    seconds; the least recently used entries are removed when the total size
+    of the output exceeds `max_size` characters.
+    """
+
+    def __init__(
+            self,
+            enabled: bool = False,
+            ttl: float = 60.0,
+            max_size: int = 64 << 20):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = collections.OrderedDict()  # key: (expire, out)
+
+    def get(self, scope: str, query: str):
+        key = scope, normalize(query)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, scope: str, query: str, out: str):
+        if len(out) > self.max_size:
+            return
+        key = scope, normalize(query)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, out)
+        self.size += len(out)
+        while self.size > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self.size = 0
+
+    def clear(self):
+        self.invalidate()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _remove(self, key):
+        _, out = self._entries.pop(key)
+        self.size -= len(out)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0.0
+        return (
+            f'cache {"enabled" if self.enabled else "disabled"}: '
+            f'{len(self._entries)} entries, {self.size} characters, '
+            f'{self.hits} hits, {self.misses} misses ({ratio:.1f}% hits), '
+            f'{self.evictions} evictions, {self.invalidations} invalidations')
@@ -0,0 +1,235 @@
+'''Check ThingsDB code (*.ti files) without a connection to ThingsDB.
+
+Each file is tokenized with the ThingsDB lexer to find unexpected characters,
+unterminated strings and comments, unbalanced brackets and calls to unknown
+functions. Files are checked in parallel by a pool of processes; the result
+per file is cached by the hash of its content so unchanged files are not
+checked again.
+'''
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+from pygments.token import Comment, Error, Name, Punctuation, String, \
+    Text, Whitespace
+from .lexer import FUNCTIONS, KEYWORDS, ThingsDBLexer, tokenize
+
+
+CHECK_VERSION = 1  # increase when the checks change, invalidates the cache
+MAX_CACHE_ENTRIES = 100000
+CHUNK_SIZE = 16  # files per task for a worker process
+MIN_PARALLEL = 32  # check fewer files in this process
+
+_CLOSE = {')': '(', ']': '[', '}': '{'}
+_QUOTES = {'"': 'string', "'": 'string', '`': 'template string'}
+
+CACHE_FN = os.path.join(
+    os.path.expanduser('~'), '.config', 'ThingsPrompt', 'check-cache.json')
+
+# a slash after one of these characters starts a regular expression and not
+# a division, like in split_statements() of script.py
+_REGEX_PREV = frozenset('([{,;=:!&|?')
+
+# tokens which need no check and are not followed by a regular expression
+_SKIP = frozenset((Whitespace, Text, Comment.Single))
+
+_lexer = None
+
+
+def check_code(code: str, known: frozenset = frozenset()) -> list:
+    """Return a list with (line, column, message) for each error in `code`.
+
+    Functions in `known` are accepted next to the built-in functions.
+    """
+    global _lexer
+    if _lexer is None:
+        _lexer = ThingsDBLexer()
+
+    errors = []
+    brackets = []  # (char, pos) of the open brackets
+    comments = []  # positions of the open multi-line comments
+    stack = ['root']
+    pos = 0
+    prev = ';'  # last character which is not white-space or a comment
+
+    while True:
+        for token, value in _tokens(code, pos, stack):
+            if token in _SKIP:
+                pos += len(value)
+                continue
+            if token is String.Regex and prev not in _REGEX_PREV:
+                # a division; continue lexing after the slash
+                pos += 1
+                prev = '/'
+                break
+            if token is Error:
+                if value in _QUOTES:
+                    # the string runs to the end of the code
+                    errors.append((pos, f'unterminated {_QUOTES[value]}'))
+                    return _positions(code, errors)
+                errors.append((pos, f'unexpected character `{value}`'))
+            elif token is Punctuation:
+                if value in '([{':
+                    brackets.append((value, pos))
+                elif value in _CLOSE:
+                    if brackets and brackets[-1][0] == _CLOSE[value]:
+                        brackets.pop()
+                    elif brackets:
+                        char, start = brackets.pop()
+                        errors.append((
+                            pos,
+                            f'`{value}` does not match `{char}` at '
+                            f'{_fmt_pos(code, start)}'))
+                    else:
+                        errors.append((pos, f'unmatched `{value}`'))
+            elif token is Name.Variable:
+                # the lexer uses Name.Function for built-in functions only
+                if code.startswith('(', pos + len(value)) and \
+                        value not in KEYWORDS and value not in known:
+                    errors.append((pos, f'unknown function `{value}`'))
+            elif token is Comment.Multiline:
+                if value == '/*':
+                    comments.append(pos)
+                elif value == '*/' and comments:
+                    comments.pop()
+            if token is not Comment.Multiline:
+                prev = value[-1]
+            pos += len(value)
+        else:
+            break
+
+    if comments:
+        errors.append((comments[0], 'unterminated comment'))
+    errors.extend((start, f'unclosed `{char}`') for char, start in brackets)
+    return _positions(code, errors)
+
+
+def _tokens(code: str, pos: int, stack: list):
+    for tokens, _ in tokenize(_lexer, code, stack, pos):
+        yield from tokens
+
+
+def _line_col(code: str, pos: int) -> tuple:
+    line = code.count('\n', 0, pos) + 1
+    return line, pos - code.rfind('\n', 0, pos)
+
+
+def _fmt_pos(code: str, pos: int) -> str:
+    return '{}:{}'.format(*_line_col(code, pos))
+
+
+def _positions(code: str, errors: list) -> list:
+    return [(*_line_col(code, pos), msg) for pos, msg in sorted(errors)]
+
+
+def check_file(item: tuple) -> list:
+    fn, data, known = item
+    try:
+        code = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return [(1, 1, f'not valid UTF-8 at byte {e.start}')]
+    return check_code(code, known)
+
+
+def find_files(paths: list) -> list:
+    """Return the files to check; directories are searched for *.ti files."""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            files.extend(
+                os.path.join(root, name)
+                for name in sorted(names) if name.endswith('.ti'))
+    return files
+
+
+def _cache_key(known: frozenset) -> str:
+    h = hashlib.sha256(f'{CHECK_VERSION}'.encode())
+    for name in sorted(FUNCTIONS + tuple(known)):
+        h.update(f'\0{name}'.encode())
+    return h.hexdigest()
+
+
+def read_cache(fn: str, key: str) -> dict:
+    try:
+        with open(fn, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('key') != key:
+        return {}  # other checks or function names
+    return cache.get('files', {})
+
+
+def write_cache(fn: str, key: str, files: dict):
+    os.makedirs(os.path.dirname(fn), 0o700, exist_ok=True)
+    if len(files) > MAX_CACHE_ENTRIES:
+        # entries are ordered from least to most recently used
+        files = dict(list(files.items())[-MAX_CACHE_ENTRIES:])
+    tmp = f'{fn}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'key': key, 'files': files}, f, separators=(',', ':'))
+    os.replace(tmp, fn)
+
+
+def do_check(paths: list, functions: str, jobs: int, cache: bool) -> int:
+    """Print the errors in the given files; returns the number of errors.
+
+    `functions` are comma separated names of functions to accept.
+    """
+    cache_fn = CACHE_FN if cache else None
+    known = frozenset(name.strip() for name in (functions or '').split(',')
+                      if name.strip())
+    key = _cache_key(known)
+    cache = {} if cache_fn is None else read_cache(cache_fn, key)
+
+    results = {}
+    todo = []
+    for fn in find_files(paths):
+        try:
+            with open(fn, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            results[fn] = None, [(0, 0, f'{e.__class__.__name__}: {e}')]
+            continue
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        errors = cache.pop(digest, None)
+        if errors is None:
+            todo.append((fn, data, known))
+        results[fn] = digest, errors
+
+    if len(todo) < MIN_PARALLEL or jobs == 1:
+        checked = map(check_file, todo)
+        for (fn, _, _), errors in zip(todo, checked):
+            results[fn] = results[fn][0], errors
+    else:
+        with concurrent.futures.ProcessPoolExecutor(jobs or None) as pool:
+            checked = pool.map(check_file, todo, chunksize=CHUNK_SIZE)
+            for (fn, _, _), errors in zip(todo, checked):
+                results[fn] = results[fn][0], errors
+
+    total = 0
+    failed = 0
+    for fn, (digest, errors) in results.items():
+        if digest is not None:
+            cache[digest] = errors  # (re-)inserted as most recently used
+        for line, col, msg in errors:
+            print(f'{fn}:{line}:{col}: {msg}' if line else f'{fn}: {msg}')
+        total += len(errors)
+        failed += bool(errors)
+
+    if cache_fn is not None:
+        try:
+            write_cache(cache_fn, key, cache)
+        except OSError as e:
+            print(f'{e.__class__.__name__}: {e}', file=sys.stderr)
+
+    print(
+        f'{total} error(s) in {failed} of {len(results)} file(s) '
+        f'({len(todo)} checked, {len(results) - len(todo)} cached)',
+        file=sys.stderr)
+    return total
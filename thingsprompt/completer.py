@@ -0,0 +1,147 @@
+'''Tab completion for build-in functions and the schema of a scope.'''
+import asyncio
+import bisect
+import collections
+import logging
+import re
+import time
+from prompt_toolkit.completion import Completer, Completion
+from thingsdb.exceptions import ThingsDBError
+from .lexer import FUNCTIONS, METHODS
+
+
+WORD = re.compile(r'(\.?)([A-Za-z_][0-9A-Za-z_]*)$')
+SCOPE_PREFIX = re.compile(r'^\s*(@[\:0-9a-zA-Z_]+)\s+')
+SCHEMA_CHANGE = re.compile(
+    r'\b(new|set|mod|del|rename)_(type|enum|procedure|collection)\b')
+
+
+class Catalog:
+    """Sorted names with a kind (e.g. `type`) for fast prefix lookups."""
+
+    def __init__(self, names: dict):
+        self.names = sorted(names)
+        self.kinds = names
+        self.created = time.monotonic()
+
+    def lookup(self, prefix: str):
+        idx = bisect.bisect_left(self.names, prefix)
+        while idx < len(self.names) and self.names[idx].startswith(prefix):
+            name = self.names[idx]
+            yield name, self.kinds[name]
+            idx += 1
+
+
+class ThingsDBCompleter(Completer):
+    """Complete functions, methods, procedures, types, enums and collections.
+
+    Server side names are cached per scope and refreshed in the background;
+    `get_completions()` only reads the cache and never waits for a response.
+    Stale entries (older than `ttl` seconds) are still used while refreshing
+    and at most `max_scopes` scopes are cached (least recently used first).
+    """
+
+    def __init__(self, client, ttl: float = 60.0, max_scopes: int = 16):
+        self.client = client
+        self.ttl = ttl
+        self.max_scopes = max_scopes
+        self.functions = Catalog(dict.fromkeys(FUNCTIONS, 'function'))
+        self.methods = Catalog(dict.fromkeys(METHODS, 'method'))
+        self._cache = collections.OrderedDict()  # scope: (names, attrs)
+        self._collections = Catalog({})
+        self._tasks = {}
+
+    def refresh(self, scope: str = None):
+        """Start a background refresh for a scope (if not yet running)."""
+        scope = scope or self.client.get_default_scope()
+        if scope in self._tasks or not self.client.is_connected():
+            return
+        task = asyncio.ensure_future(self._refresh(scope))
+        self._tasks[scope] = task
+        task.add_done_callback(lambda _: self._tasks.pop(scope, None))
+
+    def on_query(self, query: str, scope: str = None):
+        """Refresh the catalog when a query might have changed the schema."""
+        if SCHEMA_CHANGE.search(query):
+            self.refresh(scope)
+            self.refresh('@thingsdb')
+
+    async def _query(self, code: str, scope: str):
+        try:
+            return await self.client.query(
+                code, scope=scope, timeout=10, retry=True)
+        except ThingsDBError:
+            return []  # not available in this scope
+        except Exception as e:
+            logging.debug(f'completion refresh failed: {e}')
+            return []
+
+    async def _refresh(self, scope: str):
+        procedures, types, enums, colls = await asyncio.gather(
+            self._query('procedures_info();', scope),
+            self._query('types_info();', scope),
+            self._query('enums_info();', scope),
+            self._query('collections_info();', '@thingsdb'))
+
+        names = {}
+        attrs = {}
+        try:
+            for info in procedures:
+                names[info['name']] = 'procedure'
+            for info in types:
+                names[info['name']] = 'type'
+                for field in info['fields']:
+                    attrs[field[0]] = f'{info["name"]} field'
+            for info in enums:
+                names[info['name']] = 'enum'
+                for member in info['members']:
+                    attrs[member[0]] = f'{info["name"]} member'
+            colls = {info['name']: 'collection' for info in colls}
+        except (KeyError, TypeError, IndexError) as e:
+            logging.debug(f'unexpected info for completion: {e}')
+            return
+
+        self._cache[scope] = (Catalog(names), Catalog(attrs))
+        self._cache.move_to_end(scope)
+        while len(self._cache) > self.max_scopes:
+            self._cache.popitem(last=False)
+        if colls:
+            self._collections = Catalog(colls)
+
+    def _catalogs(self, scope: str):
+        entry = self._cache.get(scope)
+        if entry is None or time.monotonic() - entry[0].created > self.ttl:
+            self.refresh(scope)
+        if entry is None:
+            return None, None
+        self._cache.move_to_end(scope)
+        return entry
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor
+        m = WORD.search(text)
+        if m is None:
+            return
+
+        is_attr, prefix = m.groups()
+        scope = SCOPE_PREFIX.match(document.text)
+        scope = scope.group(1) if scope \
+            else self.client.get_default_scope()
+        names, attrs = self._catalogs(scope)
+
+        if is_attr:
+            catalogs = (attrs, self.methods)
+        else:
+            catalogs = (names, self.functions, self._collections)
+
+        seen = set()
+        for catalog in catalogs:
+            if catalog is None:
+                continue
+            for name, kind in catalog.lookup(prefix):
+                if name not in seen:
+                    seen.add(name)
+                    yield Completion(
+                        name,
+                        start_position=-len(prefix),
+                        display_meta=kind)
@@ -0,0 +1,506 @@
+'''Local daemon which keeps connections to ThingsDB open between invocations.
+
+The daemon listens on a Unix socket (only accessible by the user) and keeps a
+pool of authenticated connections per node and user. A DaemonClient talks to
+the daemon instead of connecting to ThingsDB itself, which saves the connect,
+TLS handshake and authentication of every short-lived invocation. Messages
+are MessagePack maps, prefixed with their size; a connection may have many
+requests waiting for a response, which are answered in any order.
+'''
+import argparse
+import asyncio
+import fcntl
+import hashlib
+import os
+import signal
+import struct
+import subprocess
+import sys
+import time
+import msgpack
+import thingsdb.exceptions
+from thingsdb.exceptions import ThingsDBError
+from .reconnect import RETRIES, ConnectionLost, _consume
+from .thingsprompt import connect, make_client
+
+
+SOCKET_FN = os.path.join(
+    os.path.expanduser('~'), '.config', 'ThingsPrompt', 'daemon.sock')
+IDLE_TIMEOUT = 600.0
+POOL_SIZE = 4
+START_TIMEOUT = 5.0  # seconds to wait for a daemon which is started
+IDLE_CHECK = 1.0
+
+_HEADER = struct.Struct('<I')
+_ERRORS = {e.__name__: e for e in (
+    ConnectionLost, ConnectionError, ConnectionRefusedError, TimeoutError,
+    OSError, ValueError)}
+
+
+async def _read_msg(reader) -> dict:
+    size, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return msgpack.unpackb(
+        await reader.readexactly(size), raw=False, strict_map_key=False)
+
+
+def _write_msg(writer, msg: dict):
+    data = msgpack.packb(msg, use_bin_type=True)
+    # a single write, so the messages of concurrent requests do not mix
+    writer.write(_HEADER.pack(len(data)) + data)
+
+
+def _error(e: Exception) -> dict:
+    err = {'error': e.__class__.__name__, 'msg': str(e)}
+    if isinstance(e, ThingsDBError):
+        err['code'] = getattr(e, 'error_code', None)
+    return err
+
+
+def _exception(err: dict) -> Exception:
+    """Return the exception for an error from the daemon."""
+    name, msg = err['error'], err['msg']
+    if 'code' in err:
+        cls = getattr(thingsdb.exceptions, name, None)
+        if isinstance(cls, type) and issubclass(cls, ThingsDBError):
+            if err['code'] is None:
+                return cls(msg)
+            return cls(errdata={'error_msg': msg, 'error_code': err['code']})
+    if name in _ERRORS:
+        return _ERRORS[name](msg)
+    return ConnectionError(f'{name}: {msg}')
+
+
+class Pool:
+    """Connections for a node and user; grows up to `size` connections when
+    all connections have requests waiting for a response."""
+
+    def __init__(self, params: argparse.Namespace, auth: list, size: int):
+        self.params = params
+        self.auth = auth
+        self.size = size
+        self.clients = []
+        self.requests = 0
+        self.last_used = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        client = make_client(self.params, asyncio.get_running_loop())
+        try:
+            await connect(client, self.params, self.auth)
+        except Exception:
+            client.close()
+            raise
+        self.clients.append(client)
+        return client
+
+    async def get(self):
+        self.last_used = time.monotonic()
+        async with self._lock:
+            if not self.clients:
+                return await self._connect()
+        client = min(self.clients, key=lambda c: c.pending)
+        if client.pending and len(self.clients) < self.size \
+                and not self._lock.locked():
+            async with self._lock:
+                if len(self.clients) < self.size:
+                    try:
+                        return await self._connect()
+                    except Exception:
+                        pass  # use the existing connection
+        return client
+
+    async def query(self, msg: dict):
+        client = await self.get()
+        self.requests += 1
+        try:
+            return await client.query(
+                msg['code'],
+                scope=msg['scope'],
+                timeout=msg['timeout'],
+                skip_strip_code=msg['skip_strip_code'],
+                retry=msg['retry'],
+                **msg['kwargs'])
+        finally:
+            self.last_used = time.monotonic()
+
+    def status(self) -> dict:
+        return {
+            'node': f'{self.params.node}:{self.params.port}',
+            'user': self.auth[0] if len(self.auth) == 2 else 'token',
+            'ssl': self.params.ssl,
+            'connections': len(self.clients),
+            'connected': sum(c.is_connected() for c in self.clients),
+            'pending': sum(c.pending for c in self.clients),
+            'requests': self.requests,
+            'idle': round(time.monotonic() - self.last_used, 1),
+        }
+
+    async def close(self):
+        for client in self.clients:
+            client.close()
+        for client in self.clients:
+            await client.wait_closed()
+        self.clients.clear()
+
+
+def _pool_key(hello: dict) -> tuple:
+    # the credentials are part of the key; a pool is only used with the
+    # credentials which were used to authenticate its connections
+    auth = hashlib.sha256(msgpack.packb(hello['auth'])).hexdigest()
+    return hello['node'], hello['port'], hello['ssl'], auth
+
+
+class Daemon:
+
+    def __init__(self, fn: str = SOCKET_FN, idle_timeout: float = IDLE_TIMEOUT,
+                 pool_size: int = POOL_SIZE):
+        self.fn = fn
+        self.idle_timeout = idle_timeout
+        self.pool_size = max(1, pool_size)
+        self.pools = {}
+        self.writers = set()  # of the connected clients
+        self.started = time.time()
+        self.last_used = time.monotonic()
+        self.stopped = None
+
+    async def _hello(self, msg: dict):
+        key = _pool_key(msg)
+        pool = self.pools.get(key)
+        if pool is None:
+            params = argparse.Namespace(
+                node=msg['node'],
+                port=msg['port'],
+                ssl=msg['ssl'],
+                timeout=msg['timeout'],
+                keepalive=msg['keepalive'],
+                scope='@thingsdb')
+            pool = Pool(params, msg['auth'], self.pool_size)
+            await pool.get()  # fails with wrong credentials
+            # another client might have created the pool in the meantime
+            existing = self.pools.setdefault(key, pool)
+            if existing is not pool:
+                await pool.close()
+                pool = existing
+        return pool
+
+    async def _handle(self, msg: dict, pool):
+        op = msg['op']
+        if op == 'query':
+            return await pool.query(msg)
+        if op == 'status':
+            return self.status()
+        if op == 'stop':
+            self.stopped.set()
+            return None
+        raise ValueError(f'unknown operation `{op}`')
+
+    async def _request(self, writer, msg: dict, pool):
+        try:
+            res = {'id': msg['id'], 'result': await self._handle(msg, pool)}
+        except Exception as e:
+            res = {'id': msg['id'], **_error(e)}
+        self.last_used = time.monotonic()
+        try:
+            _write_msg(writer, res)
+            await writer.drain()
+        except ConnectionError:
+            pass  # the client has gone
+
+    async def _serve(self, reader, writer):
+        self.writers.add(writer)
+        pool = None
+        tasks = set()
+        try:
+            while True:
+                try:
+                    msg = await _read_msg(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if msg['op'] == 'hello':
+                    try:
+                        pool = await self._hello(msg)
+                    except Exception as e:
+                        _write_msg(writer, {'id': msg['id'], **_error(e)})
+                    else:
+                        _write_msg(writer, {'id': msg['id'], 'result': None})
+                    continue
+                if msg['op'] == 'query' and pool is None:
+                    _write_msg(writer, {
+                        'id': msg['id'],
+                        **_error(ConnectionError('no connection'))})
+                    continue
+                task = asyncio.ensure_future(self._request(writer, msg, pool))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            self.writers.discard(writer)
+            self.last_used = time.monotonic()
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    def status(self) -> dict:
+        return {
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.started),
+            'idle_timeout': self.idle_timeout,
+            'clients': len(self.writers),
+            'pools': [pool.status() for pool in self.pools.values()],
+        }
+
+    async def _close_idle(self):
+        while True:
+            await asyncio.sleep(IDLE_CHECK)
+            now = time.monotonic()
+            for key, pool in list(self.pools.items()):
+                if now - pool.last_used > self.idle_timeout and not any(
+                        c.pending for c in pool.clients):
+                    del self.pools[key]
+                    await pool.close()
+            if not self.pools and not self.writers and \
+                    now - self.last_used > self.idle_timeout:
+                self.stopped.set()
+
+    async def run(self) -> bool:
+        """Run until stopped or idle; returns False when another daemon is
+        running."""
+        os.makedirs(os.path.dirname(self.fn), 0o700, exist_ok=True)
+        # held while running; daemons which are started at the same time
+        # (by concurrent invocations) would otherwise replace the socket
+        lock = open(
+            f'{self.fn}.lock', 'w',
+            opener=lambda path, flags: os.open(path, flags, 0o600))
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        try:
+            await self._run()
+        finally:
+            lock.close()
+        return True
+
+    async def _run(self):
+        self.stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopped.set)
+
+        if os.path.exists(self.fn):
+            os.unlink(self.fn)  # left behind by a daemon which has stopped
+        # only the user can connect to the socket
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._serve, self.fn)
+        finally:
+            os.umask(umask)
+
+        idle = asyncio.ensure_future(self._close_idle()) \
+            if self.idle_timeout else None
+        try:
+            await self.stopped.wait()
+        finally:
+            if idle is not None:
+                idle.cancel()
+            server.close()
+            for writer in self.writers:
+                writer.close()
+            await server.wait_closed()
+            try:
+                os.unlink(self.fn)
+            except FileNotFoundError:
+                pass
+            for pool in self.pools.values():
+                await pool.close()
+
+
+class DaemonClient:
+    """Client which sends the queries to the daemon, for use instead of the
+    ThingsDB client by the sub-commands (not by the prompt or listen)."""
+
+    # equal to the connections of the daemon; queries with `retry=True` are
+    # retried by the daemon, others fail with ConnectionLost and might be
+    # retried by the caller (see transfer._import)
+    retries = RETRIES
+
+    def __init__(self, args, auth: list, fn: str = SOCKET_FN):
+        self.args = args
+        self.auth = auth
+        self.fn = fn
+        self._scope = args.scope
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._futures = {}
+        self._next_id = 0
+
+    async def _open(self):
+        try:
+            return await asyncio.open_unix_connection(self.fn)
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass
+        # start the daemon in the background
+        subprocess.Popen(
+            [sys.executable, '-m', 'thingsprompt', 'daemon', 'start'],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True)
+        start = time.monotonic()
+        while True:
+            await asyncio.sleep(0.05)
+            try:
+                return await asyncio.open_unix_connection(self.fn)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() - start > START_TIMEOUT:
+                    raise ConnectionError('failed to start the daemon')
+
+    async def connect(self, start: bool = True):
+        """Connect to the daemon (which is started when not running) and get
+        a connection to ThingsDB with the arguments and credentials."""
+        if start:
+            self._reader, self._writer = await self._open()
+        else:
+            self._reader, self._writer = \
+                await asyncio.open_unix_connection(self.fn)
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+        if not start:
+            return
+        try:
+            await self._request(
+                'hello',
+                node=self.args.node,
+                port=self.args.port,
+                ssl=self.args.ssl,
+                timeout=self.args.timeout,
+                keepalive=self.args.keepalive,
+                auth=self.auth)
+        except Exception:
+            self.close()
+            await self.wait_closed()
+            raise
+
+    async def _read_loop(self):
+        try:
+            while True:
+                msg = await _read_msg(self._reader)
+                fut = self._futures.pop(msg['id'], None)
+                if fut is None or fut.done():
+                    continue
+                if 'error' in msg:
+                    fut.set_exception(_exception(msg))
+                else:
+                    fut.set_result(msg['result'])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for fut in self._futures.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionLost('connection lost'))
+            self._futures.clear()
+
+    async def _request(self, op: str, **kwargs):
+        if self._reader_task is None or self._reader_task.done():
+            raise ConnectionError('no connection')
+        self._next_id += 1
+        fut = self._futures[self._next_id] = \
+            asyncio.get_running_loop().create_future()
+        # the caller might be cancelled when the connection is lost
+        fut.add_done_callback(_consume)
+        _write_msg(self._writer, {'id': self._next_id, 'op': op, **kwargs})
+        await self._writer.drain()
+        return await fut
+
+    async def query(self, code: str, scope=None, timeout=None,
+                    skip_strip_code: bool = False, retry: bool = False,
+                    **kwargs):
+        return await self._request(
+            'query',
+            code=code,
+            scope=self._scope if scope is None else scope,
+            timeout=timeout,
+            skip_strip_code=skip_strip_code,
+            retry=retry,
+            kwargs=kwargs)
+
+    async def has_collection(self, name: str):
+        return await self.query('has_collection(name)', name=name, scope='@t')
+
+    async def new_collection(self, name: str):
+        return await self.query('new_collection(name)', name=name, scope='@t')
+
+    async def collections_info(self):
+        return await self.query('collections_info()', scope='@t')
+
+    async def status(self) -> dict:
+        return await self._request('status')
+
+    async def stop(self):
+        return await self._request('stop')
+
+    def get_default_scope(self) -> str:
+        return self._scope
+
+    def set_default_scope(self, scope: str):
+        self._scope = scope
+
+    def is_connected(self) -> bool:
+        return self._reader_task is not None and not self._reader_task.done()
+
+    def connection_info(self) -> str:
+        return f'{self.args.node}:{self.args.port} (daemon)'
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    async def wait_closed(self):
+        if self._reader_task is not None:
+            await asyncio.wait((self._reader_task,))
+
+
+def _print_status(status: dict):
+    print(f'pid {status["pid"]}, up {status["uptime"]}s, '
+          f'{status["clients"]} client(s), '
+          f'idle timeout {status["idle_timeout"]:g}s')
+    pools = status['pools']
+    if not pools:
+        return
+    width = max(len(p['node']) for p in pools + [{'node': 'node'}])
+    uwidth = max(len(p['user']) for p in pools + [{'user': 'user'}])
+    print(f'{"node":<{width}}  {"user":<{uwidth}}  connections  pending  '
+          f'requests  idle (s)')
+    for p in pools:
+        conns = f'{p["connected"]}/{p["connections"]}'
+        print(f'{p["node"]:<{width}}  {p["user"]:<{uwidth}}  {conns:>11}  '
+              f'{p["pending"]:>7}  {p["requests"]:>8}  {p["idle"]:>8}')
+
+
+async def _control(action: str) -> int:
+    client = DaemonClient(argparse.Namespace(scope=None), [])
+    try:
+        await client.connect(start=False)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print('daemon is not running', file=sys.stderr)
+        return 1
+    try:
+        if action == 'status':
+            _print_status(await client.status())
+        else:
+            await client.stop()
+    finally:
+        client.close()
+        await client.wait_closed()
+    return 0
+
+
+def do_daemon(action: str, idle_timeout: float, pool_size: int) -> int:
+    loop = asyncio.get_event_loop()
+    if action != 'start':
+        return loop.run_until_complete(_control(action))
+    daemon = Daemon(idle_timeout=idle_timeout, pool_size=pool_size)
+    if not loop.run_until_complete(daemon.run()):
+        print('daemon is already running', file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,64 @@
+'''Structural diff of query results.'''
+import re
+from .render import BinEncode
+
+
+CHANGED, ADDED, REMOVED = 'changed', 'added', 'removed'
+
+_NAME = re.compile(r'^[A-Za-z_][0-9A-Za-z_]*$')
+
+
+def diff(old, new, path: tuple = ()):
+    """Yield (path, kind, old, new) for each difference between two results.
+
+    Both results are walked completely, so the cost is linear in the size of
+    the results. Values of a different type are a change, also when Python
+    considers them equal (like 1, 1.0 and true). Lists are compared by index.
+    """
+    if old is new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, val in new.items():
+            if key not in old:
+                yield path + (key,), ADDED, None, val
+            else:
+                yield from diff(old[key], val, path + (key,))
+        for key, val in old.items():
+            if key not in new:
+                yield path + (key,), REMOVED, val, None
+    elif isinstance(old, list) and isinstance(new, list):
+        for idx, (a, b) in enumerate(zip(old, new)):
+            yield from diff(a, b, path + (idx,))
+        for idx in range(len(old), len(new)):
+            yield path + (idx,), ADDED, None, new[idx]
+        for idx in range(len(new), len(old)):
+            yield path + (idx,), REMOVED, old[idx], None
+    elif type(old) is not type(new) or old != new:
+        yield path, CHANGED, old, new
+
+
+def fmt_path(path: tuple) -> str:
+    """Format a path like `.stats.users[2]`."""
+    out = []
+    for key in path:
+        if isinstance(key, int):
+            out.append(f'[{key}]')
+        elif _NAME.match(key):
+            out.append(f'.{key}')
+        else:
+            out.append(f'[{BinEncode().encode(key)}]')
+    return ''.join(out) or '.'
+
+
+def fmt_change(path: tuple, kind: str, old, new, width: int = 60) -> str:
+    encode = BinEncode().encode
+
+    def short(val):
+        out = encode(val)
+        return out if len(out) <= width else f'{out[:width - 3]}...'
+
+    if kind == ADDED:
+        return f'+ {fmt_path(path)}: {short(new)}'
+    if kind == REMOVED:
+        return f'- {fmt_path(path)}: {short(old)}'
+    return f'~ {fmt_path(path)}: {short(old)} -> {short(new)}'
@@ -0,0 +1,229 @@
+'''Reading and writing ThingsDB export files.'''
+import asyncio
+import gzip
+import mmap
+import os
+import sys
+import time
+from .manifest import HashedFile
+
+
+CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# compression name: (file extension, magic bytes)
+COMPRESSION = {
+    'gzip': ('.gz', b'\x1f\x8b'),
+    'zstd': ('.zst', b'\x28\xb5\x2f\xfd'),
+}
+
+
+def compression_from_fn(fn: str):
+    """Return the compression for a filename extension, or None."""
+    for name, (ext, _) in COMPRESSION.items():
+        if fn.endswith(ext):
+            return name
+    return None
+
+
+def sniff_compression(head: bytes):
+    """Return the compression of a file from its first bytes, or None."""
+    for name, (_, magic) in COMPRESSION.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(
+            'zstd requires the zstandard package (pip install zstandard)')
+    return zstandard
+
+
+def _compressor(f, compression: str, level=None):
+    if compression == 'gzip':
+        return gzip.GzipFile(
+            filename='',
+            fileobj=f,
+            mode='wb',
+            compresslevel=6 if level is None else level,
+            mtime=0)
+    return _zstandard().ZstdCompressor(
+        level=3 if level is None else level).stream_writer(f, closefd=False)
+
+
+def _decompressor(f, compression: str):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    return _zstandard().ZstdDecompressor().stream_reader(f, closefd=False)
+
+
+def fmt_transfer(action: str, size: int, duration: float) -> str:
+    mb = size / (1 << 20)
+    rate = mb / duration if duration > 0 else 0.0
+    return f'{action} {mb:.2f} MB in {duration:.2f}s ({rate:.2f} MB/s)'
+
+
+async def wait_progress(fut, action: str, size: int, interval: float = 1.0):
+    """Await `fut` while reporting the elapsed time on stderr.
+
+    Nothing is reported when stderr is not a terminal.
+    """
+    task = asyncio.ensure_future(fut)
+    if not sys.stderr.isatty():
+        return await task
+
+    start = time.perf_counter()
+    mb = size / (1 << 20)
+    reported = False
+    try:
+        while True:
+            done, _ = await asyncio.wait((task,), timeout=interval)
+            if done:
+                return task.result()
+            elapsed = time.perf_counter() - start
+            print(f'\r{action} {mb:.2f} MB... {elapsed:.0f}s',
+                  end='', file=sys.stderr, flush=True)
+            reported = True
+    finally:
+        if reported:
+            print('\r\x1b[K', end='', file=sys.stderr, flush=True)
+
+
+class DumpWriter:
+    """Write an export to disk atomically.
+
+    Data is written to a `.partial` file next to the target which is synced
+    and renamed once the export is complete, so a failed or interrupted export
+    never leaves a truncated file with the final name behind. With
+    `compression` (gzip or zstd) the data is compressed while written and
+    with a `hasher` (see manifest.py) the file content is hashed.
+
+    This does not bound the memory of an export: ThingsDB returns an export
+    as a single response, so the whole export is in memory before it is
+    written (plus the buffers of the compressor).
+    """
+
+    def __init__(
+            self,
+            fn: str,
+            compression: str = None,
+            level: int = None,
+            hasher=None):
+        self.fn = fn
+        self.tmp = f'{fn}.partial'
+        self.compression = compression
+        self.level = level
+        self.hasher = hasher
+        self.size = 0
+        self.file_size = 0
+        self._f = None
+        self._out = None
+        self._compressor = None
+
+    def __enter__(self):
+        self._f = open(self.tmp, 'wb')
+        self._out = self._f if self.hasher is None else \
+            HashedFile(self._f, self.hasher)
+        if self.compression is not None:
+            try:
+                self._out = self._compressor = _compressor(
+                    self._out, self.compression, self.level)
+            except Exception:
+                self._f.close()
+                os.unlink(self.tmp)
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._compressor is not None:
+                # writes the end of the compressed stream
+                self._compressor.close()
+            if exc_type is None:
+                self._f.flush()
+                os.fsync(self._f.fileno())
+                self.file_size = self._f.tell()
+        finally:
+            self._f.close()
+
+        if exc_type is None:
+            os.replace(self.tmp, self.fn)
+        else:
+            try:
+                os.unlink(self.tmp)
+            except OSError:
+                pass
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._out.write(data)
+        self.size += len(data)
+
+
+class DumpReader:
+    """Memory-map an export file for reading.
+
+    The file is not read into a bytes object; `view` exposes the mapped pages
+    and is used to verify the manifest and to detect the format. This does not
+    avoid copies on import: the ThingsDB client packs the request with
+    msgpack.packb() and prepends the header, which are two full copies of the
+    export. A compressed file (see `compression`) must be decompressed first,
+    after which `view` exposes the decompressed data.
+    """
+
+    def __init__(self, fn: str, chunk_size: int = CHUNK_SIZE):
+        self.fn = fn
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.view = None
+        self.compression = None
+        self._f = None
+        self._mm = None
+
+    def __enter__(self):
+        self._f = open(self.fn, 'rb')
+        try:
+            self.size = os.fstat(self._f.fileno()).st_size
+            if self.size == 0:
+                raise ValueError(f'file `{self.fn}` is empty')
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._f.close()
+            raise
+        self.view = memoryview(self._mm)
+        self.compression = sniff_compression(self._mm[:4])
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.view.release()
+        self._mm.close()
+        self._f.close()
+
+    def decompress(self):
+        """Decompress the file in chunks; blocking, so preferably called in a
+        worker thread."""
+        data = bytearray()
+        with _decompressor(self._mm, self.compression) as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                data += chunk
+        if not data:
+            raise ValueError(f'file `{self.fn}` is empty')
+        self.view.release()
+        self.view = memoryview(data)
+        self.size = len(data)
+        self.compression = None
+
+    def is_msgpack(self) -> bool:
+        # a MessagePack export starts with a map or array header, anything
+        # below 128 might be plain text
+        return self.view[0] >= 128
+
+    def text(self) -> str:
+        return str(self.view, 'utf-8')
@@ -0,0 +1,178 @@
+'''Export the typed things of a collection as NDJSON or column batches.
+
+The things are read in pages of consecutive thing Ids, from zero up to the
+next free Id, so the work per query (and the memory) is bounded by the page
+size. Several pages are requested at once and written in order of their Ids
+while the next pages are fetched.
+
+Thing Ids are shared by all collections of the node, so the pages cover the
+Ids of every collection (and of removed things); the cost of an export
+depends on the number of Ids ever used in the node, not on the size of the
+collection. ThingsDB has no query which lists the things of a type.
+'''
+import asyncio
+import collections
+import contextlib
+import os
+import time
+from .dumpfile import COMPRESSION, DumpWriter, fmt_transfer
+from .render import BinEncode
+
+
+FORMATS = ('ndjson', 'columns')
+PAGE_SIZE = 1000
+
+PAGE_QUERY = """//ti
+    range(lo, hi).reduce(|page, id| {
+        t = try(thing(id));
+        if (!is_err(t) && type(t) != 'thing') {
+            page.push([type(t), t]);
+        };
+        page;
+    }, []);
+"""
+
+
+class NdjsonWriter:
+    """Write a line `{"type": <type>, "thing": <thing>}` per thing."""
+
+    def __init__(self, fn: str, compression: str = None, level: int = None):
+        self.count = 0
+        self.size = 0
+        self._writer = DumpWriter(fn, compression=compression, level=level)
+        self._encode = BinEncode(separators=(',', ':')).encode
+
+    def __enter__(self):
+        self._writer.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._writer.__exit__(*exc)
+        self.size = self._writer.size
+
+    def write_page(self, page: list):
+        if not page:
+            return
+        encode = self._encode
+        lines = [encode({'type': tp, 'thing': t}) for tp, t in page]
+        lines.append('')
+        self._writer.write('\n'.join(lines))
+        self.count += len(page)
+
+
+class ColumnWriter:
+    """Write a file per type, with a line per page with the things of that
+    type as columns: `{"#": [<id>, ...], <field>: [<value>, ...], ...}`."""
+
+    def __init__(self, directory: str, fields: dict, compression: str = None,
+                 level: int = None):
+        self.directory = directory
+        self.fields = fields  # type: [field name, ...]
+        self.compression = compression
+        self.level = level
+        self.count = 0
+        self.size = 0
+        self._writers = {}
+        self._stack = contextlib.ExitStack()
+        self._encode = BinEncode(separators=(',', ':')).encode
+
+    def __enter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._stack.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.__exit__(*exc)
+        self.size = sum(w.size for w in self._writers.values())
+
+    def _writer(self, tp: str):
+        try:
+            return self._writers[tp]
+        except KeyError:
+            ext = COMPRESSION[self.compression][0] if self.compression else ''
+            fn = os.path.join(self.directory, f'{tp}.ndjson{ext}')
+            writer = self._writers[tp] = self._stack.enter_context(
+                DumpWriter(fn, compression=self.compression, level=self.level))
+            return writer
+
+    def write_page(self, page: list):
+        things = {}
+        for tp, t in page:
+            things.setdefault(tp, []).append(t)
+        for tp, items in things.items():
+            # a type created during the export has no known fields
+            names = self.fields.get(tp) or [
+                k for k in items[0] if k != '#']
+            columns = {'#': [t.get('#') for t in items]}
+            for name in names:
+                columns[name] = [t.get(name) for t in items]
+            self._writer(tp).write(self._encode(columns) + '\n')
+        self.count += len(page)
+
+
+async def export_things(client, fn: str, collection: str, fmt: str,
+                        page_size: int = PAGE_SIZE, in_flight: int = 4,
+                        compression: str = None, level: int = None):
+    """Export the typed things of a collection; returns the writer."""
+    scope = f'//{collection}'
+    info = await client.query(
+        'collection_info(name);', name=collection, scope='@thingsdb',
+        retry=True)
+    end = info.get('next_free_id')
+    if end is None:
+        raise ValueError('collection_info() has no `next_free_id`')
+    types = await client.query('types_info();', scope=scope, retry=True)
+    fields = {t['name']: [f[0] for f in t['fields']] for t in types}
+
+    if fmt == 'ndjson':
+        writer = NdjsonWriter(fn, compression, level)
+    else:
+        writer = ColumnWriter(fn, fields, compression, level)
+
+    loop = asyncio.get_running_loop()
+    pending = collections.deque()
+    page_size = max(1, page_size)
+    in_flight = max(1, in_flight)
+
+    async def write_next():
+        page = await pending.popleft()
+        # encoding and writing overlaps with fetching the next pages
+        await loop.run_in_executor(None, writer.write_page, page)
+
+    try:
+        with writer:
+            for lo in range(0, end, page_size):
+                # reading a page does not change anything, so it runs again
+                # when the connection is lost
+                pending.append(asyncio.ensure_future(client.query(
+                    PAGE_QUERY,
+                    lo=lo,
+                    hi=min(lo + page_size, end),
+                    scope=scope,
+                    retry=True)))
+                if len(pending) >= in_flight:
+                    await write_next()
+            while pending:
+                await write_next()
+    finally:
+        for fut in pending:
+            fut.cancel()
+    return writer
+
+
+async def do_export_things(client, fn: str, collection: str, fmt: str,
+                           page_size: int, in_flight: int,
+                           compression: str = None, level: int = None) -> int:
+    start = time.perf_counter()
+    try:
+        writer = await export_things(
+            client, fn, collection, fmt, page_size, in_flight, compression,
+            level)
+    except Exception as e:
+        print(f'{e.__class__.__name__}: {e}')
+        return 1
+    duration = time.perf_counter() - start
+    rate = writer.count / duration if duration > 0 else 0.0
+    print(f'{fmt_transfer("exported", writer.size, duration)}, '
+          f'{writer.count} things ({rate:.0f} things/s)')
+    return 0
@@ -0,0 +1,160 @@
+'''Run queries on multiple nodes at once.'''
+import asyncio
+import time
+from .render import BinEncode
+from .timing import fmt_ms
+
+
+MAX_CELL = 32  # maximum width of a value in the side by side table
+
+
+def parse_node(spec: str, port: int) -> tuple:
+    """Return (host, port) for `host`, `host:port` or `[ipv6]:port`.
+
+    A spec with a scheme (like `wss://host`) is returned as is with the
+    default port; the client handles websocket URIs itself.
+    """
+    spec = spec.strip()
+    if '://' in spec:
+        return spec, port
+    if spec.startswith('['):
+        host, _, rest = spec[1:].partition(']')
+        return host, int(rest[1:]) if rest.startswith(':') else port
+    if spec.count(':') == 1:
+        host, p = spec.split(':')
+        return host, int(p)
+    return spec, port
+
+
+def read_nodes_file(fn: str, port: int) -> list:
+    """Read a node list; one `host[:port]` per line, # starts a comment."""
+    nodes = []
+    with open(fn, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                nodes.append(parse_node(line, port))
+    return nodes
+
+
+class NodeResult:
+
+    __slots__ = ('name', 'duration', 'res', 'error')
+
+    def __init__(self, name: str, duration: float, res=None, error=None):
+        self.name = name
+        self.duration = duration
+        self.res = res
+        self.error = error
+
+
+class FanOut:
+    """Connections to all nodes to fan out a query to every node.
+
+    The first connection is the one which is used by the prompt; the others
+    are created (concurrently) with `connect()`. Nodes which fail to connect
+    are reported and skipped.
+    """
+
+    def __init__(self, client, nodes: list):
+        host, port = nodes[0]
+        self.clients = [(f'{host}:{port}', client)]
+        self.nodes = nodes[1:]
+
+    async def connect(self, connect_node):
+        async def _connect(host, port):
+            name = f'{host}:{port}'
+            try:
+                client = await connect_node(host, port)
+            except Exception as e:
+                print(f'{name}: {e.__class__.__name__}: {e}')
+            else:
+                self.clients.append((name, client))
+
+        await asyncio.gather(*(_connect(*node) for node in self.nodes))
+
+    def close(self):
+        for _, client in self.clients[1:]:
+            client.close()
+
+    async def wait_closed(self):
+        await asyncio.gather(*(
+            client.wait_closed() for _, client in self.clients[1:]))
+
+    async def query(self, query: str, scope: str, timeout) -> list:
+        """Run a query on all nodes in parallel; returns NodeResult's."""
+        async def _query(name, client):
+            start = time.perf_counter()
+            try:
+                res = await client.query(query, scope=scope, timeout=timeout)
+            except Exception as e:
+                return NodeResult(name, time.perf_counter() - start, error=e)
+            return NodeResult(name, time.perf_counter() - start, res)
+
+        return await asyncio.gather(*(
+            _query(name, client) for name, client in self.clients))
+
+
+def _is_flat(res) -> bool:
+    return isinstance(res, dict) and not any(
+        isinstance(v, (dict, list)) for v in res.values())
+
+
+def _cell(val) -> str:
+    out = BinEncode().encode(val) if not isinstance(val, str) else val
+    return out if len(out) <= MAX_CELL else f'{out[:MAX_CELL - 3]}...'
+
+
+def side_by_side(results: list) -> str:
+    """Return a table with a row per key and a column per node.
+
+    Rows with different values between the nodes are marked with `*`.
+    """
+    keys = {}
+    for r in results:
+        keys.update(dict.fromkeys(r.res or ()))
+    rows = [['', *(r.name for r in results)]]
+    rows.append(['latency', *(fmt_ms(r.duration) for r in results)])
+    for r in results:
+        if r.error is not None:
+            rows.append(['error', *(
+                '' if o.error is None else o.error.__class__.__name__
+                for o in results)])
+            break
+    for key in sorted(keys):
+        values = [
+            _cell(r.res.get(key, '')) if r.error is None else ''
+            for r in results]
+        ok = {v for v, r in zip(values, results) if r.error is None}
+        mark = '* ' if len(ok) > 1 else '  '
+        rows.append([f'{mark}{key}', *values])
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip()
+        for row in rows)
+
+
+def merged(results: list) -> dict:
+    """Return the results (or errors) per node as a single dict."""
+    out = {}
+    for r in results:
+        if r.error is None:
+            out[r.name] = r.res
+        else:
+            out[r.name] = {
+                'error': r.error.__class__.__name__,
+                'msg': str(r.error),
+            }
+    return out
+
+
+async def write_results(results: list, renderer):
+    """Show flat results side by side, others merged with the latency."""
+    if all(r.error is not None or _is_flat(r.res) for r in results):
+        print(side_by_side(results))
+        return
+
+    await renderer.write(merged(results))
+    print('-- ' + ', '.join(
+        f'{r.name} {fmt_ms(r.duration)}' for r in results))
@@ -0,0 +1,159 @@
+'''Highlighting for the prompt, which only re-lexes the changed lines.
+
+Only imported by the prompt; the lexer itself (lexer.py) is also used without
+prompt_toolkit, for example by the check sub-command.
+'''
+from prompt_toolkit.lexers import Lexer
+from prompt_toolkit.styles.pygments import pygments_token_to_classname
+from pygments.token import Comment, Error, Name, Operator, Whitespace
+from .lexer import ThingsDBLexer, tokenize
+
+
+# a line may start inside a token of these types (white-space with a new line
+# and indentation) and still be used to restart lexing
+_SPLITTABLE = frozenset((Whitespace, Comment.Multiline))
+_NAMES = frozenset((Name.Variable, Name.Attribute))
+
+
+# look-ahead of a line beyond its own text; an unterminated string or a slash
+# which is not a regular expression depends on the rest of the text, a trailing
+# name depends on the next non white-space character since it might be an
+# assignment
+AHEAD_NONE, AHEAD_NEXT, AHEAD_EOF = range(3)
+
+
+def _looks_ahead(token, value: str) -> bool:
+    return (token is Error and value in '"\'`') or \
+        (token is Operator and value == '/')
+
+
+class IncrementalLexer(Lexer):
+    """Prompt toolkit lexer which only re-lexes the lines which are changed.
+
+    For each line the style fragments and the lexer state at the start of the
+    line are cached. On a change, lexing restarts at the last known state
+    before the first changed line and stops as soon as a line after the
+    changed lines is reached with the same state as before; the remaining
+    lines are taken from the cache.
+    """
+
+    def __init__(self, pygments_lexer_cls=ThingsDBLexer):
+        self.lexer = pygments_lexer_cls()
+        self._styles = {}
+        self._lines = []
+        self._frags = []  # style fragments per line
+        self._starts = []  # lexer state at the start of a line, or None
+        self._ahead = []  # AHEAD_x; dependency of a line on the text below
+
+    def _style(self, token) -> str:
+        try:
+            return self._styles[token]
+        except KeyError:
+            style = self._styles[token] = \
+                f'class:{pygments_token_to_classname(token)}'
+            return style
+
+    def lex_document(self, document):
+        lines = document.lines
+        if lines != self._lines:
+            self._update(lines)
+
+        frags = self._frags
+
+        def get_line(lineno: int):
+            return frags[lineno] if lineno < len(frags) else []
+        return get_line
+
+    def _update(self, lines: list):
+        old_lines = self._lines
+        old_frags, old_starts, old_ahead = \
+            self._frags, self._starts, self._ahead
+        n = min(len(lines), len(old_lines))
+
+        first = 0
+        while first < n and lines[first] == old_lines[first]:
+            first += 1
+
+        same = 0
+        while same < n - first and lines[-1 - same] == old_lines[-1 - same]:
+            same += 1
+        end = len(lines) - same  # lines from `end` are equal to the old lines
+        delta = len(lines) - len(old_lines)
+
+        for lineno in range(min(first, len(old_ahead))):
+            if old_ahead[lineno] == AHEAD_EOF:
+                first = lineno
+                break
+
+        prev = first - 1
+        while prev >= 0 and not old_lines[prev].strip():
+            prev -= 1
+        if prev >= 0 and old_ahead[prev] == AHEAD_NEXT:
+            first = prev
+
+        start = min(first, len(old_starts) - 1)
+        while start > 0 and old_starts[start] is None:
+            start -= 1
+        if start < 0:
+            start = 0
+            stack = ['root']
+        else:
+            stack = list(old_starts[start])
+
+        frags = old_frags[:start]
+        starts = old_starts[:start]
+        ahead = old_ahead[:start]
+        starts.append(tuple(stack))
+        line = []
+        line_ahead = AHEAD_NONE
+        tail = None  # last token on the line which is not white-space
+        lineno = start
+
+        for tokens, moved in tokenize(
+                self.lexer, '\n'.join(lines[start:]), stack):
+            last = len(tokens) - 1
+            for i, (token, value) in enumerate(tokens):
+                style = self._style(token)
+                parts = value.split('\n')
+                if _looks_ahead(token, value):
+                    line_ahead = AHEAD_EOF
+                for j, part in enumerate(parts):
+                    if j:
+                        if line_ahead == AHEAD_NONE and tail in _NAMES:
+                            line_ahead = AHEAD_NEXT
+                        frags.append(line)
+                        ahead.append(line_ahead)
+                        line = []
+                        line_ahead = AHEAD_NONE
+                        tail = None
+                        lineno += 1
+                        if i == last and j == len(parts) - 1 and not part:
+                            state = tuple(stack)
+                        elif not moved and token in _SPLITTABLE:
+                            state = tuple(stack)
+                        else:
+                            state = None
+                        starts.append(state)
+
+                        old = lineno - delta
+                        if lineno >= end and state is not None and \
+                                0 <= old < len(old_starts) and \
+                                old_starts[old] == state:
+                            # converged; re-use the remaining lines
+                            del starts[-1]
+                            self._lines = lines
+                            self._frags = frags + old_frags[old:]
+                            self._starts = starts + old_starts[old:]
+                            self._ahead = ahead + old_ahead[old:]
+                            return
+                    if part:
+                        line.append((style, part))
+                        if token is not Whitespace:
+                            tail = token
+
+        frags.append(line)
+        ahead.append(line_ahead)
+        self._lines = lines
+        self._frags = frags
+        self._starts = starts
+        self._ahead = ahead
@@ -0,0 +1,249 @@
+'''Prompt history with scope and timing per entry and an indexed search.'''
+import datetime
+import json
+import os
+import threading
+import time
+from prompt_toolkit.history import History
+
+
+MAX_ENTRIES = 10000
+READ_BLOCK = 1 << 16
+
+
+class HistoryEntry:
+
+    __slots__ = ('ts', 'scope', 'duration', 'query')
+
+    def __init__(self, ts: float, scope, duration, query: str):
+        self.ts = ts
+        self.scope = scope
+        self.duration = duration
+        self.query = query
+
+    @classmethod
+    def from_json(cls, line: str):
+        d = json.loads(line)
+        return cls(d['ts'], d.get('scope'), d.get('duration'), d['query'])
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'ts': round(self.ts, 3),
+            'scope': self.scope,
+            'duration': None if self.duration is None else
+            round(self.duration, 6),
+            'query': self.query,
+        }, separators=(',', ':'))
+
+
+def _open(fn: str, mode: str):
+    # the history might contain secrets, only the user can read it
+    return open(
+        fn, mode, encoding='utf-8',
+        opener=lambda path, flags: os.open(path, flags, 0o600))
+
+
+def scope_key(scope):
+    """Return the same key for different ways to write a scope, for example
+    `//stuff`, `@:stuff` and `@collection:stuff`."""
+    if not scope:
+        return None
+    if scope.startswith('@'):
+        kind, _, name = scope[1:].partition(':')
+    else:
+        kind, _, name = scope[1:].partition('/')
+    return f'{kind[:1] or "c"}:{name}'
+
+
+def _trigrams(s: str) -> set:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class HistoryIndex:
+    """Entries (oldest first) with a trigram and a scope index.
+
+    A search for a text of at least three characters only checks the entries
+    which contain its least common trigram.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self._trigrams = {}  # trigram: [entry index, ...]
+        self._scopes = {}  # scope: [entry index, ...]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry: HistoryEntry):
+        idx = len(self.entries)
+        self.entries.append(entry)
+        for t in _trigrams(entry.query):
+            self._trigrams.setdefault(t, []).append(idx)
+        self._scopes.setdefault(scope_key(entry.scope), []).append(idx)
+
+    def search(
+            self,
+            text: str = '',
+            scope: str = None,
+            prefix: bool = False,
+            limit: int = 20) -> list:
+        """Return the most recent entries (newest first) which contain (or
+        start with) `text`, optionally only those in `scope`."""
+        candidates = range(len(self.entries))
+        scope = scope_key(scope)
+        postings = [] if scope is None else [self._scopes.get(scope, [])]
+        if len(text) >= 3:
+            postings.extend(self._trigrams.get(t, []) for t in _trigrams(text))
+        if postings:
+            candidates = min(postings, key=len)
+
+        found = []
+        for idx in reversed(candidates):
+            entry = self.entries[idx]
+            if scope is not None and scope_key(entry.scope) != scope:
+                continue
+            if not (entry.query.startswith(text) if prefix else
+                    text in entry.query):
+                continue
+            found.append(entry)
+            if len(found) == limit:
+                break
+        return found
+
+
+def _read_tail(fn: str, max_lines: int):
+    """Return the last `max_lines` lines of a file and whether the file has
+    more lines than these."""
+    with open(fn, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b''
+        while pos > 0 and data.count(b'\n') <= max_lines:
+            n = min(READ_BLOCK, pos)
+            pos -= n
+            f.seek(pos)
+            data = f.read(n) + data
+    lines = data.splitlines()
+    if pos > 0:
+        lines = lines[1:]  # might be incomplete
+    more = pos > 0 or len(lines) > max_lines
+    lines = lines[-max_lines:]
+    return [line.decode('utf-8', errors='replace') for line in lines], more
+
+
+def _read_file_history(fn: str) -> list:
+    """Read the entries of a prompt_toolkit FileHistory file."""
+    entries = []
+    lines = []
+    ts = 0.0
+
+    def add():
+        if lines:
+            entries.append(HistoryEntry(ts, None, None, ''.join(lines)[:-1]))
+
+    with open(fn, 'rb') as f:
+        for line in f:
+            line = line.decode('utf-8', errors='replace')
+            if line.startswith('+'):
+                lines.append(line[1:])
+                continue
+            add()
+            lines = []
+            if line.startswith('# '):
+                try:
+                    ts = datetime.datetime.fromisoformat(
+                        line[2:].strip()).timestamp()
+                except ValueError:
+                    pass
+        add()
+    return entries
+
+
+class HistoryStore(History):
+    """History in a file with a JSON line per entry.
+
+    Only the last `max_entries` entries are read (starting at the end of the
+    file), so the start-up time does not depend on the size of the file. The
+    file is compacted when it has grown to twice the size of those entries.
+    Use it wrapped in a ThreadedHistory to load the history in the
+    background.
+
+    The entry of a query is written when `finish()` is called with the time
+    it took to handle the query and the scope it ran in; `scope` is called to
+    get the scope of the query when it is stored, which is used when
+    `finish()` gets no scope.
+    """
+
+    def __init__(
+            self,
+            fn: str,
+            max_entries: int = MAX_ENTRIES,
+            scope=None,
+            legacy_fn: str = None):
+        super().__init__()
+        self.fn = fn
+        self.max_entries = max_entries
+        self.scope = scope
+        self.legacy_fn = legacy_fn
+        self.index = HistoryIndex()
+        self._lock = threading.Lock()
+        self._pending = None
+
+    def load_history_strings(self):
+        with self._lock:
+            self._load()
+            queries = [e.query for e in self.index.entries]
+        return reversed(queries)
+
+    def _load(self):
+        if not os.path.exists(self.fn):
+            if self.legacy_fn and os.path.exists(self.legacy_fn):
+                entries = _read_file_history(self.legacy_fn)
+                self._rewrite(entries[-self.max_entries:])
+            else:
+                return
+
+        lines, more = _read_tail(self.fn, self.max_entries)
+        entries = []
+        for line in lines:
+            try:
+                entries.append(HistoryEntry.from_json(line))
+            except (ValueError, KeyError, TypeError):
+                pass  # incomplete or empty line
+        for entry in entries:
+            self.index.add(entry)
+
+        size = sum(len(line) + 1 for line in lines)
+        if more and os.path.getsize(self.fn) > 2 * size:
+            self._rewrite(entries)
+
+    def _rewrite(self, entries: list):
+        tmp = f'{self.fn}.tmp'
+        with _open(tmp, 'w') as f:
+            for entry in entries:
+                f.write(entry.to_json() + '\n')
+        os.replace(tmp, self.fn)
+
+    def store_string(self, string: str):
+        self.finish(None)
+        scope = None if self.scope is None else self.scope()
+        self._pending = HistoryEntry(time.time(), scope, None, string)
+
+    def finish(self, duration, scope: str = None):
+        """Write the pending entry with the time it took and the scope it ran
+        in (for example the scope of `@:stuff <query>`)."""
+        entry = self._pending
+        if entry is None:
+            return
+        self._pending = None
+        entry.duration = duration
+        if scope is not None:
+            entry.scope = scope
+        with self._lock:
+            with _open(self.fn, 'a') as f:
+                f.write(entry.to_json() + '\n')
+            self.index.add(entry)
+
+    def search(self, text: str = '', scope: str = None, prefix: bool = False,
+               limit: int = 20) -> list:
+        with self._lock:
+            return self.index.search(text, scope, prefix, limit)
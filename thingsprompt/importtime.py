@@ -0,0 +1,68 @@
+'''Report the time spent on importing modules.
+
+Similar to `python -X importtime` but built-in, so it can be enabled with the
+--import-time argument and shows only the modules imported by the client.
+'''
+import builtins
+import importlib.util
+import sys
+import time
+
+
+class ImportTimer:
+    """Measure module imports by wrapping `builtins.__import__`.
+
+    Only the first import of a module is recorded; like `-X importtime` the
+    self time excludes the time spent on nested imports.
+    """
+
+    def __init__(self):
+        self.entries = []  # (depth, name, self, cumulative) in nanoseconds
+        self._depth = 0
+        self._nested = [0]
+        self._import = builtins.__import__
+
+    def install(self):
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        builtins.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(),
+                      level=0):
+        try:
+            package = globals.get('__package__') if level else None
+            resolved = importlib.util.resolve_name(
+                '.' * level + name, package)
+        except (AttributeError, ImportError, ValueError):
+            resolved = name
+        if resolved in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+
+        depth = self._depth
+        self._depth += 1
+        self._nested.append(0)
+        start = time.perf_counter_ns()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter_ns() - start
+            nested = self._nested.pop()
+            self._nested[-1] += cumulative
+            self._depth = depth
+            self.entries.append(
+                (depth, resolved, cumulative - nested, cumulative))
+
+    def report(self, file=sys.stderr):
+        self.uninstall()
+        print('import time: self [us] | cumulative | imported package',
+              file=file)
+        for depth, name, own, cumulative in self.entries:
+            print(
+                f'import time: {own // 1000:>9} | {cumulative // 1000:>10} | '
+                f'{"  " * depth}{name}',
+                file=file)
+        total = self._nested[0] / 1e6
+        print(
+            f'import time: {len(self.entries)} modules in {total:.1f} ms',
+            file=file)
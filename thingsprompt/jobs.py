@@ -0,0 +1,111 @@
+'''Background queries in the prompt.'''
+import asyncio
+import time
+
+
+def _consume(fut):
+    if not fut.cancelled():
+        fut.exception()
+
+
+def shielded_query(client, query: str, **kwargs):
+    """Return a query which can be cancelled by the caller.
+
+    The query itself is shielded as a query cannot be stopped once it is
+    sent.
+    """
+    fut = asyncio.ensure_future(client.query(query, **kwargs))
+    fut.add_done_callback(_consume)
+    return asyncio.shield(fut)
+
+
+class Job:
+
+    __slots__ = ('id', 'query', 'scope', 'task', 'start')
+
+    def __init__(self, job_id: int, query: str, scope: str = None):
+        self.id = job_id
+        self.query = query
+        self.scope = scope
+        self.task = None
+        self.start = time.perf_counter()
+
+    def __str__(self):
+        elapsed = time.perf_counter() - self.start
+        scope = f'{self.scope} ' if self.scope else ''
+        query = ' '.join(self.query.split())
+        if len(query) > 60:
+            query = f'{query[:57]}...'
+        return f'[{self.id}] {elapsed:.2f}s {scope}{query}'
+
+
+class Jobs:
+    """Queries running in the background while the prompt stays usable.
+
+    Each job is an asyncio task using the same connection as the prompt.
+    When a job is finished, the result is written using the `on_result`
+    coroutine function; writing results is serialized so output of jobs
+    finishing at the same time is not mixed.
+    """
+
+    def __init__(self, on_result):
+        self.on_result = on_result
+        self._jobs = {}
+        self._next_id = 1
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def start(self, client, query: str, scope: str, timeout) -> Job:
+        job = Job(self._next_id, query, scope or client.get_default_scope())
+        self._next_id += 1
+        self._jobs[job.id] = job
+        job.task = asyncio.ensure_future(self._run(job, client, timeout))
+        return job
+
+    async def _run(self, job, client, timeout):
+        try:
+            res = await shielded_query(
+                client, job.query, scope=job.scope, timeout=timeout)
+        except asyncio.CancelledError:
+            print(f'{job} cancelled')
+            raise
+        except Exception as e:
+            async with self._lock:
+                print(f'{job} failed')
+                print(f'{e.__class__.__name__}: {e}')
+        else:
+            async with self._lock:
+                print(f'{job} done')
+                await self.on_result(job, res)
+        finally:
+            del self._jobs[job.id]
+
+    def _select(self, job_id: int = None):
+        if job_id is None:
+            return list(self._jobs.values())
+        job = self._jobs.get(job_id)
+        if job is None:
+            print(f'no such job: {job_id}')
+            return []
+        return [job]
+
+    def list(self):
+        if not self._jobs:
+            print('no running jobs')
+        for job in self._jobs.values():
+            print(f'{job} running')
+
+    async def wait(self, job_id: int = None):
+        """Wait for one or all jobs; results are written by the jobs."""
+        tasks = [job.task for job in self._select(job_id)]
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def cancel(self, job_id: int = None):
+        tasks = [job.task for job in self._select(job_id)]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
@@ -0,0 +1,211 @@
+'''Pygments lexer for the ThingsDB language.'''
+from pygments.lexer import RegexLexer, include, bygroups
+from pygments.token import Comment, Keyword, Name, Number, String, Text, \
+    Operator, Punctuation, Whitespace, Error, _TokenType
+
+
+# methods and build-in functions, also used for tab completion
+METHODS = (
+    'first', 'last', 'then', 'else', 'load', 'at', 'again_in', 'again_at',
+    'err', 'cancel', 'closure', 'set_closure', 'args', 'set_args', 'owner',
+    'set_owner', 'equals', 'copy', 'dup', 'assign', 'week', 'weekday', 'yday',
+    'zone', 'len', 'call', 'doc', 'emit', 'extract', 'choice', 'code',
+    'format', 'msg', 'each', 'every', 'extend', 'extend_unique', 'filter',
+    'find', 'flat', 'find_index', 'has', 'index_of', 'count', 'sum',
+    'is_unique', 'unique', 'join', 'map', 'map_id', 'map_wrap', 'map_type',
+    'vmap', 'move', 'pop', 'push', 'fill', 'remove', 'replace', 'restrict',
+    'restriction', 'shift', 'sort', 'splice', 'to', 'add', 'one', 'clear',
+    'contains', 'ends_with', 'name', 'lower', 'replace', 'reverse',
+    'starts_with', 'split', 'test', 'trim', 'trim_left', 'trim_right', 'upper',
+    'del', 'ren', 'to_type', 'to_thing', 'get', 'id', 'keys', 'reduce', 'set',
+    'some', 'value', 'values', 'wrap', 'unshift', 'unwrap', 'search',
+)
+
+FUNCTIONS = (
+    'alt_raise', 'assert', 'base64_encode', 'base64_decode', 'bool', 'bytes',
+    'closure', 'datetime', 'deep', 'future', 'is_future', 'del_enum',
+    'del_type', 'room', 'is_room', 'task', 'tasks', 'is_task', 'is_email',
+    'is_url', 'is_tel', 'is_time_zone', 'timeit', 'enum', 'enum_info',
+    'enum_map', 'enums_info', 'err', 'regex', 'is_regex', 'change_id', 'float',
+    'has_enum', 'has_type', 'int', 'is_array', 'is_ascii', 'is_float',
+    'is_bool', 'is_bytes', 'is_closure', 'is_datetime', 'is_enum', 'is_err',
+    'is_mpdata', 'is_inf', 'is_int', 'is_list', 'is_nan', 'is_nil', 'is_raw',
+    'is_set', 'is_str', 'is_thing', 'is_timeval', 'is_tuple', 'is_utf8',
+    'json_dump', 'json_load', 'list', 'log', 'import', 'export', 'root',
+    'mod_enum', 'mod_type', 'new', 'new_type', 'now', 'raise', 'rand', 'range',
+    'randint', 'randstr', 'refs', 'rename_enum', 'set', 'set_enum', 'set_type',
+    'str', 'thing', 'timeval', 'try', 'type', 'type_assert', 'type_count',
+    'type_info', 'types_info', 'nse', 'wse', 'backup_info', 'backups_info',
+    'backups_ok', 'counters', 'del_backup', 'has_backup', 'new_backup',
+    'node_info', 'nodes_info', 'reset_counters', 'restart_module',
+    'set_log_level', 'shutdown', 'has_module', 'del_module', 'module_info',
+    'modules_info', 'new_module', 'deploy_module', 'rename_module',
+    'refresh_module', 'set_module_conf', 'set_module_scope',
+    'collections_info', 'del_collection', 'del_expired', 'del_node',
+    'del_token', 'del_user', 'grant', 'has_collection', 'has_node',
+    'has_token', 'has_user', 'new_collection', 'new_node', 'new_token',
+    'new_user', 'rename_collection', 'rename_user', 'restore', 'revoke',
+    'set_password', 'set_time_zone', 'set_default_deep', 'time_zones_info',
+    'user_info', 'users_info', 'del_procedure', 'has_procedure',
+    'new_procedure', 'mod_procedure', 'procedure_doc', 'procedure_info',
+    'procedures_info', 'rename_procedure', 'run', 'assert_err', 'auth_err',
+    'bad_data_err', 'cancelled_err', 'rename_type', 'forbidden_err',
+    'lookup_err', 'max_quota_err', 'node_err', 'num_arguments_err',
+    'operation_err', 'overflow_err', 'syntax_err', 'collection_info',
+    'type_err', 'value_err', 'zero_div_err', 'abs', 'ceil', 'cos', 'exp',
+    'floor', 'log10', 'log2', 'loge', 'pow', 'round', 'sin', 'sqrt', 'tan',
+    'is_module',
+)
+
+# followed by a bracket these are not function calls
+KEYWORDS = frozenset(('if', 'else', 'return', 'for', 'in', 'continue',
+                      'break'))
+
+_METHODS = frozenset(METHODS)
+_FUNCTIONS = frozenset(FUNCTIONS)
+
+
+def _method_call(lexer, match):
+    # a set lookup is much faster than a regular expression with all the
+    # method names as alternatives
+    dot, name = match.group(1, 2)
+    if name in _METHODS:
+        yield match.start(1), Name.Function, dot
+        yield match.start(2), Name.Function, name
+    else:
+        yield match.start(1), Name.Attribute, dot + name
+    yield match.start(3), Punctuation, '('
+
+
+def _function_call(lexer, match):
+    name = match.group(1)
+    tp = Name.Function if name in _FUNCTIONS else Name.Variable
+    yield match.start(1), tp, name
+    yield match.start(2), Punctuation, '('
+
+
+class ThingsDBLexer(RegexLexer):
+    """
+    Lexer for the ThingsDB programming language.
+
+    .. versionadded:: 2.9
+    """
+    name = 'ThingsDB'
+    aliases = ['ti', 'thingsdb']
+    filenames = ['*.ti']
+
+    tokens = {
+        'root': [
+            include('expression'),
+        ],
+        'expression': [
+            include('comments'),
+            include('whitespace'),
+
+            # numbers
+            (r'[-+]?0b[01]+', Number.Bin),
+            (r'[-+]?0o[0-8]+', Number.Oct),
+            (r'([-+]?0x[0-9a-fA-F]+)', Number.Hex),
+            (r'[-+]?[0-9]+', Number.Integer),
+            (r'[-+]?((inf|nan)([^0-9A-Za-z_]|$)|[0-9]*\.[0-9]+(e[+-][0-9]+)?)',
+             Number.Float),
+
+            # strings
+            (r'(?:"(?:[^"]*)")+', String.Double),
+            (r"(?:'(?:[^']*)')+", String.Single),
+            (r"(?:`(?:[^`]*)`)+", String.Backtick),
+
+            # literals
+            (r'(true|false|nil)\b', Keyword.Constant),
+
+            # name constants
+            (r'(FULL|USER|GRANT|CHANGE|JOIN|RUN|QUERY|'
+             r'DEBUG|INFO|WARNING|ERROR|CRITICAL|'
+             r'NO_IDS|INT_MIN|INT_MAX|MATH_E|MATH_PI)\b', Name.Constant),
+
+            # regular expressions
+            (r'(/[^/\\]*(?:\\.[^/\\]*)*/i?)', String.Regex),
+
+            # name, assignments and functions
+            include('names'),
+
+            (r'[(){}\[\],;]', Punctuation),
+            (r'[+\-*/%&|<>^!~@=:?]', Operator),
+        ],
+        'names': [
+            (r'(\.)([A-Za-z_][0-9A-Za-z_]*)(\()', _method_call),
+            (r'([A-Za-z_][0-9A-Za-z_]*)(\()', _function_call),
+            (r'(\.[A-Za-z_][0-9A-Za-z_]*)'
+             r'(\s*)(=)',
+             bygroups(Name.Attribute, Text, Operator)),
+            (r'\.[A-Za-z_][0-9A-Za-z_]*', Name.Attribute),
+            (r'([A-Za-z_][0-9A-Za-z_]*)(\s*)(=)',
+             bygroups(Name.Variable, Text, Operator)),
+            (r'[A-Za-z_][0-9A-Za-z_]*', Name.Variable),
+        ],
+        'whitespace': [
+            (r'\n', Whitespace),
+            (r'\s+', Whitespace),
+        ],
+        'comments': [
+            (r'//(.*?)(\n|$)', Comment.Single),
+            (r'/\*', Comment.Multiline, 'comment'),
+        ],
+        'comment': [
+            (r'[^*/]+', Comment.Multiline),
+            (r'/\*', Comment.Multiline, '#push'),
+            (r'\*/', Comment.Multiline, '#pop'),
+            (r'[*/]', Comment.Multiline),
+        ],
+    }
+
+
+def tokenize(lexer: RegexLexer, text: str, stack: list, pos: int = 0):
+    """Tokenize `text` from `pos` like RegexLexer.get_tokens_unprocessed().
+
+    Yields a list with (token, value) tuples per match together with a boolean
+    which is True when the match has changed the state. The given `stack` is
+    updated in place *before* the tokens of a match are yielded.
+    """
+    tokendefs = lexer._tokens
+    statetokens = tokendefs[stack[-1]]
+    while True:
+        for rexmatch, action, new_state in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                if action is None:
+                    tokens = []
+                elif type(action) is _TokenType:
+                    tokens = [(action, m.group())]
+                else:
+                    tokens = [(t, v) for _, t, v in action(lexer, m)]
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == '#pop':
+                                if len(stack) > 1:
+                                    stack.pop()
+                            elif state == '#push':
+                                stack.append(stack[-1])
+                            else:
+                                stack.append(state)
+                    elif isinstance(new_state, int):
+                        # pop, but keep at least one state on the stack
+                        del stack[max(new_state, 1 - len(stack)):]
+                    else:  # '#push'
+                        stack.append(stack[-1])
+                    statetokens = tokendefs[stack[-1]]
+                yield tokens, new_state is not None
+                break
+        else:
+            if pos >= len(text):
+                return
+            if text[pos] == '\n':
+                # at EOL, reset state to "root"
+                stack[:] = ['root']
+                statetokens = tokendefs['root']
+                yield [(Whitespace, '\n')], True
+            else:
+                yield [(Error, text[pos])], False
+            pos += 1
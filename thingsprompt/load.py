@@ -0,0 +1,179 @@
+'''Load rows from NDJSON or CSV in batches.'''
+import asyncio
+import csv
+import json
+import random
+import sys
+import time
+from thingsdb.exceptions import MaxQuotaError, NodeError
+
+
+BACKOFF_MIN = 0.5  # seconds to wait after the first overload error
+BACKOFF_MAX = 30.0
+MAX_ATTEMPTS = 10  # per batch, before the batch is considered failed
+PROGRESS_INTERVAL = 1.0
+
+# errors when ThingsDB is too busy; the batch is not applied and sent again
+OVERLOAD_ERRORS = (MaxQuotaError, NodeError)
+
+
+def read_rows(f, fmt: str):
+    """Yield the rows of a CSV file as dicts with strings, or the values of
+    a NDJSON file."""
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+        return
+    for lineno, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'line {lineno}: {e}')
+
+
+def read_batches(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Window:
+    """Number of batches in flight, adapted to the load of ThingsDB.
+
+    On an overload error the window is halved and new batches are held back
+    for an exponentially growing (randomized) time; after a window of
+    successful batches it grows by one again, up to `limit`.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = limit
+        self.backoff = 0.0
+        self.resume_at = 0.0
+        self._ok = 0
+
+    def overloaded(self) -> float:
+        """Shrink the window; returns the time to wait."""
+        self.size = max(1, self.size // 2)
+        self._ok = 0
+        self.backoff = min(BACKOFF_MAX, max(BACKOFF_MIN, self.backoff * 2))
+        delay = self.backoff * random.uniform(0.5, 1.0)
+        self.resume_at = max(self.resume_at, time.monotonic() + delay)
+        return delay
+
+    def success(self):
+        self.backoff /= 2
+        self._ok += 1
+        if self._ok >= self.size and self.size < self.limit:
+            self.size += 1
+            self._ok = 0
+
+
+class Loader:
+
+    def __init__(self, client, code: str, scope: str, in_flight: int,
+                 **kwargs):
+        self.client = client
+        self.code = code
+        self.scope = scope
+        self.kwargs = kwargs
+        self.window = Window(max(1, in_flight))
+        self.rows = 0
+        self.failed = 0
+
+    async def _send(self, first: int, batch: list):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                # a lost connection is not retried as the batch might have
+                # been loaded
+                await self.client.query(
+                    self.code,
+                    scope=self.scope,
+                    retry=False,
+                    rows=batch,
+                    **self.kwargs)
+            except OVERLOAD_ERRORS as e:
+                if attempt == MAX_ATTEMPTS:
+                    err = e
+                    break
+                await asyncio.sleep(self.window.overloaded())
+            except Exception as e:
+                err = e
+                break
+            else:
+                self.window.success()
+                self.rows += len(batch)
+                return
+        self.failed += 1
+        print(f'rows {first}-{first + len(batch) - 1}: '
+              f'{err.__class__.__name__}: {err}', file=sys.stderr)
+
+    async def run(self, batches):
+        running = set()
+        first = 1
+        try:
+            for batch in batches:
+                while len(running) >= self.window.size:
+                    _, running = await asyncio.wait(
+                        running, return_when=asyncio.FIRST_COMPLETED)
+                delay = self.window.resume_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                running.add(asyncio.ensure_future(self._send(first, batch)))
+                first += len(batch)
+        finally:
+            if running:
+                await asyncio.wait(running)
+
+
+async def _progress(loader: Loader, start: float):
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        elapsed = time.perf_counter() - start
+        print(f'\rloaded {loader.rows} rows... '
+              f'{loader.rows / elapsed:.0f} rows/s, '
+              f'{loader.window.size} batch(es) in flight\x1b[K',
+              end='', file=sys.stderr, flush=True)
+
+
+async def do_load(client, f, fmt: str, code: str, procedure: str,
+                  scope: str, batch_size: int, in_flight: int) -> int:
+    """Load the rows from file `f` in batches; the rows of a batch are
+    available as `rows` in `code`, or are the argument for `procedure`.
+    Returns the number of failed batches."""
+    if procedure is not None:
+        loader = Loader(
+            client, 'run(procedure, rows);', scope, in_flight,
+            procedure=procedure)
+    else:
+        loader = Loader(client, code, scope, in_flight)
+
+    start = time.perf_counter()
+    progress = None
+    if sys.stderr.isatty():
+        progress = asyncio.ensure_future(_progress(loader, start))
+    try:
+        await loader.run(
+            read_batches(read_rows(f, fmt), max(1, batch_size)))
+    except Exception as e:
+        # reading the input failed; the batches sent so far are loaded
+        print(f'{e.__class__.__name__}: {e}', file=sys.stderr)
+        loader.failed += 1
+    finally:
+        if progress is not None:
+            progress.cancel()
+            print('\r\x1b[K', end='', file=sys.stderr, flush=True)
+
+    duration = time.perf_counter() - start
+    rate = loader.rows / duration if duration > 0 else 0.0
+    print(f'loaded {loader.rows} rows in {duration:.2f}s '
+          f'({rate:.0f} rows/s)')
+    if loader.failed:
+        print(f'{loader.failed} failed batch(es)', file=sys.stderr)
+    return loader.failed
@@ -0,0 +1,111 @@
+'''Manifest with block hashes to verify export files.'''
+import datetime
+import hashlib
+import json
+import os
+
+
+MANIFEST_VERSION = 1
+MANIFEST_EXT = '.manifest.json'
+BLOCK_SIZE = 1 << 20  # 1 MiB
+HASH = 'sha256'
+
+
+def manifest_fn(fn: str) -> str:
+    return f'{fn}{MANIFEST_EXT}'
+
+
+class BlockHasher:
+    """Hash data per block of `block_size` bytes, as it is written."""
+
+    def __init__(self, block_size: int = BLOCK_SIZE):
+        self.block_size = block_size
+        self.blocks = []
+        self.size = 0
+        self._hash = hashlib.new(HASH)
+        self._fill = 0
+
+    def update(self, data):
+        view = memoryview(data).cast('B')
+        self.size += len(view)
+        while view:
+            n = min(len(view), self.block_size - self._fill)
+            self._hash.update(view[:n])
+            self._fill += n
+            view = view[n:]
+            if self._fill == self.block_size:
+                self._next()
+
+    def _next(self):
+        self.blocks.append(self._hash.hexdigest())
+        self._hash = hashlib.new(HASH)
+        self._fill = 0
+
+    def finish(self) -> list:
+        if self._fill:
+            self._next()
+        return self.blocks
+
+
+class HashedFile:
+    """File wrapper which hashes all data written to the file."""
+
+    def __init__(self, f, hasher: BlockHasher):
+        self.f = f
+        self.hasher = hasher
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+def write_manifest(fn: str, hasher: BlockHasher, **info):
+    """Write the manifest for export file `fn`; `info` is stored as is."""
+    manifest = {
+        'manifest': MANIFEST_VERSION,
+        **info,
+        'created': datetime.datetime.now(
+            datetime.timezone.utc).isoformat(timespec='seconds'),
+        'file_size': hasher.size,
+        'hash': HASH,
+        'block_size': hasher.block_size,
+        'blocks': hasher.finish(),
+    }
+    tmp = f'{manifest_fn(fn)}.partial'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_fn(fn))
+
+
+def read_manifest(fn: str):
+    """Return the manifest for export file `fn`, or None if it has none."""
+    try:
+        with open(manifest_fn(fn), 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise ValueError(f'invalid manifest for `{fn}` ({e})')
+    if manifest.get('manifest') != MANIFEST_VERSION:
+        raise ValueError(f'unsupported manifest version for `{fn}`')
+    return manifest
+
+
+def verify(fn: str, view, manifest: dict):
+    """Verify the file content block by block; raises ValueError at the
+    first block which does not match."""
+    if len(view) != manifest['file_size']:
+        raise ValueError(
+            f'file `{fn}` has {len(view)} bytes, expected '
+            f'{manifest["file_size"]} bytes')
+    block_size = manifest['block_size']
+    for idx, expected in enumerate(manifest['blocks']):
+        with view[idx * block_size:(idx + 1) * block_size] as block:
+            digest = hashlib.new(manifest['hash'], block).hexdigest()
+        if digest != expected:
+            raise ValueError(
+                f'file `{fn}` is corrupt; block {idx} '
+                f'(offset {idx * block_size}) does not match the manifest')
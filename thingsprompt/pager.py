@@ -0,0 +1,280 @@
+'''Pager for browsing large query results.'''
+from prompt_toolkit.application import Application
+from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.filters import Condition
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.layout import HSplit, Layout, Window
+from prompt_toolkit.layout.containers import ConditionalContainer
+from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl
+from prompt_toolkit.layout.controls import UIContent, UIControl
+from .render import BinEncode
+
+
+INDENT = ' ' * 4
+
+
+def exceeds(res, limit: int) -> bool:
+    """Return True if `res` renders to more than `limit` lines.
+
+    Stops counting as soon as the limit is reached so this is cheap, even for
+    huge results.
+    """
+    count = 0
+    stack = [res]
+    while stack:
+        val = stack.pop()
+        count += 1
+        if count > limit:
+            return True
+        if isinstance(val, dict):
+            count += 1
+            stack.extend(val.values())
+        elif isinstance(val, list):
+            count += 1
+            stack.extend(val)
+    return False
+
+
+class Line:
+
+    __slots__ = ('depth', 'text', 'path', 'keys')
+
+    def __init__(self, depth: int, text: str, path: tuple = None,
+                 keys: tuple = ()):
+        self.depth = depth
+        self.text = text
+        self.path = path  # set for lines opening a dict or list
+        self.keys = keys  # dict keys and list indexes to the value
+
+
+class LineModel:
+    """Lazily materialized lines of a JSON rendered result.
+
+    Lines are generated from the result structure only up to the highest line
+    which is requested, so the cost of showing a window does not depend on the
+    size of the result. Folded dicts and lists render as a single line.
+    """
+
+    def __init__(self, res, sort_keys: bool = True):
+        self.res = res
+        self.sort_keys = sort_keys
+        self.folded = set()
+        self._encode = BinEncode().encode
+        self.reset()
+
+    def reset(self):
+        self._lines = []
+        self._gen = self._walk(self.res, '', 0, (), (), '')
+        self._done = False
+
+    def get(self, idx: int):
+        while not self._done and len(self._lines) <= idx:
+            try:
+                self._lines.append(next(self._gen))
+            except StopIteration:
+                self._done = True
+        return self._lines[idx] if idx < len(self._lines) else None
+
+    def count(self) -> int:
+        """Total number of lines; this materializes all lines."""
+        while not self._done:
+            self.get(len(self._lines))
+        return len(self._lines)
+
+    def toggle(self, idx: int) -> bool:
+        line = self.get(idx)
+        if line is None or line.path is None:
+            return False
+        self.folded ^= {line.path}
+        self.reset()
+        return True
+
+    def find(self, text: str, start: int):
+        idx = start
+        while True:
+            line = self.get(idx)
+            if line is None:
+                return None
+            if text in line.text:
+                return idx
+            idx += 1
+
+    def _items(self, val):
+        if isinstance(val, dict):
+            keys = sorted(val) if self.sort_keys else val
+            return ((k, f'{self._encode(k)}: ', val[k]) for k in keys)
+        return ((i, '', v) for i, v in enumerate(val))
+
+    def _walk(self, val, prefix: str, depth: int, path: tuple, keys: tuple,
+              comma: str):
+        if not isinstance(val, (dict, list)) or not val:
+            yield Line(depth, f'{prefix}{self._encode(val)}{comma}',
+                       keys=keys)
+            return
+
+        o, c = ('{', '}') if isinstance(val, dict) else ('[', ']')
+        if path in self.folded:
+            yield Line(
+                depth,
+                f'{prefix}{o}...{c}{comma}  ({len(val)} items)',
+                path,
+                keys)
+            return
+
+        yield Line(depth, f'{prefix}{o}', path, keys)
+        last = len(val) - 1
+        for i, (key, text, v) in enumerate(self._items(val)):
+            yield from self._walk(
+                v, text, depth + 1, path + (i,), keys + (key,),
+                '' if i == last else ',')
+        yield Line(depth, f'{c}{comma}')
+
+
+class PagerControl(UIControl):
+
+    def __init__(self, model: LineModel, highlight=None):
+        self.model = model
+        self.highlight = highlight  # optional function returning a style
+        self.top = 0
+        self.cursor = 0
+        self.height = 1
+
+    def is_focusable(self) -> bool:
+        return True
+
+    def move(self, n: int):
+        cursor = max(0, self.cursor + n)
+        while cursor > 0 and self.model.get(cursor) is None:
+            cursor -= 1
+        self.goto(cursor)
+
+    def goto(self, idx: int):
+        self.cursor = idx
+        if self.cursor < self.top:
+            self.top = self.cursor
+        elif self.cursor >= self.top + self.height:
+            self.top = self.cursor - self.height + 1
+
+    def create_content(self, width: int, height: int) -> UIContent:
+        self.height = height
+        self.goto(self.cursor)
+        lines = []
+        for idx in range(self.top, self.top + height):
+            line = self.model.get(idx)
+            if line is None:
+                break
+            if idx == self.cursor:
+                style = 'reverse'
+            elif self.highlight is not None:
+                style = self.highlight(line)
+            else:
+                style = ''
+            lines.append([(style, f'{INDENT * line.depth}{line.text}')])
+
+        return UIContent(
+            get_line=lambda i: lines[i] if i < len(lines) else [],
+            line_count=len(lines))
+
+
+def add_navigation(kb: KeyBindings, control: PagerControl, filter=True):
+    """Add key bindings to move, page and fold to `kb`."""
+    model = control.model
+
+    @kb.add('down', filter=filter)
+    @kb.add('j', filter=filter)
+    def _(event):
+        control.move(1)
+
+    @kb.add('up', filter=filter)
+    @kb.add('k', filter=filter)
+    def _(event):
+        control.move(-1)
+
+    @kb.add('pagedown', filter=filter)
+    @kb.add(' ', filter=filter)
+    def _(event):
+        control.move(control.height)
+
+    @kb.add('pageup', filter=filter)
+    @kb.add('b', filter=filter)
+    def _(event):
+        control.move(-control.height)
+
+    @kb.add('home', filter=filter)
+    @kb.add('g', filter=filter)
+    def _(event):
+        control.goto(0)
+
+    @kb.add('end', filter=filter)
+    @kb.add('G', filter=filter)
+    def _(event):
+        control.goto(model.count() - 1)
+
+    @kb.add('enter', filter=filter)
+    @kb.add('o', filter=filter)
+    def _(event):
+        model.toggle(control.cursor)
+
+
+async def page(res, sort_keys: bool = True):
+    model = LineModel(res, sort_keys)
+    control = PagerControl(model)
+    search = Buffer(multiline=False)
+    state = {'searching': False, 'text': '', 'msg': ''}
+    kb = KeyBindings()
+    browsing = Condition(lambda: not state['searching'])
+
+    def find_next(start: int):
+        idx = model.find(state['text'], start) if state['text'] else None
+        if idx is None:
+            state['msg'] = f'pattern not found: {state["text"]}'
+        else:
+            state['msg'] = ''
+            control.goto(idx)
+
+    @kb.add('q', filter=browsing)
+    @kb.add('c-c')
+    def _(event):
+        event.app.exit()
+
+    add_navigation(kb, control, browsing)
+
+    @kb.add('/', filter=browsing)
+    def _(event):
+        state['searching'] = True
+        search.reset()
+        event.app.layout.focus(search)
+
+    @kb.add('n', filter=browsing)
+    def _(event):
+        find_next(control.cursor + 1)
+
+    @kb.add('enter', filter=~browsing)
+    @kb.add('escape', filter=~browsing)
+    def _(event):
+        state['searching'] = False
+        event.app.layout.focus(control)
+        if event.key_sequence[0].key != 'escape':
+            state['text'] = search.text
+            find_next(control.cursor)
+
+    def status():
+        if state['msg']:
+            return [('reverse', f' {state["msg"]} ')]
+        return [('reverse', (
+            f' line {control.cursor + 1} | j/k: move, space/b: page, '
+            f'enter: fold/unfold, /: search, n: next, q: quit '))]
+
+    layout = Layout(HSplit([
+        Window(control),
+        ConditionalContainer(
+            Window(FormattedTextControl(status), height=1),
+            filter=browsing),
+        ConditionalContainer(
+            Window(BufferControl(search), height=1,
+                   get_line_prefix=lambda *_: '/'),
+            filter=~browsing),
+    ]), focused_element=control)
+
+    app = Application(layout=layout, key_bindings=kb, full_screen=True)
+    await app.run_async()
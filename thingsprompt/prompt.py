@@ -0,0 +1,432 @@
+'''Interactive prompt.
+
+Only imported when the prompt is started, so the export, import and run
+sub-commands do not have to load prompt_toolkit and pygments.
+'''
+import os
+import re
+import functools
+import time
+from thingsdb.exceptions import ThingsDBError
+from prompt_toolkit import __version__ as ptk_version
+from prompt_toolkit.filters import Condition
+from prompt_toolkit.history import InMemoryHistory
+from prompt_toolkit.history import ThreadedHistory
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.shortcuts import PromptSession
+from .cache import ResultCache, is_read_only
+from .completer import ThingsDBCompleter, WORD
+from .fanout import write_results
+from .history import HistoryStore
+from .jobs import Jobs
+from .pager import exceeds, page
+from .render import Renderer
+from .rooms import EventWriter, join_rooms, room_arg
+from .timing import Profiler, fmt_ms, timeit
+from .watch import watch
+from .thingsprompt import __version__
+
+
+PTK3 = ptk_version.startswith('3.')
+USE_FUN = re.compile(r'^\s*(@\s?[\:\/0-9a-zA-Z_]+)\s*$')
+SCOPE_QUERY = re.compile(r'^\s*(@[\:0-9a-zA-Z_]+)\s+(.*)$')
+PROFILE = re.compile(r'^\s*\\profile(?:\s+(on|off|counters))?\s*$')
+TIMEIT = re.compile(r'^\s*\\timeit\s+([0-9]+)\s+(.*)$', re.DOTALL)
+WATCH = re.compile(r'^\s*\\watch\s+([0-9]*\.?[0-9]+)\s+(.*)$', re.DOTALL)
+JOB_CMD = re.compile(r'^\s*\\(jobs|wait|cancel)(?:\s+%?([0-9]+))?\s*$')
+FANOUT_QUERY = re.compile(r'^\s*@\*([\:0-9a-zA-Z_]+)\s+(.*)$', re.DOTALL)
+ROOM_CMD = re.compile(r'^\s*\\(join|leave)(?:\s+(.*?))?\s*$', re.DOTALL)
+CACHE_CMD = re.compile(r'^\s*\\cache\s+(on|off|stats|clear)\s*$')
+HISTORY_CMD = re.compile(
+    r'^\s*\\history(?:\s+(@\S+|/\S*/\S+))?(?:\s+(\^)?(.*?))?\s*$',
+    re.DOTALL)
+BACKGROUND = re.compile(r'^(.*?)\s*(?<!&)&\s*$', re.DOTALL)
+
+TAB = ' ' * 4
+WAIT_CONNECTED = 10  # seconds a query waits for a lost connection
+HELP = f'''
+Version:
+    {__version__}
+
+Special commands:
+
+?
+    This help.
+<@scope>
+    Switch to another scope, for example: @ //stuff
+<@scope> <query>
+    Run a single query in a given scope, for example: @n node_info();
+CTRL + n
+    Insert a new line.
+TAB
+    Complete functions, methods, procedures, types, enums and collections.
+\\profile [on|off|counters]
+    Toggle profiling; shows the query, decode and render time and the size
+    of the response. With `counters`, changes in counters() are shown too.
+\\timeit <n> [@scope] <query>
+    Run a query n times and show the p50, p95 and p99 latency.
+\\watch <seconds> [@scope] <query>
+    Run a query on an interval and highlight the changes; q to stop.
+<@*scope> <query>
+    Run a query in a given scope on all nodes, for example: @*n counters();
+<query> &
+    Run a query in the background; the result is shown when finished.
+\\jobs
+    List the queries running in the background.
+\\wait [job]
+    Wait for a background query, or for all when no job is given.
+\\cancel [job]
+    Cancel a background query, or all when no job is given.
+\\join <room> [<room> ...]
+    Join rooms in the current scope and show the events as NDJSON.
+\\leave [<room> ...]
+    Leave the given rooms, or all joined rooms.
+\\cache on|off|stats|clear
+    Toggle the cache for results of read-only queries, show statistics or
+    clear the cache.
+\\history [@scope] [[^]text]
+    Search the history for queries containing text (or starting with text
+    when it starts with ^), optionally only those run in a given scope.
+'''
+
+bindings = KeyBindings()
+session = None
+
+
+@Condition
+def is_active():
+    return session.multiline
+
+
+def on_enter_new_line(event):
+    last_enter_idx = event.app.current_buffer.text.rfind('\n')
+    last_line = event.app.current_buffer.text[last_enter_idx+1:].rstrip()
+
+    idx = 0
+    for idx, c in enumerate(last_line):
+        if not c.isspace():
+            break
+
+    indent = last_line[:idx]
+
+    if last_line and last_line[-1] in ('{', '(', '['):
+        indent += TAB
+
+    event.app.current_buffer.insert_text('\n' + indent)
+
+
+@bindings.add('tab')
+def _(event):
+    """Complete the word before the cursor or insert TAB"""
+    buffer = event.app.current_buffer
+    if buffer.complete_state:
+        buffer.complete_next()
+    elif WORD.search(buffer.document.text_before_cursor):
+        buffer.start_completion(select_first=False)
+    else:
+        buffer.insert_text(TAB)
+
+
+@bindings.add('c-n')
+def _(event):
+    on_enter_new_line(event)
+
+
+@bindings.add('backspace')
+def _(event):
+    buffer = event.app.current_buffer
+    text = buffer.text[:buffer.cursor_position]
+    indent = len(text) - len(text.rstrip(' '))
+    if indent and indent % 4 == 0:
+        for _ in range(4):
+            buffer.delete_before_cursor()
+    else:
+        buffer.delete_before_cursor()
+
+
+def fmt_entry(entry) -> str:
+    ts = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.ts))
+    duration = '-' if entry.duration is None else fmt_ms(entry.duration)
+    scope = entry.scope or '-'
+    query = ' '.join(entry.query.split())
+    return f'{ts}  {scope:<12}  {duration:>10}  {query}'
+
+
+def set_prompt(client, session, hide_connection_info):
+    scope = client.get_default_scope()
+    if hide_connection_info:
+        title = f'({scope})'
+    else:
+        title = f'{client.connection_info()} ({scope})'
+    session.message = f'{title}> '
+
+
+async def prompt_loop(client, args, fanout=None):
+    global session
+    path = os.path.join(os.path.expanduser('~'), '.config', 'ThingsPrompt')
+    store = None
+    try:
+        if not os.path.exists(path):
+            os.mkdir(path, 0o700)
+        store = HistoryStore(
+            os.path.join(path, 'history.jsonl'),
+            max_entries=args.history_size,
+            scope=client.get_default_scope,
+            legacy_fn=os.path.join(path, 'history'))
+        history = ThreadedHistory(store)
+    except Exception:
+        history = InMemoryHistory()
+
+    completer = ThingsDBCompleter(client)
+    completer.refresh()
+
+    if args.style == 'none':
+        session = PromptSession(
+            history=history,
+            completer=completer,
+            complete_while_typing=False)
+    else:
+        # pygments styles are only loaded when highlighting is enabled
+        from prompt_toolkit.styles.pygments import style_from_pygments_cls
+        from pygments.styles import get_style_by_name
+        from .highlight import IncrementalLexer
+        style = style_from_pygments_cls(get_style_by_name(args.style))
+        session = PromptSession(
+            history=history,
+            completer=completer,
+            complete_while_typing=False,
+            lexer=IncrementalLexer(),
+            style=style)
+    session.client = client
+
+    if PTK3:
+        aprompt = functools.partial(
+            session.prompt_async,
+            key_bindings=bindings)
+    else:
+        aprompt = functools.partial(
+            session.prompt,
+            async_=True,
+            key_bindings=bindings)
+
+    set_prompt(client, session, args.hide_connection_info)
+
+    renderer = Renderer(
+        compact=args.compact,
+        sort_keys=not args.unsorted,
+        stream=args.stream,
+        max_size=args.max_output)
+
+    profiler = Profiler(enabled=args.profile)
+    cache = ResultCache(
+        enabled=args.cache,
+        ttl=args.cache_ttl,
+        max_size=args.cache_size << 20)
+
+    async def show_job(job, res):
+        completer.on_query(job.query, job.scope)
+        await renderer.write(res)
+
+    jobs = Jobs(show_job)
+    rooms = {}  # joined rooms by room Id
+    events = EventWriter()
+
+    received = time.perf_counter()
+    while True:
+        ran_in = None  # scope of the query for the history
+        try:
+            query = await aprompt()
+            received = time.perf_counter()
+
+            if query is None:
+                continue
+
+            if query.strip() == '?':
+                print(HELP)
+                continue
+
+            use = USE_FUN.match(query)
+            if use:
+                scope = use.group(1)
+                scope = scope.strip('\'"')
+                if scope[1] == ' ':
+                    scope = scope[2:]
+
+                client.set_default_scope(scope)
+                ran_in = scope
+                set_prompt(client, session, args.hide_connection_info)
+                completer.refresh(scope)
+                cache.invalidate()
+                continue
+
+            room_cmd = ROOM_CMD.match(query)
+            if room_cmd:
+                cmd, names = room_cmd.group(1), (room_cmd.group(2) or '')
+                names = names.split()
+                if cmd == 'join' and not names:
+                    print('usage: \\join <room> [<room> ...]')
+                    continue
+                if cmd == 'join':
+                    joined, _ = await join_rooms(client, names, None, events)
+                    for room in joined:
+                        prev = rooms.get(room.id)
+                        if prev is not None:
+                            prev.done.set_result(None)
+                        rooms[room.id] = room
+                        room.done.add_done_callback(
+                            lambda _, r=room: rooms.get(r.id) is r and
+                            rooms.pop(r.id))
+                    continue
+                ids = [room_arg(name) for name in names] or list(rooms)
+                for room_id in ids:
+                    room = rooms.pop(room_id, None)
+                    if room is None:
+                        print(f'not joined: {room_id}')
+                        continue
+                    try:
+                        await room.leave()
+                    except Exception as e:
+                        print(f'{e.__class__.__name__}: {e}')
+                continue
+
+            cache_cmd = CACHE_CMD.match(query)
+            if cache_cmd:
+                cmd = cache_cmd.group(1)
+                if cmd in ('on', 'off'):
+                    cache.enabled = cmd == 'on'
+                    cache.invalidate()
+                elif cmd == 'clear':
+                    cache.clear()
+                print(cache.stats())
+                continue
+
+            history_cmd = HISTORY_CMD.match(query)
+            if history_cmd:
+                if store is None:
+                    print('history search is not available')
+                    continue
+                scope, prefix, text = history_cmd.groups()
+                for entry in reversed(store.search(
+                        text or '', scope, prefix=bool(prefix))):
+                    print(fmt_entry(entry))
+                continue
+
+            profile = PROFILE.match(query)
+            if profile:
+                print(profiler.toggle(profile.group(1)))
+                continue
+
+            job_cmd = JOB_CMD.match(query)
+            if job_cmd:
+                cmd, job_id = job_cmd.groups()
+                job_id = None if job_id is None else int(job_id)
+                if cmd == 'jobs':
+                    jobs.list()
+                elif cmd == 'wait':
+                    await jobs.wait(job_id)
+                else:
+                    await jobs.cancel(job_id)
+                continue
+
+            fan_query = FANOUT_QUERY.match(query)
+            if fan_query and fanout is not None:
+                scope, query = f'@{fan_query.group(1)}', fan_query.group(2)
+                ran_in = scope
+                if not is_read_only(query):
+                    cache.invalidate()
+                results = await fanout.query(query, scope, args.timeout)
+                await write_results(results, renderer)
+                continue
+
+            repeat = TIMEIT.match(query)
+            if repeat:
+                n, query = int(repeat.group(1)), repeat.group(2)
+
+            watching = WATCH.match(query)
+            if watching:
+                interval, query = float(watching.group(1)), watching.group(2)
+
+            background = None if repeat or watching \
+                else BACKGROUND.match(query)
+            if background:
+                query = background.group(1)
+
+            scope = SCOPE_QUERY.match(query)
+            if scope:
+                query = scope.group(2)
+                scope = scope.group(1)
+            else:
+                scope = None
+
+            cacheable = is_read_only(query)
+            if not cacheable:
+                cache.invalidate()
+            cacheable = cacheable and cache.enabled and not background
+            cache_scope = ran_in = scope or client.get_default_scope()
+
+            # queries wait for the reconnect (see ReconnectClient), but not
+            # longer than the timeout so a down node does not hang the prompt
+            wait = args.timeout or WAIT_CONNECTED
+            if not client.is_connected():
+                print('not connected, waiting for the connection...')
+
+            if background:
+                print(jobs.start(client, query, scope, args.timeout))
+                continue
+
+            if watching:
+                if PTK3:
+                    await watch(
+                        client, query, scope, interval, args.timeout,
+                        sort_keys=not args.unsorted)
+                else:
+                    print('watch requires prompt_toolkit 3')
+                continue
+
+            if repeat:
+                try:
+                    print(await timeit(
+                        client, n, query, scope, args.timeout))
+                except (ThingsDBError, ConnectionError) as e:
+                    print(f'{e.__class__.__name__}: {e}')
+                continue
+
+            if cacheable and not repeat:
+                out = cache.get(cache_scope, query)
+                if out is not None:
+                    await renderer.write_text(out)
+                    continue
+
+            stats = await profiler.begin(client)
+            try:
+                res = await client.query(
+                    query,
+                    scope=scope,
+                    timeout=args.timeout,
+                    wait=wait)
+            except (ThingsDBError, ConnectionError) as e:
+                print(f'{e.__class__.__name__}: {e}')
+            else:
+                profiler.received(stats, res)
+                completer.on_query(query, scope)
+                if PTK3 and args.pager and exceeds(res, args.pager):
+                    await page(res, sort_keys=not args.unsorted)
+                elif cacheable:
+                    start = time.perf_counter()
+                    out = await renderer.write(res, collect=True)
+                    cache.put(cache_scope, query, out)
+                    profiler.rendered(stats, start)
+                else:
+                    start = time.perf_counter()
+                    await renderer.write(res)
+                    profiler.rendered(stats, start)
+            await profiler.end(client, stats)
+
+        except (EOFError, KeyboardInterrupt):
+            if jobs:
+                print(f'cancelling {len(jobs)} background job(s)')
+                await jobs.cancel()
+            return
+        finally:
+            if store is not None:
+                store.finish(time.perf_counter() - received, ran_in)
@@ -0,0 +1,164 @@
+'''Client which survives lost connections (for example a node restart).'''
+import asyncio
+import logging
+import time
+from thingsdb.client import Client
+
+
+PING_TIMEOUT = 5  # seconds before a keepalive ping is considered lost
+POLL_INTERVAL = 0.1  # check for the connection while waiting for a reconnect
+RETRIES = 3  # times a request is sent again after a lost connection
+
+
+class ConnectionLost(ConnectionError):
+    """The connection was lost after sending a request."""
+
+
+def _consume(fut):
+    if not fut.cancelled():
+        fut.exception()
+
+
+class ReconnectClient(Client):
+    """Client which reconnects and waits for the connection.
+
+    The connection is restored with the reconnect loop of the ThingsDB client
+    (exponential back-off up to one minute, re-authenticate and re-join the
+    rooms). The default client also re-sends requests which were cancelled by
+    a lost connection, which could apply a change twice; here only requests
+    which were never sent and queries with `retry=True` are sent again. Other
+    queries fail with ConnectionLost as it is unknown if they were applied;
+    even a query which looks read-only might call a procedure or a method
+    with side effects, so the caller has to know the query is read-only.
+
+    After authentication a keepalive ping is sent every `keepalive` seconds
+    while the connection is idle, so a connection which silently stopped
+    working is replaced before it is used.
+    """
+
+    def __init__(self, keepalive: float = 30.0, retries: int = RETRIES,
+                 **kwargs):
+        super().__init__(auto_reconnect=True, **kwargs)
+        # re-sending requests is handled by query()
+        self._write_pkg = self._write
+        self.keepalive = keepalive
+        self.retries = retries
+        self.pending = 0
+        self._keepalive_task = None
+
+    async def authenticate(self, *auth, timeout=10):
+        await super().authenticate(*auth, timeout=timeout)
+        if self.keepalive and self._keepalive_task is None:
+            self._keepalive_task = asyncio.ensure_future(self._keepalive())
+
+    def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        super().close()
+
+    async def wait_connected(self, timeout=None):
+        """Wait until the connection is restored; raises ConnectionError when
+        this takes longer than `timeout` seconds or when the client is not
+        connected at all."""
+        if self.is_connected():
+            return
+        if not self._pool or not self._reconnect:
+            # never connected, or closed
+            raise ConnectionError('no connection')
+        self.reconnect()  # no-op when already reconnecting
+        start = time.monotonic()
+        while not self.is_connected():
+            if timeout and time.monotonic() - start > timeout:
+                raise ConnectionError('no connection')
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _send(self, coro):
+        # the request future is cancelled when the connection is lost; this
+        # must not be confused with a cancel of the calling task
+        fut = asyncio.ensure_future(coro)
+        fut.add_done_callback(_consume)
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            if fut.cancelled():
+                raise ConnectionLost('connection lost')
+            raise
+
+    async def query(
+            self,
+            code: str,
+            scope=None,
+            timeout=None,
+            skip_strip_code: bool = False,
+            retry: bool = False,
+            wait=None,
+            **kwargs):
+        """Query ThingsDB; waits for the connection when it is lost.
+
+        Use `retry=True` to run the query again when the connection is lost
+        after it was sent; only for queries which do not change anything.
+        The connection is awaited for at most `wait` seconds (default
+        `timeout`; without both it waits until the connection is restored).
+        """
+        return await self._request(
+            lambda: super(ReconnectClient, self).query(
+                code, scope, timeout, skip_strip_code, **kwargs),
+            timeout if wait is None else wait,
+            retry)
+
+    async def run(
+            self,
+            procedure: str,
+            *args,
+            scope=None,
+            timeout=None,
+            retry: bool = False,
+            wait=None,
+            **kwargs):
+        """Run a procedure; waits for the connection when it is lost, like
+        query()."""
+        return await self._request(
+            lambda: super(ReconnectClient, self).run(
+                procedure, *args, scope=scope, timeout=timeout, **kwargs),
+            timeout if wait is None else wait,
+            retry)
+
+    async def _request(self, request, wait, retry: bool):
+        attempt = 0
+        while True:
+            await self.wait_connected(wait)
+            self.pending += 1
+            try:
+                return await self._send(request())
+            except ConnectionLost:
+                if not retry:
+                    raise ConnectionLost(
+                        'connection lost; the request might have been applied')
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                logging.warning(
+                    f'connection lost, request is sent again '
+                    f'({attempt}/{self.retries})')
+            except ConnectionError:
+                # not sent; lost between the check and the write
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+            finally:
+                self.pending -= 1
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive)
+            if self.pending or not self.is_connected():
+                continue
+            try:
+                await self._send(self._ping(timeout=PING_TIMEOUT))
+            except Exception as e:
+                logging.warning(
+                    f'keepalive failed ({e.__class__.__name__}: {e}), '
+                    f'reconnecting')
+                self.reconnect()
@@ -0,0 +1,90 @@
+'''Rendering of query results.'''
+import asyncio
+import base64
+import json
+import sys
+
+
+class BinEncode(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, bytes):
+            return base64.b64encode(obj).decode("utf-8")
+        return json.JSONEncoder.default(self, obj)
+
+
+class Renderer:
+    """Render query results to stdout.
+
+    In stream mode the result is encoded and written in chunks while giving
+    the event loop a chance to run in between; otherwise the result is encoded
+    at once (which is faster, especially in compact mode). Output exceeding
+    `max_size` characters is truncated, zero disables truncation.
+    """
+
+    STREAM_YIELD = 1000  # chunks to write before yielding to the loop
+    TEXT_CHUNK = 1 << 16  # characters per chunk when streaming rendered text
+
+    def __init__(
+            self,
+            compact: bool = False,
+            sort_keys: bool = True,
+            stream: bool = False,
+            max_size: int = 0):
+        self.stream = stream
+        self.max_size = max_size
+        self.encoder = BinEncode(
+            sort_keys=sort_keys,
+            indent=None if compact else 4,
+            separators=(',', ':') if compact else None)
+
+    def render(self, res) -> str:
+        out = self.encoder.encode(res)
+        if self.max_size and len(out) > self.max_size:
+            return self._truncated(out[:self.max_size], len(out))
+        return out
+
+    async def write(self, res, file=None, collect: bool = False):
+        """Write the result; with `collect` the output is also returned, for
+        example to cache it."""
+        file = sys.stdout if file is None else file
+        if not self.stream:
+            out = self.render(res)
+            print(out, file=file)
+            return out if collect else None
+
+        size = 0
+        chunks = [] if collect else None
+        for n, chunk in enumerate(self.encoder.iterencode(res), 1):
+            if self.max_size and size + len(chunk) > self.max_size:
+                chunk = self._truncated(chunk[:self.max_size - size])
+                file.write(chunk)
+                if collect:
+                    chunks.append(chunk)
+                break
+            file.write(chunk)
+            if collect:
+                chunks.append(chunk)
+            size += len(chunk)
+            if n % self.STREAM_YIELD == 0:
+                await asyncio.sleep(0)
+        file.write('\n')
+        return ''.join(chunks) if collect else None
+
+    async def write_text(self, out: str, file=None):
+        """Write rendered output, for example from the cache; in stream mode
+        in chunks while giving the event loop a chance to run in between."""
+        file = sys.stdout if file is None else file
+        if not self.stream:
+            print(out, file=file)
+            return
+        for n, pos in enumerate(range(0, len(out), self.TEXT_CHUNK), 1):
+            file.write(out[pos:pos + self.TEXT_CHUNK])
+            if n % self.STREAM_YIELD == 0:
+                await asyncio.sleep(0)
+        file.write('\n')
+
+    def _truncated(self, out: str, total: int = None) -> str:
+        of = f' of {total}' if total else ''
+        return (
+            f'{out}\n... output truncated at {self.max_size}{of} characters '
+            f'(use --max-output 0 to disable)')
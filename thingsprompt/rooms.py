@@ -0,0 +1,138 @@
+'''Join rooms and write the events as NDJSON.'''
+import asyncio
+import os
+import sys
+import time
+from thingsdb.room import Room
+from .render import BinEncode
+
+
+BATCH_SIZE = 1000  # maximum number of events in a single write
+
+
+class EventWriter:
+    """Write events as NDJSON lines in batches.
+
+    Events are collected and written once per iteration of the event loop (or
+    when BATCH_SIZE is reached) using a single write. Writes are blocking; if
+    the reader cannot keep up, the event loop waits and stops reading from the
+    connection so TCP flow control pushes back to ThingsDB, instead of events
+    piling up in memory.
+    """
+
+    def __init__(self, file=None):
+        self.file = file
+        self.count = 0
+        self.closed = asyncio.get_running_loop().create_future()
+        self._batch = []
+        self._scheduled = False
+        self._encode = BinEncode(separators=(',', ':')).encode
+
+    def put(self, event: dict):
+        self._batch.append(self._encode(event))
+        if len(self._batch) >= BATCH_SIZE:
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        self._scheduled = False
+        if not self._batch:
+            return
+        file = sys.stdout if self.file is None else self.file
+        self._batch.append('')
+        try:
+            file.write('\n'.join(self._batch))
+            file.flush()
+        except BrokenPipeError:
+            # the reader has gone (for example `listen ... | head`)
+            if not self.closed.done():
+                self.closed.set_result(None)
+        else:
+            self.count += len(self._batch) - 1
+        self._batch.clear()
+
+
+class EventRoom(Room):
+    """Room which writes all events to an EventWriter."""
+
+    def __init__(self, room, scope: str, writer: EventWriter):
+        super().__init__(room, scope)
+        self.writer = writer
+        self.done = asyncio.get_running_loop().create_future()
+
+    def _put(self, tp: str, **kwargs):
+        self.writer.put({
+            'ts': round(time.time(), 6),
+            'room': self.id,
+            'type': tp,
+            **kwargs})
+
+    def on_init(self):
+        pass
+
+    async def on_join(self):
+        self._put('join')
+
+    def on_leave(self):
+        self._put('leave')
+        if not self.done.done():
+            self.done.set_result(None)
+
+    def on_delete(self):
+        self._put('delete')
+        if not self.done.done():
+            self.done.set_result(None)
+
+    def on_emit(self, event: str, *args):
+        self._put('emit', event=event, args=args)
+
+
+def room_arg(room: str):
+    """A room Id, or a room name or ThingsDB code returning the room Id."""
+    return int(room) if room.isdigit() else room
+
+
+async def join_rooms(client, rooms, scope: str, writer: EventWriter):
+    """Join rooms; returns the joined rooms and the number of failures.
+
+    A room which is joined twice (e.g. by Id and by name) replaces the room
+    which was joined before; the client only keeps one room per Id.
+    """
+    joined = {}
+    failed = 0
+    for room in rooms:
+        r = EventRoom(room_arg(room), scope, writer)
+        try:
+            await r.join(client, wait=None)
+        except Exception as e:
+            print(f'{room}: {e.__class__.__name__}: {e}', file=sys.stderr)
+            failed += 1
+            continue
+        prev = joined.get(r.id)
+        if prev is not None:
+            prev.done.set_result(None)
+        joined[r.id] = r
+    return list(joined.values()), failed
+
+
+async def do_listen(client, rooms: list, scope: str) -> int:
+    """Join rooms and write events to stdout until all rooms are left or
+    removed. Returns the number of rooms which failed to join."""
+    writer = EventWriter()
+    joined, failed = await join_rooms(client, rooms, scope, writer)
+    try:
+        if joined:
+            done = asyncio.gather(*(r.done for r in joined))
+            await asyncio.wait(
+                [writer.closed, done],
+                return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        writer.flush()
+        print(f'{writer.count} events', file=sys.stderr)
+
+    if writer.closed.done():
+        # prevent another broken pipe error when stdout is flushed at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return failed
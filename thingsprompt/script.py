@@ -0,0 +1,137 @@
+'''Run ThingsDB scripts non-interactive.'''
+import asyncio
+import collections
+import json
+import re
+import sys
+from thingsdb.exceptions import ThingsDBError
+from .render import BinEncode
+
+
+# equal to SCOPE_QUERY but a statement may span multiple lines
+SCOPE_STMT = re.compile(r'^\s*(@[\:0-9a-zA-Z_]+)\s+(.*)$', re.DOTALL)
+
+# a slash after one of these characters starts a regular expression and not
+# a division
+_REGEX_PREV = set('([{,;=:!&|?')
+
+
+def split_statements(code: str):
+    """Yield (line, statement) tuples for each top-level statement.
+
+    Statements are separated by a semicolon which is not part of a string,
+    comment, regular expression or nested inside brackets. Statements with
+    only white-space and comments are skipped.
+    """
+    n = len(code)
+    i = start = depth = 0
+    line = 1
+    stmt_line = None  # line where the current statement starts
+    prev = ';'
+
+    while i < n:
+        c = code[i]
+        if c == '\n':
+            line += 1
+        elif c.isspace():
+            pass
+        elif code.startswith('//', i):
+            end = code.find('\n', i)
+            i = n if end == -1 else end
+            continue
+        elif code.startswith('/*', i):
+            nested = 0
+            while i < n:
+                if code.startswith('/*', i):
+                    nested += 1
+                    i += 2
+                elif code.startswith('*/', i):
+                    nested -= 1
+                    i += 2
+                    if nested == 0:
+                        break
+                else:
+                    if code[i] == '\n':
+                        line += 1
+                    i += 1
+            continue
+        else:
+            if stmt_line is None:
+                stmt_line = line
+                start = i
+            if c in '"\'`' or (c == '/' and prev in _REGEX_PREV):
+                end = i + 1
+                while end < n and code[end] != c:
+                    if c == '/' and code[end] == '\\':
+                        end += 1
+                    end += 1
+                line += code.count('\n', i, end)
+                i = end + 1
+                prev = c
+                continue
+            if c in '([{':
+                depth += 1
+            elif c in ')]}':
+                depth = max(depth - 1, 0)
+            elif c == ';' and depth == 0:
+                yield stmt_line, code[start:i + 1]
+                stmt_line = None
+            prev = c
+        i += 1
+
+    if stmt_line is not None:
+        yield stmt_line, code[start:]
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, cls=BinEncode, separators=(',', ':'))
+
+
+async def _write_result(line: int, fut) -> bool:
+    try:
+        res = await fut
+    except Exception as e:
+        out = {
+            'line': line,
+            'error': e.__class__.__name__,
+            'msg': str(e),
+        }
+        if isinstance(e, ThingsDBError) and hasattr(e, 'error_code'):
+            out['code'] = e.error_code
+        ok = False
+    else:
+        out = {'line': line, 'result': res}
+        ok = True
+
+    sys.stdout.write(_dumps(out) + '\n')
+    return ok
+
+
+async def do_run(client, code: str, in_flight: int, timeout) -> int:
+    """Pipeline all statements in `code` over a single connection.
+
+    At most `in_flight` queries are waiting for a response at any time; the
+    results are written to stdout as NDJSON in the order of the statements.
+    With more than one query in flight ThingsDB might run the statements in
+    another order, so a statement which reads what the previous one changed
+    needs `in_flight=1`. Returns the number of failed statements.
+    """
+    failed = 0
+    pending = collections.deque()
+    in_flight = max(1, in_flight)
+
+    for line, stmt in split_statements(code):
+        m = SCOPE_STMT.match(stmt)
+        scope, query = (m.group(1), m.group(2)) if m else (None, stmt)
+        fut = asyncio.ensure_future(
+            client.query(query, scope=scope, timeout=timeout))
+        pending.append((line, fut))
+
+        if len(pending) >= in_flight:
+            failed += not await _write_result(*pending.popleft())
+
+    while pending:
+        failed += not await _write_result(*pending.popleft())
+
+    sys.stdout.flush()
+    return failed
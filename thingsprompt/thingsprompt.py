@@ -2,194 +2,26 @@
 '''ThingsPrompt
 
 Shell client for ThingsDB
+
+Nothing but sys is imported here; the standard library modules, the client,
+the interactive prompt and the sub-commands are imported when used, which keeps
+the start-up fast for non-interactive usage and lets --import-time measure all
+of them.
 '''
-import os
 import sys
-import argparse
-import asyncio
-import getpass
-import re
-import json
-import base64
-import ssl
-import functools
-from setproctitle import setproctitle
-from thingsdb.client import Client
-from thingsdb.exceptions import ThingsDBError
-from prompt_toolkit import __version__ as ptk_version
-from prompt_toolkit.filters import Condition
-from prompt_toolkit.history import FileHistory
-from prompt_toolkit.history import InMemoryHistory
-from prompt_toolkit.key_binding import KeyBindings
-from prompt_toolkit.lexers import PygmentsLexer
-from prompt_toolkit.patch_stdout import patch_stdout
-from prompt_toolkit.shortcuts import PromptSession
-from prompt_toolkit.styles.pygments import style_from_pygments_cls
-from pygments.styles import get_style_by_name
-from pygments.lexer import RegexLexer, include, bygroups
-from pygments.token import Comment, Keyword, Name, Number, String, Text, \
-    Operator, Punctuation, Whitespace
 
 
 __version__ = '1.0.11'  # keep equal to the one in setup.py
 
 
-class ThingsDBLexer(RegexLexer):
-    """
-    Lexer for the ThingsDB programming language.
-
-    .. versionadded:: 2.9
-    """
-    name = 'ThingsDB'
-    aliases = ['ti', 'thingsdb']
-    filenames = ['*.ti']
-
-    tokens = {
-        'root': [
-            include('expression'),
-        ],
-        'expression': [
-            include('comments'),
-            include('whitespace'),
-
-            # numbers
-            (r'[-+]?0b[01]+', Number.Bin),
-            (r'[-+]?0o[0-8]+', Number.Oct),
-            (r'([-+]?0x[0-9a-fA-F]+)', Number.Hex),
-            (r'[-+]?[0-9]+', Number.Integer),
-            (r'[-+]?((inf|nan)([^0-9A-Za-z_]|$)|[0-9]*\.[0-9]+(e[+-][0-9]+)?)',
-             Number.Float),
-
-            # strings
-            (r'(?:"(?:[^"]*)")+', String.Double),
-            (r"(?:'(?:[^']*)')+", String.Single),
-            (r"(?:`(?:[^`]*)`)+", String.Backtick),
-
-            # literals
-            (r'(true|false|nil)\b', Keyword.Constant),
-
-            # name constants
-            (r'(FULL|USER|GRANT|CHANGE|JOIN|RUN|QUERY|'
-             r'DEBUG|INFO|WARNING|ERROR|CRITICAL|'
-             r'NO_IDS|INT_MIN|INT_MAX|MATH_E|MATH_PI)\b', Name.Constant),
-
-            # regular expressions
-            (r'(/[^/\\]*(?:\\.[^/\\]*)*/i?)', String.Regex),
-
-            # name, assignments and functions
-            include('names'),
-
-            (r'[(){}\[\],;]', Punctuation),
-            (r'[+\-*/%&|<>^!~@=:?]', Operator),
-        ],
-        'names': [
-            (r'(\.)'
-             r'(first|last|then|else|load|at|again_in|again_at|err|cancel|'
-             r'closure|set_closure|args|set_args|owner|set_owner|equals|copy|'
-             r'dup|assign|week|weekday|yday|zone|len|call|doc|emit|extract|'
-             r'choice|code|format|msg|each|every|extend|extend_unique|filter|'
-             r'find|flat|find_index|has|index_of|count|sum|is_unique|unique|'
-             r'join|map|map_id|map_wrap|map_type|vmap|move|pop|push|fill|'
-             r'remove|replace|restrict|restriction|shift|sort|splice|to|add|'
-             r'one|clear|contains|ends_with|name|lower|replace|reverse|'
-             r'starts_with|split|test|trim|trim_left|trim_right|upper|del|ren|'
-             r'to_type|to_thing|get|id|keys|reduce|set|some|value|values|wrap|'
-             r'unshift|unwrap|search)'
-             r'(\()',
-             bygroups(Name.Function, Name.Function, Punctuation), 'arguments'),
-            (r'(alt_raise|assert|base64_encode|base64_decode|bool|bytes|'
-             r'closure|datetime|deep|future|is_future|del_enum|del_type|room|'
-             r'is_room|task|tasks|is_task|is_email|is_url|is_tel|is_time_zone|'
-             r'timeit|enum|enum_info|enum_map|enums_info|err|regex|is_regex|'
-             r'change_id|float|has_enum|has_type|int|is_array|is_ascii|'
-             r'is_float|is_bool|is_bytes|is_closure|is_datetime|is_enum|'
-             r'is_err|is_mpdata|is_inf|is_int|is_list|is_nan|is_nil|is_raw|'
-             r'is_set|is_str|is_thing|is_timeval|is_tuple|is_utf8|json_dump|'
-             r'json_load|list|log|import|export|root|mod_enum|mod_type|new|'
-             r'new_type|now|raise|rand|range|randint|randstr|refs|rename_enum|'
-             r'set|set_enum|set_type|str|thing|timeval|try|type|type_assert|'
-             r'type_count|type_info|types_info|nse|wse|backup_info|'
-             r'backups_info|backups_ok|counters|del_backup|has_backup|'
-             r'new_backup|node_info|nodes_info|reset_counters|restart_module|'
-             r'set_log_level|shutdown|has_module|del_module|module_info|'
-             r'modules_info|new_module|deploy_module|rename_module|'
-             r'refresh_module|set_module_conf|set_module_scope|'
-             r'collections_info|del_collection|del_expired|del_node|del_token|'
-             r'del_user|grant|has_collection|has_node|has_token|has_user|'
-             r'new_collection|new_node|new_token|new_user|rename_collection|'
-             r'rename_user|restore|revoke|set_password|set_time_zone|'
-             r'set_default_deep|time_zones_info|user_info|users_info|'
-             r'del_procedure|has_procedure|new_procedure|mod_procedure|'
-             r'procedure_doc|procedure_info|procedures_info|rename_procedure|'
-             r'run|assert_err|auth_err|bad_data_err|cancelled_err|'
-             r'rename_type|forbidden_err|lookup_err|max_quota_err|node_err|'
-             r'num_arguments_err|operation_err|overflow_err|syntax_err|'
-             r'collection_info|type_err|value_err|zero_div_err|abs|ceil|cos|'
-             r'exp|floor|log10|log2|loge|pow|round|sin|sqrt|tan|is_module)'
-             r'(\()',
-             bygroups(Name.Function, Punctuation),
-             'arguments'),
-            (r'(\.[A-Za-z_][0-9A-Za-z_]*)'
-             r'(\s*)(=)',
-             bygroups(Name.Attribute, Text, Operator)),
-            (r'\.[A-Za-z_][0-9A-Za-z_]*', Name.Attribute),
-            (r'([A-Za-z_][0-9A-Za-z_]*)(\s*)(=)',
-             bygroups(Name.Variable, Text, Operator)),
-            (r'[A-Za-z_][0-9A-Za-z_]*', Name.Variable),
-        ],
-        'whitespace': [
-            (r'\n', Whitespace),
-            (r'\s+', Whitespace),
-        ],
-        'comments': [
-            (r'//(.*?)(\n|$)', Comment.Single),
-            (r'/\*', Comment.Multiline, 'comment'),
-        ],
-        'comment': [
-            (r'[^*/]+', Comment.Multiline),
-            (r'/\*', Comment.Multiline, '#push'),
-            (r'\*/', Comment.Multiline, '#pop'),
-            (r'[*/]', Comment.Multiline),
-        ],
-        'arguments': [
-            include('expression'),
-            (',', Punctuation),
-            (r'\(', Punctuation, '#push'),
-            (r'\)', Punctuation, '#pop'),
-        ]
-    }
-
-
-PTK3 = ptk_version.startswith('3.')
-USE_FUN = re.compile(r'^\s*(@\s?[\:\/0-9a-zA-Z_]+)\s*$')
-SCOPE_QUERY = re.compile(r'^\s*(@[\:0-9a-zA-Z_]+)\s+(.*)$')
-SCOPE_RE = re.compile(
+SCOPE_PATTERN = (
     r'^(@([a-z]*):([a-zA-Z_][a-zA-Z0-9_]*))'
     r'|(/([a-z]*)/([a-zA-Z_][a-zA-Z0-9_]*))$')
 
-TAB = ' ' * 4
-HELP = f'''
-Version:
-    {__version__}
-
-Special commands:
-
-?
-    This help.
-<@scope>
-    Switch to another scope, for example: @ //stuff
-<@scope> <query>
-    Run a single query in a given scope, for example: @n node_info();
-CTRL + n
-    Insert a new line.
-'''
-
-bindings = KeyBindings()
-session = None
-
 
 def collection_from_scope(scope: str):
-    m = SCOPE_RE.match(scope)
+    import re  # compiled patterns are cached by re
+    m = re.match(SCOPE_PATTERN, scope)
     if m is None:
         return
     if m.group(1) is not None:
@@ -199,56 +31,22 @@ def collection_from_scope(scope: str):
     return None
 
 
-class BinEncode(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, bytes):
-            return base64.b64encode(obj).decode("utf-8")
-        return json.JSONEncoder.default(self, obj)
-
-
-@Condition
-def is_active():
-    return session.multiline
-
-
-def on_enter_new_line(event):
-    last_enter_idx = event.app.current_buffer.text.rfind('\n')
-    last_line = event.app.current_buffer.text[last_enter_idx+1:].rstrip()
-
-    idx = 0
-    for idx, c in enumerate(last_line):
-        if not c.isspace():
-            break
-
-    indent = last_line[:idx]
-
-    if last_line and last_line[-1] in ('{', '(', '['):
-        indent += TAB
-
-    event.app.current_buffer.insert_text('\n' + indent)
-
-
-@bindings.add('tab')
-def _(event):
-    """Insert TAB"""
-    event.app.current_buffer.insert_text(TAB)
-
-
-@bindings.add('c-n')
-def _(event):
-    on_enter_new_line(event)
-
-
-@bindings.add('backspace')
-def _(event):
-    buffer = event.app.current_buffer
-    text = buffer.text[:buffer.cursor_position]
-    indent = len(text) - len(text.rstrip(' '))
-    if indent and indent % 4 == 0:
-        for _ in range(4):
-            buffer.delete_before_cursor()
+def make_client(args, loop):
+    from .reconnect import ReconnectClient
+    if args.ssl:
+        import ssl
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.maximum_version = ssl.TLSVersion.TLSv1_3
+        client = ReconnectClient(
+            keepalive=args.keepalive, ssl=context, loop=loop)
     else:
-        buffer.delete_before_cursor()
+        client = ReconnectClient(
+            keepalive=args.keepalive, ssl=None, loop=loop)
+    client.set_default_scope(args.scope)
+    return client
 
 
 async def connect(client, args, auth):
@@ -256,170 +54,32 @@ async def connect(client, args, auth):
     await client.authenticate(*auth, timeout=args.timeout)
 
 
-def set_prompt(client, session, hide_connection_info):
-    scope = client.get_default_scope()
-    if hide_connection_info:
-        title = f'({scope})'
-    else:
-        title = f'{client.connection_info()} ({scope})'
-    session.message = f'{title}> '
-
-
-async def prompt_loop(client, args):
-    global session
-    try:
-        history_file = os.path.join(
-            os.path.expanduser('~'),
-            '.config',
-            'ThingsPrompt',
-            'history'
-        )
-        if not os.path.exists(history_file):
-            path = os.path.dirname(history_file)
-            if not os.path.exists(path):
-                os.mkdir(path, 0o700)
-            open(history_file, 'w').close()
-            os.chmod(history_file, 0o600)
-
-        history = FileHistory(history_file)
-    except Exception:
-        history = InMemoryHistory()
-
-    if args.style == 'none':
-        session = PromptSession(history=history)
-    else:
-        style = style_from_pygments_cls(get_style_by_name(args.style))
-        session = PromptSession(
-            history=history,
-            lexer=PygmentsLexer(ThingsDBLexer),
-            style=style)
-    session.client = client
-
-    if PTK3:
-        aprompt = functools.partial(
-            session.prompt_async,
-            key_bindings=bindings)
-    else:
-        aprompt = functools.partial(
-            session.prompt,
-            async_=True,
-            key_bindings=bindings)
-
-    set_prompt(client, session, args.hide_connection_info)
-
-    while True:
-        try:
-            query = await aprompt()
-
-            if query is None:
-                continue
-
-            if query.strip() == '?':
-                print(HELP)
-                continue
-
-            use = USE_FUN.match(query)
-            if use:
-                scope = use.group(1)
-                scope = scope.strip('\'"')
-                if scope[1] == ' ':
-                    scope = scope[2:]
-
-                client.set_default_scope(scope)
-                set_prompt(client, session, args.hide_connection_info)
-                continue
-
-            scope = SCOPE_QUERY.match(query)
-            if scope:
-                query = scope.group(2)
-                scope = scope.group(1)
-            else:
-                scope = None
-
-            if not client.is_connected():
-                print('not connected')
-                continue
-
-            try:
-                res = await client.query(
-                    query,
-                    scope=scope,
-                    timeout=args.timeout)
-            except ThingsDBError as e:
-                print(f'{e.__class__.__name__}: {e}')
-            else:
-                print(json.dumps(res, sort_keys=True, indent=4, cls=BinEncode))
-
-        except (EOFError, KeyboardInterrupt):
-            return
-
-
-async def do_export(client, fn: str, collection: str, dump: bool):
-    try:
-        data = await client.query("""//ti
-            export({dump:,});
-        """, dump=dump, scope=f'//{collection}')
-    except ThingsDBError as e:
-        print(f'{e.__class__.__name__}: {e}')
-    else:
-        try:
-            with open(fn, 'wb' if dump else 'w') as f:
-                f.write(data)
-        except Exception as e:
-            print(f'{e.__class__.__name__}: {e}')
-
-
-async def do_import(client, fn: str, collection: str, import_tasks: bool):
-    is_bin = True
-    with open(fn, 'rb') as f:
-        data = f.read()
-
-    if (data[0]) < 128:
-        # might be plain text, at least not a MessagePack export.
-        try:
-            with open(fn, 'r') as f:
-                data = f.read()
-        except Exception as e:
-            print(f'Invalid export file ({e.__class__.__name__}: {e})')
-            return
-
-        if import_tasks:
-            print('Cannot use --tasks with plain text import')
-
-        is_bin = False
-
-    has_collection = await client.has_collection(collection)
-    try:
-        if has_collection is False:
-            await client.new_collection(collection)
-
-        if is_bin:
-            await client.query("""//ti
-                import(data, {import_tasks:,});
-            """, data=data, import_tasks=import_tasks, scope=f'//{collection}')
-        else:
-            await client.query(
-                data,
-                scope=f'//{collection}',
-                skip_strip_code=True)
-    except ThingsDBError as e:
-        print(f'{e.__class__.__name__}: {e}')
-
-
 def main():
-    setproctitle('things-prompt')
+    if '--import-time' in sys.argv[1:]:
+        # before anything else is imported, so all imports are measured
+        import atexit
+        from .importtime import ImportTimer
+        timer = ImportTimer()
+        timer.install()
+        atexit.register(timer.report)
 
-    if not PTK3:
-        from prompt_toolkit.eventloop.defaults import use_asyncio_event_loop
-        use_asyncio_event_loop()
+    import argparse
 
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
         '--node', '-n',
         type=str,
-        default='localhost',
-        help='node address')
+        action='append',
+        help=(
+            'node address (default: localhost), as host or host:port; '
+            'repeat to connect to multiple nodes and use @*<scope> in the '
+            'prompt to query all nodes, for example: @*n node_info();'))
+
+    parser.add_argument(
+        '--nodes-file',
+        type=str,
+        help='file with node addresses, one host or host:port per line')
 
     parser.add_argument(
         '--port',
@@ -453,6 +113,16 @@ def main():
         type=int,
         help='connect and query timeout in seconds')
 
+    parser.add_argument(
+        '--keepalive',
+        type=float,
+        default=30.0,
+        help=(
+            'seconds between keepalive pings on an idle connection, '
+            '0 to disable (default: 30); a lost connection is restored '
+            'and queries wait for it, but a query which was sent is only run '
+            'again by export and diff'))
+
     parser.add_argument(
         '--ssl',
         action='store_true',
@@ -469,11 +139,92 @@ def main():
         choices=['dracula', 'monokai', 'colorful', 'friendly', 'vim', 'none'],
         help='syntax highlighting style or none for disabled')
 
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help='print results as compact JSON without indentation')
+
+    parser.add_argument(
+        '--unsorted',
+        action='store_true',
+        help='print results without sorting the keys')
+
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help=(
+            'write results incrementally while they are encoded; keeps the '
+            'prompt responsive for large results'))
+
+    parser.add_argument(
+        '--max-output',
+        type=int,
+        default=0,
+        help=(
+            'truncate results larger than this number of characters '
+            '(default: 0, no truncation)'))
+
+    parser.add_argument(
+        '--pager',
+        type=int,
+        default=1000,
+        help=(
+            'browse results of more than this number of lines in a pager, '
+            '0 to disable (default: 1000)'))
+
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help=(
+            'start the prompt with profiling enabled; '
+            'use `\\profile` in the prompt to toggle'))
+
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        help=(
+            'cache the output of read-only queries in the prompt; '
+            'use `\\cache on|off|stats|clear` in the prompt to manage'))
+
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=60.0,
+        help='seconds before a cached result expires (default: 60)')
+
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=64,
+        help='maximum size of the cache in MB (default: 64)')
+
+    parser.add_argument(
+        '--history-size',
+        type=int,
+        default=10000,
+        help=(
+            'number of queries to keep in the history of the prompt '
+            '(default: 10000); use `\\history` in the prompt to search'))
+
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help=(
+            'send the queries of the sub-commands export, import, run, load '
+            'and diff through a local daemon which keeps the connections '
+            'open between invocations; the daemon is started when it is not '
+            'running (see the daemon sub-command)'))
+
     parser.add_argument(
         '--version',
         action='store_true',
         help='print version and exit')
 
+    parser.add_argument(
+        '--import-time',
+        action='store_true',
+        help='report the time spent on importing modules at exit')
+
     subparsers = parser.add_subparsers(help='sub-command help')
     parser_exp = subparsers.add_parser(
         'export',
@@ -492,6 +243,57 @@ def main():
             'without this argument the export is not readable but in '
             'MessagePack format and intended to be used for import'))
 
+    parser_exp.add_argument(
+        '--collections',
+        type=str,
+        help=(
+            'comma separated collection names or glob patterns, or `all`, '
+            'to export multiple collections; filename is used as the '
+            'directory to store one export file per collection'))
+
+    parser_exp.add_argument(
+        '--concurrency',
+        type=int,
+        default=4,
+        help=(
+            'number of connections used with --collections, or number of '
+            'pages fetched at once with --format (default: 4)'))
+
+    parser_exp.add_argument(
+        '--resume',
+        action='store_true',
+        help=(
+            'with --collections, skip collections which are already '
+            'exported (the export file matches its manifest)'))
+
+    parser_exp.add_argument(
+        '--compress',
+        choices=['gzip', 'zstd'],
+        help=(
+            'compress the export; zstd requires the zstandard package '
+            '(default: gzip for a filename ending with .gz, zstd for .zst, '
+            'otherwise none)'))
+
+    parser_exp.add_argument(
+        '--compress-level',
+        type=int,
+        help='compression level (default: 6 for gzip, 3 for zstd)')
+
+    parser_exp.add_argument(
+        '--format',
+        choices=['ndjson', 'columns'],
+        help=(
+            'export the typed things of the collection, for use without '
+            'ThingsDB; ndjson writes a line per thing to filename, columns '
+            'uses filename as the directory with a file per type and a line '
+            'with the things as columns per page'))
+
+    parser_exp.add_argument(
+        '--page-size',
+        type=int,
+        default=1000,
+        help='number of thing Ids per page with --format (default: 1000)')
+
     parser_imp = subparsers.add_parser(
         'import',
         help='import a collection')
@@ -500,24 +302,235 @@ def main():
         'filename',
         help=(
             'filename to import; '
-            'can be ThingsDB code (*.ti) or a binary export (*.mp)'))
+            'can be ThingsDB code (*.ti) or a binary export (*.mp), '
+            'optionally compressed with gzip or zstd'))
 
     parser_imp.add_argument(
         '--tasks',
         action='store_true',
         help='include tasks when importing a collection')
 
+    parser_imp.add_argument(
+        '--collections',
+        type=str,
+        help=(
+            'comma separated collection names or glob patterns, or `all`, '
+            'to import multiple collections; filename is used as the '
+            'directory with export files named <collection>.mp or '
+            '<collection>.ti (with .gz or .zst when compressed)'))
+
+    parser_imp.add_argument(
+        '--concurrency',
+        type=int,
+        default=4,
+        help='number of connections used with --collections (default: 4)')
+
+    parser_run = subparsers.add_parser(
+        'run',
+        help='run a ThingsDB script and write the results as NDJSON')
+
+    parser_run.add_argument(
+        'filename',
+        nargs='?',
+        default='-',
+        help=(
+            'ThingsDB script (*.ti) to run, or - to read from stdin; '
+            'statements are separated by a semicolon and each statement '
+            'may start with a scope, for example: @n node_info();'))
+
+    parser_run.add_argument(
+        '--in-flight',
+        type=int,
+        default=1,
+        help=(
+            'maximum number of queries waiting for a response (default: 1); '
+            'only use more for statements which do not depend on each '
+            'other, as ThingsDB might run them in another order'))
+
+    parser_listen = subparsers.add_parser(
+        'listen',
+        help='join rooms and write the events as NDJSON')
+
+    parser_listen.add_argument(
+        'rooms',
+        nargs='+',
+        help=(
+            'room Ids, room names, or ThingsDB code which returns a room Id; '
+            'rooms are joined in the collection given with --scope'))
+
+    parser_diff = subparsers.add_parser(
+        'diff',
+        help='show the differences between two collections or exports')
+
+    parser_diff.add_argument(
+        'left',
+        help='export file (*.mp) or collection scope, for example: //stuff')
+
+    parser_diff.add_argument(
+        'right',
+        help='export file (*.mp) or collection scope to compare with')
+
+    parser_diff.add_argument(
+        '--max-changes',
+        type=int,
+        default=100,
+        help=(
+            'maximum number of differences to show, 0 for all '
+            '(default: 100)'))
+
+    parser_check = subparsers.add_parser(
+        'check',
+        help='check ThingsDB code for syntax errors, without a connection')
+
+    parser_check.add_argument(
+        'paths',
+        nargs='+',
+        help=(
+            'ThingsDB code (*.ti) to check; directories are searched for '
+            '*.ti files'))
+
+    parser_check.add_argument(
+        '--jobs',
+        type=int,
+        help='number of processes (default: number of CPUs)')
+
+    parser_check.add_argument(
+        '--functions',
+        type=str,
+        help=(
+            'comma separated names of functions which are not built-in but '
+            'should be accepted, for example functions of a newer ThingsDB '
+            'version'))
+
+    parser_check.add_argument(
+        '--no-cache',
+        action='store_true',
+        help=(
+            'check all files; by default the result is cached per file '
+            'content and unchanged files are not checked again'))
+
+    parser_load = subparsers.add_parser(
+        'load',
+        help='load rows from NDJSON or CSV in batches')
+
+    parser_load.add_argument(
+        'filename',
+        help='NDJSON or CSV file to load, or - to read from stdin')
+
+    parser_load.add_argument(
+        '--format',
+        choices=['ndjson', 'csv'],
+        help=(
+            'format of the file (default: csv for a filename ending with '
+            '.csv, otherwise ndjson); CSV rows are loaded as things with '
+            'the column names as keys and strings as values'))
+
+    load_code = parser_load.add_mutually_exclusive_group(required=True)
+
+    load_code.add_argument(
+        '--code',
+        type=str,
+        help=(
+            'ThingsDB code to run for each batch, with the rows in the '
+            'variable `rows`, for example: '
+            '.people.extend(rows.map(|r| Person{name: r.name}));'))
+
+    load_code.add_argument(
+        '--procedure',
+        type=str,
+        help='procedure to run for each batch, with the rows as argument')
+
+    parser_load.add_argument(
+        '--batch-size',
+        type=int,
+        default=500,
+        help='number of rows in a batch (default: 500)')
+
+    parser_load.add_argument(
+        '--in-flight',
+        type=int,
+        default=4,
+        help=(
+            'maximum number of batches waiting for a response (default: 4); '
+            'lowered while ThingsDB reports to be busy'))
+
+    parser_daemon = subparsers.add_parser(
+        'daemon',
+        help='run, or show the status of, the local daemon (see --daemon)')
+
+    parser_daemon.add_argument(
+        'action',
+        nargs='?',
+        choices=['start', 'status', 'stop'],
+        default='start',
+        help=(
+            'start the daemon (in the foreground), or show its status, or '
+            'stop it (default: start)'))
+
+    parser_daemon.add_argument(
+        '--idle-timeout',
+        type=float,
+        default=600.0,
+        help=(
+            'seconds before unused connections are closed, the daemon stops '
+            'when it has none left; 0 to disable (default: 600)'))
+
+    parser_daemon.add_argument(
+        '--pool-size',
+        type=int,
+        default=4,
+        help=(
+            'maximum number of connections per node and user '
+            '(default: 4)'))
+
     args = parser.parse_args()
 
     if args.version:
         sys.exit(__version__)
 
+    from setproctitle import setproctitle
+    setproctitle('things-prompt')
+
+    if hasattr(args, 'paths'):
+        from .check import do_check
+        errors = do_check(
+            args.paths, args.functions, args.jobs, not args.no_cache)
+        sys.exit(1 if errors else 0)
+
+    if hasattr(args, 'idle_timeout'):
+        from .daemon import do_daemon
+        sys.exit(do_daemon(args.action, args.idle_timeout, args.pool_size))
+
+    # only when needed; --version, check and daemon do not use these
+    import asyncio
+
+    has_diff = hasattr(args, 'left')
+    if has_diff:
+        from .treediff import do_diff, is_scope
+        if not is_scope(args.left) and not is_scope(args.right):
+            # two export files, no connection required
+            changes = asyncio.get_event_loop().run_until_complete(do_diff(
+                None, args.left, args.right, args.max_changes))
+            sys.exit(1 if changes else 0)
+
+    from .fanout import parse_node, read_nodes_file
+    try:
+        nodes = [parse_node(node, args.port) for node in args.node or ()]
+        if args.nodes_file:
+            nodes.extend(read_nodes_file(args.nodes_file, args.port))
+    except Exception as e:
+        sys.exit(f'{e.__class__.__name__}: {e}')
+    if not nodes:
+        nodes.append(('localhost', args.port))
+    args.node, args.port = nodes[0]
+
     if args.token is None:
         if args.user is None:
             sys.exit(
                 'one of the arguments -t/--token or -u/--user is required')
 
         if args.password is None:
+            import getpass
             args.password = getpass.getpass('password: ')
 
         auth = [args.user, args.password]
@@ -528,50 +541,152 @@ def main():
 
     loop = asyncio.get_event_loop()
 
-    if args.ssl:
-        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        context.minimum_version = ssl.TLSVersion.TLSv1_2
-        context.maximum_version = ssl.TLSVersion.TLSv1_3
-        client = Client(ssl=context, loop=loop)
-    else:
-        client = Client(ssl=None, loop=loop)
-    client.set_default_scope(args.scope)
+    has_import = hasattr(args, 'tasks')
+    has_export = hasattr(args, 'structure_only')
+    has_load = hasattr(args, 'batch_size')
+    has_run = hasattr(args, 'in_flight') and not has_load
+    has_listen = hasattr(args, 'rooms')
+
+    # the prompt and listen use more than queries and connect themselves
+    use_daemon = args.daemon and (
+        has_import or has_export or has_load or has_run or has_diff)
+
+    async def new_client():
+        if use_daemon:
+            from .daemon import DaemonClient
+            conn = DaemonClient(args, auth)
+            await conn.connect()
+            return conn
+        conn = make_client(args, loop)
+        await connect(conn, args, auth)
+        return conn
 
     try:
-        loop.run_until_complete(connect(client, args, auth))
+        client = loop.run_until_complete(new_client())
     except Exception as e:
         print(f'{e.__class__.__name__}: {e}', file=sys.stderr)
         exit(1)
 
-    has_import = hasattr(args, 'tasks')
-    has_export = hasattr(args, 'structure_only')
+    if has_run:
+        try:
+            if args.filename == '-':
+                code = sys.stdin.read()
+            else:
+                with open(args.filename, 'r') as f:
+                    code = f.read()
+        except Exception as e:
+            sys.exit(f'{e.__class__.__name__}: {e}')
 
-    if has_export:
+    if has_load:
+        try:
+            # newline='' is required for CSV
+            f = sys.stdin if args.filename == '-' else \
+                open(args.filename, 'r', newline='')
+        except Exception as e:
+            sys.exit(f'{e.__class__.__name__}: {e}')
+        fmt = args.format or (
+            'csv' if args.filename.endswith('.csv') else 'ndjson')
+
+    async def connect_node(host, port):
+        conn = make_client(args, loop)
+        await conn.connect(host, port, timeout=args.timeout)
+        await conn.authenticate(*auth, timeout=args.timeout)
+        return conn
+
+    failed = 0
+
+    if has_export and args.format:
+        from .extract import do_export_things
         collection = collection_from_scope(args.scope)
         if collection is None:
             sys.exit(
                 'not a valid collection scope; '
                 'use --scope and provide a collection scope (e.g //stuff)')
+        if args.structure_only or args.collections:
+            sys.exit(
+                'argument --format cannot be used with --structure-only or '
+                '--collections')
+        from .dumpfile import compression_from_fn
+        compression = args.compress
+        if args.format == 'ndjson' and compression is None:
+            compression = compression_from_fn(args.filename)
+        failed = loop.run_until_complete(do_export_things(
+            client, args.filename, collection, args.format, args.page_size,
+            args.concurrency, compression, args.compress_level))
+    elif has_export and args.collections:
+        from .transfer import do_bulk_export
+        failed = loop.run_until_complete(do_bulk_export(
+            new_client, client, args.filename, args.collections,
+            not args.structure_only, args.concurrency, args.compress,
+            args.compress_level, args.resume))
+    elif has_export:
+        from .transfer import do_export
+        collection = collection_from_scope(args.scope)
+        if collection is None:
+            sys.exit(
+                'not a valid collection scope; '
+                'use --scope and provide a collection scope (e.g //stuff)')
+        from .dumpfile import compression_from_fn
         dump = not args.structure_only
         fn = args.filename
-        loop.run_until_complete(do_export(client, fn, collection, dump))
+        compression = args.compress or compression_from_fn(fn)
+        failed = loop.run_until_complete(do_export(
+            client, fn, collection, dump, compression, args.compress_level))
+    elif has_import and args.collections:
+        from .transfer import do_bulk_import
+        failed = loop.run_until_complete(do_bulk_import(
+            new_client, client, args.filename, args.collections,
+            args.tasks, args.concurrency))
+    elif has_run:
+        from .script import do_run
+        failed = loop.run_until_complete(
+            do_run(client, code, args.in_flight, args.timeout))
+    elif has_load:
+        from .load import do_load
+        failed = loop.run_until_complete(do_load(
+            client, f, fmt, args.code, args.procedure, args.scope,
+            args.batch_size, args.in_flight))
+    elif has_diff:
+        failed = loop.run_until_complete(do_diff(
+            client, args.left, args.right, args.max_changes))
+    elif has_listen:
+        from .rooms import do_listen
+        try:
+            failed = loop.run_until_complete(
+                do_listen(client, args.rooms, args.scope))
+        except KeyboardInterrupt:
+            pass
     elif has_import:
         if not args.scope:
             sys.exit('argument --import requires a scope (--scope)')
         collection = collection_from_scope(args.scope)
         if collection is None:
             sys.exit('not a valid collection scope')
+        from .transfer import do_import
         fn = args.filename
-        loop.run_until_complete(do_import(client, fn, collection, args.tasks))
+        failed = loop.run_until_complete(
+            do_import(client, fn, collection, args.tasks))
     else:
+        from prompt_toolkit.patch_stdout import patch_stdout
+        from .fanout import FanOut
+        from .prompt import PTK3, prompt_loop
+        if not PTK3:
+            from prompt_toolkit.eventloop.defaults import \
+                use_asyncio_event_loop
+            use_asyncio_event_loop()
+        fanout = FanOut(client, nodes)
+        loop.run_until_complete(fanout.connect(connect_node))
         with patch_stdout():
-            loop.run_until_complete(prompt_loop(client, args))
+            loop.run_until_complete(prompt_loop(client, args, fanout))
+        fanout.close()
+        loop.run_until_complete(fanout.wait_closed())
 
     client.close()
     loop.run_until_complete(client.wait_closed())
 
+    if failed:
+        sys.exit(1)
+
 
 if __name__ == '__main__':
     main()
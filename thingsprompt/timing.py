@@ -0,0 +1,167 @@
+'''Query timing and profiling for the prompt.'''
+import math
+import time
+import msgpack
+from thingsdb.exceptions import ThingsDBError
+
+
+def percentile(timings: list, p: float) -> float:
+    """Return percentile `p` (0-100) of the sorted `timings`."""
+    idx = max(0, math.ceil(p / 100 * len(timings)) - 1)
+    return timings[idx]
+
+
+def fmt_ms(seconds: float) -> str:
+    return f'{seconds * 1000:.2f} ms'
+
+
+def fmt_size(size: int) -> str:
+    if size < 1 << 10:
+        return f'{size} B'
+    if size < 1 << 20:
+        return f'{size / (1 << 10):.1f} KB'
+    return f'{size / (1 << 20):.2f} MB'
+
+
+def response_size(res) -> tuple:
+    """Return the size of `res` as MessagePack and the time to decode it.
+
+    The client does not expose the received package, so the response is
+    packed again; the size is equal to, or very close to, the size on the
+    wire and the decode time is measured by unpacking these bytes.
+    """
+    data = msgpack.packb(res, use_bin_type=True)
+    start = time.perf_counter()
+    msgpack.unpackb(data, raw=False)
+    return len(data), time.perf_counter() - start
+
+
+class QueryStats:
+
+    __slots__ = ('start', 'query', 'size', 'decode', 'render', 'counters')
+
+    def __init__(self, counters: dict = None):
+        self.start = time.perf_counter()
+        self.query = None
+        self.size = None
+        self.decode = None
+        self.render = None
+        self.counters = counters
+
+
+class Profiler:
+    """Per query latency breakdown, response size and counters() delta.
+
+    Profiling is disabled by default and can be toggled in the prompt; when
+    `counters` is enabled, `counters()` is queried (in the `@node` scope)
+    before and after each query and the changed counters are shown.
+    """
+
+    def __init__(self, enabled: bool = False, counters: bool = False):
+        self.enabled = enabled
+        self.counters = counters
+
+    def toggle(self, mode: str = None) -> str:
+        if mode is None:
+            self.enabled = not self.enabled
+            self.counters = False
+        else:
+            self.enabled = mode != 'off'
+            self.counters = mode == 'counters'
+        if not self.enabled:
+            return 'profiling disabled'
+        if self.counters:
+            return 'profiling enabled (with counters)'
+        return 'profiling enabled'
+
+    async def begin(self, client):
+        """Return a QueryStats instance, or None when disabled."""
+        if not self.enabled:
+            return None
+        before = await self._counters(client) if self.counters else None
+        return QueryStats(before)
+
+    def received(self, stats, res):
+        if stats is None:
+            return
+        stats.query = time.perf_counter() - stats.start
+        stats.size, stats.decode = response_size(res)
+
+    def rendered(self, stats, start: float):
+        if stats is not None:
+            stats.render = time.perf_counter() - start
+
+    async def end(self, client, stats):
+        if stats is None:
+            return
+        total = time.perf_counter() - stats.start
+        if stats.query is None:
+            stats.query = total
+
+        parts = [f'{fmt_ms(stats.query)} query']
+        if stats.decode is not None:
+            parts[0] += f' (~{fmt_ms(stats.decode)} decode)'
+        if stats.render is not None:
+            parts.append(f'{fmt_ms(stats.render)} render')
+        if stats.size is not None:
+            parts.append(f'{fmt_size(stats.size)} response')
+        print(f'-- {fmt_ms(total)}: {", ".join(parts)}')
+
+        if stats.counters is not None:
+            after = await self._counters(client)
+            if after is not None:
+                print(f'-- counters: {counters_delta(stats.counters, after)}')
+
+    @staticmethod
+    async def _counters(client):
+        try:
+            return await client.query(
+                'counters();', scope='@node', retry=True)
+        except (ThingsDBError, ConnectionError) as e:
+            print(f'{e.__class__.__name__}: {e}')
+            return None
+
+
+def counters_delta(before: dict, after: dict) -> str:
+    """Return the numeric counters which changed between before and after.
+
+    Note that the counters include the `counters()` query itself.
+    """
+    if before is None or after is None:
+        return 'not available'
+    changes = []
+    for key, val in after.items():
+        prev = before.get(key)
+        if isinstance(val, bool) or not isinstance(val, (int, float)) or \
+                not isinstance(prev, (int, float)) or val == prev:
+            continue
+        if isinstance(val, int) and isinstance(prev, int):
+            changes.append(f'{key} {val - prev:+d}')
+        else:
+            changes.append(f'{key} {prev:.6g} -> {val:.6g}')
+    return ', '.join(changes) or 'no changes'
+
+
+async def timeit(client, n: int, query: str, scope: str, timeout) -> str:
+    """Run `query` `n` times after each other and return a summary.
+
+    Stops at the first error, which is raised.
+    """
+    n = max(1, n)
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        res = await client.query(query, scope=scope, timeout=timeout)
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    size, _ = response_size(res)
+    total = sum(timings)
+    return (
+        f'{n} runs in {total:.2f}s ({n / total:.1f} queries/s), '
+        f'{fmt_size(size)} response\n'
+        f'min {fmt_ms(timings[0])}, '
+        f'p50 {fmt_ms(percentile(timings, 50))}, '
+        f'p95 {fmt_ms(percentile(timings, 95))}, '
+        f'p99 {fmt_ms(percentile(timings, 99))}, '
+        f'max {fmt_ms(timings[-1])}')
@@ -0,0 +1,332 @@
+'''Export and import of collections.'''
+import asyncio
+import fnmatch
+import os
+import time
+from .dumpfile import COMPRESSION, DumpReader, DumpWriter, \
+    compression_from_fn, fmt_transfer, wait_progress
+from .manifest import BlockHasher, manifest_fn, read_manifest, verify, \
+    write_manifest
+from .reconnect import ConnectionLost
+
+
+DUMP_EXT = ('.mp', '.ti')
+
+
+async def export_collection(client, fn: str, collection: str,
+                            dump: bool, compression: str = None,
+                            level: int = None) -> int:
+    # an export does not change anything, so it runs again when the
+    # connection is lost
+    data = await client.query("""//ti
+        export({dump:,});
+    """, dump=dump, scope=f'//{collection}', retry=True)
+    try:
+        info = await client.query('node_info();', scope='@node', retry=True)
+        version = info.get('version')
+    except Exception:
+        version = None  # only informational; the export itself is done
+
+    def write():
+        try:
+            os.unlink(manifest_fn(fn))  # the manifest of a previous export
+        except FileNotFoundError:
+            pass
+        hasher = BlockHasher()
+        with DumpWriter(
+                fn,
+                compression=compression,
+                level=level,
+                hasher=hasher) as writer:
+            writer.write(data)
+        write_manifest(
+            fn,
+            hasher,
+            collection=collection,
+            thingsdb=version,
+            dump=dump,
+            compression=compression,
+            size=writer.size)
+        return writer.size
+
+    # compressing and writing runs in a worker thread so it overlaps with the
+    # network I/O of other exports (with --collections)
+    return await asyncio.get_running_loop().run_in_executor(None, write)
+
+
+async def _import(client, data, collection: str, import_tasks: bool):
+    """Import a MessagePack export.
+
+    When the connection is lost during the import, the import might have been
+    applied; it only runs again (once the connection is restored) if the
+    collection is still empty.
+    """
+    scope = f'//{collection}'
+    attempt = 0
+    while True:
+        try:
+            return await client.query(
+                'import(data, {import_tasks:,});',
+                data=data,
+                import_tasks=import_tasks,
+                scope=scope)
+        except ConnectionLost:
+            attempt += 1
+            if attempt > client.retries:
+                raise
+            is_empty = await client.query("""//ti
+                .len() == 0 && types_info().len() == 0 &&
+                procedures_info().len() == 0;
+            """, scope=scope, retry=True)
+            if not is_empty:
+                return
+
+
+async def import_collection(client, fn: str, collection: str,
+                            import_tasks: bool, progress: bool = True) -> int:
+    with DumpReader(fn) as dump:
+        manifest = read_manifest(fn)
+        if manifest is not None:
+            # before anything is sent to ThingsDB
+            await asyncio.get_running_loop().run_in_executor(
+                None, verify, fn, dump.view, manifest)
+        if dump.compression:
+            # the format is detected from the magic bytes, not the filename
+            await asyncio.get_running_loop().run_in_executor(
+                None, dump.decompress)
+        if dump.is_msgpack():
+            data = dump.view
+        else:
+            # might be plain text, at least not a MessagePack export.
+            try:
+                data = dump.text()
+            except Exception as e:
+                raise ValueError(
+                    f'Invalid export file ({e.__class__.__name__}: {e})')
+
+            if import_tasks:
+                print('Cannot use --tasks with plain text import')
+
+        has_collection = await client.has_collection(collection)
+        if has_collection is False:
+            await client.new_collection(collection)
+
+        if isinstance(data, str):
+            fut = client.query(
+                data,
+                scope=f'//{collection}',
+                skip_strip_code=True)
+        else:
+            fut = _import(client, data, collection, import_tasks)
+        if progress:
+            await wait_progress(fut, 'importing', dump.size)
+        else:
+            await fut
+        return dump.size
+
+
+async def do_export(client, fn: str, collection: str, dump: bool,
+                    compression: str = None, level: int = None) -> int:
+    start = time.perf_counter()
+    try:
+        size = await export_collection(
+            client, fn, collection, dump, compression, level)
+    except Exception as e:
+        print(f'{e.__class__.__name__}: {e}')
+        return 1
+    duration = time.perf_counter() - start
+    out = fmt_transfer('exported', size, duration)
+    if compression:
+        mb = os.path.getsize(fn) / (1 << 20)
+        out = f'{out}, {mb:.2f} MB {compression}'
+    print(out)
+    return 0
+
+
+async def do_import(client, fn: str, collection: str,
+                    import_tasks: bool) -> int:
+    start = time.perf_counter()
+    try:
+        size = await import_collection(client, fn, collection, import_tasks)
+    except Exception as e:
+        print(f'{e.__class__.__name__}: {e}')
+        return 1
+    duration = time.perf_counter() - start
+    print(fmt_transfer('imported', size, duration))
+    return 0
+
+
+def match_collections(names, patterns: str) -> list:
+    """Filter collection names using a comma separated list of names or glob
+    patterns; the special pattern `all` matches every collection."""
+    patterns = [p.strip() for p in patterns.split(',') if p.strip()]
+    if 'all' in patterns:
+        return sorted(names)
+    return sorted(
+        name for name in names
+        if any(fnmatch.fnmatchcase(name, p) for p in patterns))
+
+
+async def _run_pool(new_client, client, jobs, func, concurrency: int):
+    # the given client is re-used as the first connection in the pool
+    pool = asyncio.Queue()
+    pool.put_nowait(client)
+    n = max(1, min(concurrency, len(jobs))) - 1
+    clients = await asyncio.gather(
+        *(new_client() for _ in range(n)), return_exceptions=True)
+    errors = [c for c in clients if isinstance(c, Exception)]
+    if errors:
+        for c in clients:
+            if not isinstance(c, Exception):
+                c.close()
+                await c.wait_closed()
+        raise errors[0]
+    for c in clients:
+        pool.put_nowait(c)
+
+    async def run(collection, fn):
+        conn = await pool.get()
+        start = time.perf_counter()
+        try:
+            size = await func(conn, fn, collection)
+        except Exception as e:
+            err = f'{e.__class__.__name__}: {e}'
+            size = None
+        else:
+            err = None
+        finally:
+            pool.put_nowait(conn)
+        return collection, size, time.perf_counter() - start, err
+
+    try:
+        return await asyncio.gather(*(run(*job) for job in jobs))
+    finally:
+        while not pool.empty():
+            conn = pool.get_nowait()
+            if conn is not client:
+                conn.close()
+                await conn.wait_closed()
+
+
+async def _run_jobs(new_client, client, jobs, func, concurrency: int,
+                    start: float) -> int:
+    try:
+        results = await _run_pool(new_client, client, jobs, func, concurrency)
+    except Exception as e:
+        # connecting failed; no job has started
+        print(f'{e.__class__.__name__}: {e}')
+        return 1
+    return _print_summary(results, time.perf_counter() - start)
+
+
+def _print_summary(results, duration: float) -> int:
+    failed = 0
+    width = max([len(r[0]) for r in results] + [len('collection')])
+    print(f'{"collection":<{width}}  {"size (MB)":>10}  {"time (s)":>9}  '
+          f'status')
+    total = 0
+    for collection, size, elapsed, err in results:
+        if err is None:
+            total += size
+            print(f'{collection:<{width}}  {size / (1 << 20):>10.2f}  '
+                  f'{elapsed:>9.2f}  ok')
+        else:
+            failed += 1
+            print(f'{collection:<{width}}  {"-":>10}  '
+                  f'{elapsed:>9.2f}  {err}')
+    print(fmt_transfer(f'{len(results) - failed} collection(s),', total,
+                       duration))
+    return failed
+
+
+def is_exported(fn: str) -> bool:
+    """Return True if `fn` has a manifest and all blocks match."""
+    try:
+        manifest = read_manifest(fn)
+        if manifest is None:
+            return False
+        with DumpReader(fn) as dump:
+            verify(fn, dump.view, manifest)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+async def do_bulk_export(new_client, client, directory: str, patterns: str,
+                         dump: bool, concurrency: int, compression: str = None,
+                         level: int = None, resume: bool = False) -> int:
+    start = time.perf_counter()
+    try:
+        info = await client.collections_info()
+        names = match_collections([c['name'] for c in info], patterns)
+        if names:
+            os.makedirs(directory, exist_ok=True)
+    except Exception as e:
+        print(f'{e.__class__.__name__}: {e}')
+        return 1
+    if not names:
+        print('no matching collections')
+        return 0
+
+    ext = DUMP_EXT[0] if dump else DUMP_EXT[1]
+    if compression:
+        ext += COMPRESSION[compression][0]
+    jobs = [(name, os.path.join(directory, f'{name}{ext}')) for name in names]
+
+    if resume:
+        loop = asyncio.get_running_loop()
+        done = await asyncio.gather(*(
+            loop.run_in_executor(None, is_exported, fn) for _, fn in jobs))
+        jobs = [job for job, exported in zip(jobs, done) if not exported]
+        if any(done):
+            print(f'{sum(done)} collection(s) already exported')
+        if not jobs:
+            return 0
+
+    async def func(conn, fn, collection):
+        return await export_collection(
+            conn, fn, collection, dump, compression, level)
+
+    return await _run_jobs(new_client, client, jobs, func, concurrency, start)
+
+
+async def do_bulk_import(new_client, client, directory: str, patterns: str,
+                         import_tasks: bool, concurrency: int) -> int:
+    start = time.perf_counter()
+    try:
+        listing = os.listdir(directory)
+    except OSError as e:
+        print(f'{e.__class__.__name__}: {e}')
+        return 1
+    found = []
+    for fn in listing:
+        compression = compression_from_fn(fn)
+        base = fn[:-len(COMPRESSION[compression][0])] if compression else fn
+        name, ext = os.path.splitext(base)
+        if ext in DUMP_EXT:
+            # with more files for a collection, a MessagePack export is used
+            # before a script, and an uncompressed file before a compressed
+            order = 0 if compression is None else \
+                1 + list(COMPRESSION).index(compression)
+            found.append((name, DUMP_EXT.index(ext), order, fn))
+
+    files = {}
+    for name, _, _, fn in sorted(found):
+        if name in files:
+            print(f'ignoring {fn}, using {os.path.basename(files[name])} '
+                  f'for collection `{name}`')
+            continue
+        files[name] = os.path.join(directory, fn)
+
+    names = match_collections(files, patterns)
+    if not names:
+        print('no matching export files')
+        return 0
+
+    jobs = [(name, files[name]) for name in names]
+
+    async def func(conn, fn, collection):
+        return await import_collection(
+            conn, fn, collection, import_tasks, progress=False)
+
+    return await _run_jobs(new_client, client, jobs, func, concurrency, start)
@@ -0,0 +1,289 @@
+'''Structural diff of two exports, from dump files or live collections.
+
+Both sides are walked in the MessagePack data itself; nothing is decoded
+unless it differs. Equal parts are skipped with a single compare of the
+bytes. Large maps are compared per bucket of keys (Merkle style); the hash of
+a bucket is the XOR of the hashes of its entries so it does not depend on the
+order of the keys. Only the entries of buckets with a different hash are
+compared further. Large arrays are split in ranges of items; the items of a
+range are consecutive in the buffer, so ranges are compared by their bytes.
+Small values are decoded and compared with diff() from diff.py.
+'''
+import asyncio
+import os
+import sys
+import msgpack
+from .diff import ADDED, REMOVED, diff, fmt_change
+from .dumpfile import DumpReader
+from .manifest import read_manifest, verify
+from .thingsprompt import collection_from_scope
+
+
+MIN_SPLIT = 1 << 12  # values smaller than this (in bytes) are decoded
+BUCKET_ITEMS = 64  # average number of items in a bucket
+MAX_BUCKETS = 1 << 16
+
+MAP, ARRAY = 'map', 'array'
+
+
+class _Reader:
+
+    def __init__(self, view, pos: int):
+        self.view = view
+        self.pos = pos
+
+    def read(self, n: int = -1) -> bytes:
+        end = len(self.view) if n < 0 else self.pos + n
+        data = bytes(self.view[self.pos:end])
+        self.pos += len(data)
+        return data
+
+
+class _Side:
+    """A MessagePack value in a buffer; walks items by offset."""
+
+    def __init__(self, view):
+        self.view = memoryview(view)
+
+    def kind(self, start: int):
+        b = self.view[start]
+        if 0x80 <= b <= 0x8f or b in (0xde, 0xdf):
+            return MAP
+        if 0x90 <= b <= 0x9f or b in (0xdc, 0xdd):
+            return ARRAY
+        return None
+
+    def unpacker(self, start: int):
+        up = msgpack.Unpacker(
+            _Reader(self.view, start),
+            raw=False,
+            strict_map_key=False,
+            unicode_errors='replace',
+            max_buffer_size=0)  # only limited by the size of an item
+        return up, start
+
+    def header(self, start: int):
+        up, offset = self.unpacker(start)
+        if self.kind(start) == MAP:
+            n = up.read_map_header()
+        else:
+            n = up.read_array_header()
+        return up, offset, n
+
+    def entries(self, start: int):
+        """Yield (key start, key end, value end) for each entry of a map."""
+        up, offset, n = self.header(start)
+        for _ in range(n):
+            kstart = offset + up.tell()
+            up.skip()
+            vstart = offset + up.tell()
+            up.skip()
+            yield kstart, vstart, offset + up.tell()
+
+    def items(self, start: int):
+        """Yield (start, end) for each item of an array."""
+        up, offset, n = self.header(start)
+        for _ in range(n):
+            istart = offset + up.tell()
+            up.skip()
+            yield istart, offset + up.tell()
+
+    def decode(self, start: int, end: int):
+        return msgpack.unpackb(
+            self.view[start:end],
+            raw=False,
+            strict_map_key=False,
+            unicode_errors='replace')
+
+
+def _key(side: _Side, start: int, end: int):
+    key = side.decode(start, end)
+    return tuple(key) if isinstance(key, list) else key
+
+
+def _n_buckets(n: int) -> int:
+    return max(1, min(MAX_BUCKETS, n // BUCKET_ITEMS))
+
+
+def _map_buckets(side: _Side, start: int, nb: int) -> list:
+    # both sides are hashed in the same process, so the built-in hash of
+    # bytes (randomized per process) can be used
+    buckets = [0] * nb
+    view = side.view
+    for kstart, vstart, vend in side.entries(start):
+        buckets[hash(view[kstart:vstart].tobytes()) % nb] ^= \
+            hash(view[kstart:vend].tobytes())
+    return buckets
+
+
+def _map_values(side: _Side, start: int, nb: int, changed: set) -> dict:
+    values = {}
+    view = side.view
+    for kstart, vstart, vend in side.entries(start):
+        if hash(view[kstart:vstart].tobytes()) % nb in changed:
+            values[_key(side, kstart, vstart)] = vstart, vend
+    return values
+
+
+def _diff_map(a: _Side, astart, b: _Side, bstart, path):
+    _, _, na = a.header(astart)
+    _, _, nb_ = b.header(bstart)
+    nb = _n_buckets(max(na, nb_))
+    changed = {
+        idx for idx, (ha, hb) in enumerate(zip(
+            _map_buckets(a, astart, nb), _map_buckets(b, bstart, nb)))
+        if ha != hb}
+    if not changed:
+        return
+    old = _map_values(a, astart, nb, changed)
+    new = _map_values(b, bstart, nb, changed)
+    for key, (vstart, vend) in new.items():
+        if key not in old:
+            yield path + (key,), ADDED, None, b.decode(vstart, vend)
+        else:
+            yield from _diff(a, *old[key], b, vstart, vend, path + (key,))
+    for key, (vstart, vend) in old.items():
+        if key not in new:
+            yield path + (key,), REMOVED, a.decode(vstart, vend), None
+
+
+def _array_ranges(side: _Side, start: int, size: int) -> list:
+    """Return the (start, end) of the bytes of each range of `size` items."""
+    ranges = []
+    for idx, (istart, iend) in enumerate(side.items(start)):
+        if idx % size == 0:
+            ranges.append([istart, iend])
+        else:
+            ranges[-1][1] = iend
+    return ranges
+
+
+def _diff_array(a: _Side, astart, b: _Side, bstart, path):
+    _, _, na = a.header(astart)
+    _, _, nb_ = b.header(bstart)
+    size = max(1, max(na, nb_) // _n_buckets(max(na, nb_)))
+    ra = _array_ranges(a, astart, size)
+    rb = _array_ranges(b, bstart, size)
+    changed = {
+        idx for idx in range(max(len(ra), len(rb)))
+        if idx >= len(ra) or idx >= len(rb) or
+        a.view[slice(*ra[idx])] != b.view[slice(*rb[idx])]}
+    if not changed:
+        return
+    old = [
+        item for idx, item in enumerate(a.items(astart))
+        if idx // size in changed]
+    new = [
+        item for idx, item in enumerate(b.items(bstart))
+        if idx // size in changed]
+    # the items of the changed buckets, with the index of the first item
+    indexes = sorted(
+        idx for idx in range(max(na, nb_)) if idx // size in changed)
+    for pos, idx in enumerate(indexes):
+        if idx >= nb_:
+            yield path + (idx,), REMOVED, a.decode(*old[pos]), None
+        elif idx >= na:
+            yield path + (idx,), ADDED, None, b.decode(*new[pos])
+        else:
+            yield from _diff(a, *old[pos], b, *new[pos], path + (idx,))
+
+
+def _diff(a: _Side, astart, aend, b: _Side, bstart, bend, path=()):
+    if a.view[astart:aend] == b.view[bstart:bend]:
+        return
+    kind = a.kind(astart)
+    if kind is not None and kind == b.kind(bstart) and \
+            max(aend - astart, bend - bstart) >= MIN_SPLIT:
+        if kind == MAP:
+            yield from _diff_map(a, astart, b, bstart, path)
+        else:
+            yield from _diff_array(a, astart, b, bstart, path)
+        return
+    yield from diff(a.decode(astart, aend), b.decode(bstart, bend), path)
+
+
+def tree_diff(old, new):
+    """Yield (path, kind, old, new) for each difference between two buffers
+    with a MessagePack value, like diff() from diff.py."""
+    a, b = _Side(old), _Side(new)
+    yield from _diff(a, 0, len(a.view), b, 0, len(b.view))
+
+
+def is_scope(source: str) -> bool:
+    # not `/`, which is more likely the path of a missing file
+    return not os.path.exists(source) and source.startswith(('@', '//'))
+
+
+async def _export(client, source: str):
+    collection = collection_from_scope(source)
+    if collection is None:
+        raise ValueError(f'`{source}` is not a file or a collection scope')
+    return await client.query("""//ti
+        export({dump:,});
+    """, dump=True, scope=f'//{collection}', retry=True)
+
+
+class _Source:
+    """Open a dump file, or export a live collection."""
+
+    def __init__(self, client, source: str):
+        self.client = client
+        self.source = source
+        self.reader = None
+
+    async def __aenter__(self):
+        if is_scope(self.source):
+            return await _export(self.client, self.source)
+        self.reader = reader = DumpReader(self.source).__enter__()
+        try:
+            loop = asyncio.get_running_loop()
+            manifest = read_manifest(self.source)
+            if manifest is not None:
+                await loop.run_in_executor(
+                    None, verify, self.source, reader.view, manifest)
+            if reader.compression:
+                await loop.run_in_executor(None, reader.decompress)
+            if not reader.is_msgpack():
+                raise ValueError(
+                    f'`{self.source}` is not a MessagePack export')
+        except Exception:
+            reader.__exit__(None, None, None)
+            raise
+        return reader.view
+
+    async def __aexit__(self, *exc):
+        if self.reader is not None:
+            self.reader.__exit__(*exc)
+
+
+def _print_changes(old, new, max_changes: int) -> int:
+    changes = 0
+    for change in tree_diff(old, new):
+        changes += 1
+        if not max_changes or changes <= max_changes:
+            print(fmt_change(*change))
+    if max_changes and changes > max_changes:
+        print(f'... and {changes - max_changes} more')
+    return changes
+
+
+async def do_diff(client, left: str, right: str, max_changes: int) -> int:
+    """Print the differences between two exports; returns the number of
+    differences."""
+    error = None
+    try:
+        async with _Source(client, left) as old, \
+                _Source(client, right) as new:
+            try:
+                changes = _print_changes(old, new, max_changes)
+            except Exception as e:
+                # handled here; the traceback refers to the buffers which
+                # must be released before the files are closed
+                error = f'{e.__class__.__name__}: {e}'
+    except Exception as e:
+        error = f'{e.__class__.__name__}: {e}'
+    if error is not None:
+        print(error, file=sys.stderr)
+        return 1
+    print(f'{changes} difference(s)', file=sys.stderr)
+    return changes
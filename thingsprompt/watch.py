@@ -0,0 +1,146 @@
+'''Watch a query which runs on an interval and show what has changed.'''
+import asyncio
+import time
+from prompt_toolkit.application import Application
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.layout import HSplit, Layout, Window
+from prompt_toolkit.layout.controls import FormattedTextControl
+from .diff import REMOVED, diff, fmt_change
+from .jobs import shielded_query
+from .pager import LineModel, PagerControl, add_navigation
+from .timing import fmt_ms
+
+
+MIN_INTERVAL = 0.1
+MAX_CHANGES = 8  # number of changes listed below the result
+MAX_MARKED = 10000  # maximum number of changed paths to highlight
+
+
+class WatchState:
+
+    def __init__(self):
+        self.runs = 0
+        self.duration = 0.0
+        self.error = None
+        self.paused = False
+        self.changes = []  # changes of the last run with changes
+        self.marked = set()
+        self.changed_at = None
+        self.total = 0  # number of changes in the last run with changes
+
+
+async def watch(
+        client,
+        query: str,
+        scope: str,
+        interval: float,
+        timeout=None,
+        sort_keys: bool = True):
+    """Run `query` every `interval` seconds until the user quits.
+
+    Only the differences with the previous result are computed; lines of
+    changed and added values are highlighted and the changes are listed below
+    the result. The screen is only redrawn where it changed.
+    """
+    interval = max(interval, MIN_INTERVAL)
+    state = WatchState()
+    model = LineModel(None, sort_keys)
+
+    def highlight(line):
+        keys = line.keys
+        if any(keys[:n] in state.marked for n in range(len(keys), -1, -1)):
+            return 'bold ansiyellow'
+        return ''
+
+    control = PagerControl(model, highlight)
+    kb = KeyBindings()
+
+    @kb.add('q')
+    @kb.add('c-c')
+    def _(event):
+        event.app.exit()
+
+    @kb.add('p')
+    def _(event):
+        state.paused = not state.paused
+
+    add_navigation(kb, control)
+
+    def header():
+        code = ' '.join(query.split())
+        if scope:
+            code = f'{scope} {code}'
+        return [('reverse', f' every {interval:g}s: {code}')]
+
+    def changes():
+        lines = [fmt_change(*change) for change in state.changes]
+        if state.total > len(lines):
+            lines.append(f'... and {state.total - len(lines)} more')
+        return '\n'.join(lines)
+
+    def status():
+        if state.error:
+            return [('reverse ansired', f' {state.error} ')]
+        parts = [f'run {state.runs}', fmt_ms(state.duration)]
+        if state.changed_at is not None:
+            ago = time.monotonic() - state.changed_at
+            parts.append(f'{state.total} changes {ago:.0f}s ago')
+        if state.paused:
+            parts.append('paused')
+        return [('reverse', (
+            f' {", ".join(parts)} | j/k: move, enter: fold/unfold, '
+            f'p: pause, q: quit '))]
+
+    def update(res):
+        if state.runs:
+            total = 0
+            found = []
+            marked = set()
+            for change in diff(model.res, res):
+                total += 1
+                if total <= MAX_CHANGES:
+                    found.append(change)
+                if change[1] != REMOVED and len(marked) < MAX_MARKED:
+                    marked.add(change[0])
+            if total:
+                state.total = total
+                state.changes = found
+                state.marked = marked
+                state.changed_at = time.monotonic()
+        state.runs += 1
+        model.res = res
+        model.reset()
+
+    async def run(app):
+        while True:
+            start = time.perf_counter()
+            if not state.paused:
+                try:
+                    res = await shielded_query(
+                        client, query, scope=scope, timeout=timeout)
+                except Exception as e:
+                    state.error = f'{e.__class__.__name__}: {e}'
+                else:
+                    state.error = None
+                    state.duration = time.perf_counter() - start
+                    update(res)
+            app.invalidate()
+            await asyncio.sleep(
+                max(0.0, interval - (time.perf_counter() - start)))
+
+    layout = Layout(HSplit([
+        Window(FormattedTextControl(header), height=1),
+        Window(control),
+        Window(
+            FormattedTextControl(changes),
+            height=lambda: min(state.total, MAX_CHANGES + 1),
+            style='ansiyellow'),
+        Window(FormattedTextControl(status), height=1),
+    ]), focused_element=control)
+
+    app = Application(layout=layout, key_bindings=kb, full_screen=True)
+    task = asyncio.ensure_future(run(app))
+    try:
+        await app.run_async()
+    finally:
+        task.cancel()